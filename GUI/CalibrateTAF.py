@@ -25,8 +25,14 @@ def click_OK_calibration(self):
         surfaceFind={}
         if UsingRate2findSurface:
             surfaceFind={"abs(dp/dh)":Rate2findSurface,"median filter":5}
-        #Reading Inputs 
-        self.i_tabTAF = indentation.Indentation(fileName=fileName, nuMat= Poisson, verbose=0, unloadPMax=unloaPMax, unloadPMin=unloaPMin, zeroGradDelta=zeroGradDelta, min_size_fluctuation=min_size_fluctuation,progressBar_calibration=self.ui.progressBar_calibration,UsingRate2findSurface=UsingRate2findSurface,surfaceFind=surfaceFind)
+        #Reading Inputs: analyse file only if it or the analysis parameters changed
+        sessionKey = (fileName, unloaPMax, unloaPMin, zeroGradDelta, min_size_fluctuation, str(surfaceFind))
+        if getattr(self, 'calibrationSession_tabTAF', None) is None or self.calibrationSessionKey_tabTAF != sessionKey:
+            self.i_tabTAF = indentation.Indentation(fileName=fileName, nuMat= Poisson, verbose=0, unloadPMax=unloaPMax, unloadPMin=unloaPMin, zeroGradDelta=zeroGradDelta, min_size_fluctuation=min_size_fluctuation,progressBar_calibration=self.ui.progressBar_calibration,UsingRate2findSurface=UsingRate2findSurface,surfaceFind=surfaceFind)
+            self.calibrationSession_tabTAF = indentation.CalibrationSession(self.i_tabTAF)
+            self.calibrationSessionKey_tabTAF = sessionKey
+            self.i_tabTAF.restartFile()
+        self.i_tabTAF.nuMat      = Poisson
         self.i_tabTAF.nuTip      = Poisson_Tip
         self.i_tabTAF.modulusTip = E_Tip
         Method=self.i_tabTAF.method.value
@@ -44,7 +50,8 @@ def click_OK_calibration(self):
 
         #calculate frameStiffness and Tip Area Function
         self.static_ax_tabFrameStiffness.cla()
-        hc, Ac = self.i_tabTAF.calibration(critDepthStiffness=self.ui.doubleSpinBox_critDepthStiffness_tabCalibration.value(), critForce=self.ui.doubleSpinBox_critForceStiffness_tabCalibration.value(),plotStiffness=self.static_ax_tabFrameStiffness,numPolynomial=number_of_TAFterms,returnArea=True, eTarget=E_target)
+        hc, Ac = self.calibrationSession_tabTAF.calibration(critDepthStiffness=self.ui.doubleSpinBox_critDepthStiffness_tabCalibration.value(), critForce=self.ui.doubleSpinBox_critForceStiffness_tabCalibration.value(),plotStiffness=self.static_ax_tabFrameStiffness,numPolynomial=number_of_TAFterms, eTarget=E_target)
+        self.ui.progressBar_calibration.setValue(100)
         self.static_canvas_tabFrameStiffness.draw()
 
         #listing Test
@@ -0,0 +1,5 @@
+"""Benchmarks of time and memory, in the format of airspeed velocity (asv)
+
+- asv: results of each commit are saved in .asv/results, see asv.conf.json; e.g. asv run, asv compare
+- without asv: python benchmarks/runBenchmarks.py saves the results of the current commit in benchmarks/results
+"""
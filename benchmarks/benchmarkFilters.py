@@ -0,0 +1,44 @@
+"""Benchmark of running median backends on long force traces |br|
+run: python benchmarks/benchmarkFilters.py; or with airspeed velocity (asv)"""
+import time
+import numpy as np
+from micromechanics.indentation.filters import medianFilter, BACKENDS
+
+class MedianFilter:
+  """
+  Running median of 10^6 samples for different window sizes and backends
+  """
+  params = ([3, 5, 11, 21, 51, 101], BACKENDS)
+  param_names = ['size', 'backend']
+
+  def setup(self, size, backend):  #pylint: disable=unused-argument
+    """
+    Synthetic force signal: ramp with noise
+    """
+    rng = np.random.default_rng(0)
+    self.force = np.linspace(0, 100, 10**6) + rng.normal(0, 0.1, 10**6)
+    return
+
+  def time_medianFilter(self, size, backend):
+    """
+    Time one filter
+    """
+    medianFilter(self.force, size, backend)
+    return
+
+
+if __name__ == '__main__':
+  #minimum of 5 runs; speedup compared to scipy.signal.medfilt
+  benchmark = MedianFilter()
+  print(f"{'size':>6}"+''.join(f'{i:>12}' for i in BACKENDS)+'   speedup '+' '.join(BACKENDS[:-1]))
+  for sizeI in MedianFilter.params[0]:
+    times = []
+    for backendI in BACKENDS:
+      benchmark.setup(sizeI, backendI)
+      runs = []
+      for _ in range(5):
+        start = time.perf_counter()
+        benchmark.time_medianFilter(sizeI, backendI)
+        runs.append(time.perf_counter()-start)
+      times.append(min(runs))
+    print(f'{sizeI:>6}'+''.join(f'{i:>11.4f}s' for i in times)+''.join(f'{times[-1]/i:>8.1f}' for i in times[:-1]))
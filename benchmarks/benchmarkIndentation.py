@@ -0,0 +1,258 @@
+"""Benchmarks of reading, identifying, analysing and calibrating: example files and synthetic scaled-up inputs |br|
+run: python benchmarks/runBenchmarks.py; or with airspeed velocity (asv)"""
+import io, contextlib, tempfile
+from pathlib import Path
+import numpy as np
+from micromechanics.indentation import Indentation, AnalysisCache, Synthetic
+from micromechanics.indentation.definitions import Method
+
+EXAMPLES = Path(__file__).resolve().parent.parent/'examples'
+FILES = ['Agilent/FS_XP.xls', 'Agilent/NiAl_250nm_TUIL_max_depth_1000nm_GM3_SM_previousGM1.xls',
+         'Hysitron/Exp-50mN_0000.hld', 'Hysitron/RobinSteel0000LC.txt', 'FischerScope/FS1.txt',
+         'FischerScope/N1_1.hdf5', 'Micromaterials/multipleIndentations.zip', 'Micromaterials/Sample1_Vac_RT.hdf5']
+ZIP = EXAMPLES/'Micromaterials'/'multipleIndentations.zip'
+TESTS = [10, 100, 1000]                      #number of tests of scaled-up files
+POINTS = [10**3, 10**4, 10**5, 10**6]       #number of points of scaled-up tests
+
+
+def quiet():
+  """
+  Suppress the output of the indentation class
+
+  Returns:
+    contextmanager: stdout is discarded
+  """
+  return contextlib.redirect_stdout(io.StringIO())
+
+
+def synthetic(points=1000):
+  """
+  Generator of synthetic MULTI tests of fused silica, deeper than critDepthStiffness of calibration; the noise
+  decreases with the number of points such that the noise of the force rate is the same for all sizes
+
+  Args:
+    points (int): number of points of each test
+
+  Returns:
+    Synthetic: generator
+  """
+  noise = 1.e-4*1000/points
+  return Synthetic(Method.MULTI, pMax=200., points=points, noiseForce=noise, noiseDepth=noise)
+
+
+class OpenFile:
+  """
+  Open the example files of all vendors and read the first test
+  """
+  params = FILES
+  param_names = ['file']
+
+  def setup(self, fileName):
+    """
+    Skip files that are not available
+    """
+    if not (EXAMPLES/fileName).exists():
+      raise NotImplementedError(fileName)
+    return
+
+  def time_open(self, fileName):
+    """
+    Time opening
+    """
+    with quiet():
+      Indentation(str(EXAMPLES/fileName), analysisCache=False)
+    return
+
+  def peakmem_open(self, fileName):
+    """
+    Memory of opening
+    """
+    with quiet():
+      Indentation(str(EXAMPLES/fileName), analysisCache=False)
+    return
+
+
+class AnalyseTest:
+  """
+  Identify load-hold-unload and analyse one test with many points; filtered signals are not reused
+  """
+  params = POINTS
+  param_names = ['points']
+
+  def setup(self, points):
+    """
+    Synthetic MULTI test with this number of points, see synthetic; indentation object of the Micromaterials example
+    without caches, which is used for this test
+    """
+    self.data = synthetic(points).test(1)
+    with quiet():
+      self.indentation = Indentation(str(ZIP), nuMat=0.18, analysisCache=False)
+    self.indentation.signalCache = AnalysisCache(maxBytes=0)
+    return
+
+  def time_identifyLoadHoldUnload(self, points):  #pylint: disable=unused-argument
+    """
+    Time identification
+    """
+    with quiet():
+      self.indentation.setTestData(self.data, identify=False)
+      self.indentation.identifyLoadHoldUnload()
+    return
+
+  def time_analyse(self, points):  #pylint: disable=unused-argument
+    """
+    Time identification and analysis
+    """
+    with quiet():
+      self.indentation.setTestData(self.data)
+      self.indentation.analyse()
+    return
+
+  def peakmem_analyse(self, points):  #pylint: disable=unused-argument
+    """
+    Memory of identification and analysis
+    """
+    with quiet():
+      self.indentation.setTestData(self.data)
+      self.indentation.analyse()
+    return
+
+
+class AnalyseFile:
+  """
+  Read and analyse all tests of files with many tests
+  """
+  params = TESTS
+  param_names = ['tests']
+  timeout = 600
+
+  def setup_cache(self):
+    """
+    Write synthetic HDF5 files of all sizes once into the working directory: asv and runBenchmarks run setup_cache in a
+    temporary directory, which they remove after the benchmarks of the class
+
+    Returns:
+      dict: file name of each number of tests
+    """
+    directory = Path('benchmarkIndentation').resolve()
+    directory.mkdir(exist_ok=True)
+    fileNames = {}
+    for tests in TESTS:
+      fileNames[tests] = str(directory/f'tests{tests}.hdf5')
+      synthetic().writeHDF5(fileNames[tests], tests)
+    return fileNames
+
+  def time_analyseFile(self, fileNames, tests):
+    """
+    Time reading and analysis of all tests
+    """
+    with quiet():
+      indentation = Indentation(fileNames[tests], nuMat=0.18, analysisCache=False)
+      for _ in indentation:
+        indentation.analyse()
+    return
+
+  def peakmem_analyseFile(self, fileNames, tests):
+    """
+    Memory of reading and analysis of all tests
+    """
+    with quiet():
+      indentation = Indentation(fileNames[tests], nuMat=0.18, analysisCache=False)
+      for _ in indentation:
+        indentation.analyse()
+    return
+
+  def time_stiffnessFromUnloadingAll(self, fileNames, tests):
+    """
+    Time fitting the unloading segments of all tests in one call
+    """
+    with quiet():
+      indentation = Indentation(fileNames[tests], nuMat=0.18, analysisCache=False)
+      data = [indentation.getTestData() for _ in indentation]
+      indentation.stiffnessFromUnloadingAll(data)
+    return
+
+
+class Calibration:
+  """
+  Calibration of frame stiffness and area function of fused silica: example file and files with many tests
+  """
+  params = ['FS_Calibration.xls']+TESTS
+  param_names = ['file']
+  number = 1     #calibration changes the tip: setup opens the file again for each run
+  timeout = 600
+
+  def setup_cache(self):
+    """
+    Write synthetic HDF5 files of all sizes once
+
+    Returns:
+      dict: file name of each number of tests
+    """
+    return AnalyseFile.setup_cache(self)
+
+  def setup(self, fileNames, fileName):
+    """
+    Open file
+    """
+    fileName = fileNames.get(fileName, str(EXAMPLES/'Agilent'/str(fileName)))
+    with quiet():
+      self.indentation = Indentation(fileName, nuMat=0.18, analysisCache=False)
+    return
+
+  def time_calibrateStiffness(self, fileNames, fileName):  #pylint: disable=unused-argument
+    """
+    Time calibration of frame stiffness
+    """
+    with quiet():
+      self.indentation.calibrateStiffness(plotStiffness=False)
+    return
+
+  def time_calibration(self, fileNames, fileName):  #pylint: disable=unused-argument
+    """
+    Time calibration of frame stiffness and area function
+    """
+    with quiet():
+      self.indentation.calibration()
+    return
+
+
+class TifFilters:
+  """
+  Filters of SEM images of different size
+  """
+  params = ([512, 2048, 4096], ['medianFilter', 'gaussFilter', 'enhance'])
+  param_names = ['pixels', 'filter']
+
+  def setup(self, pixels, name):  #pylint: disable=unused-argument
+    """
+    Random image with gradient
+    """
+    try:
+      from PIL import Image                #pylint: disable=import-outside-toplevel
+      from micromechanics.tif import Tif   #pylint: disable=import-outside-toplevel
+    except ImportError as error:
+      raise NotImplementedError('Tif requires pillow, scikit-image and opencv') from error
+    rng = np.random.default_rng(0)
+    image = np.linspace(0, 200, pixels)[None,:] + rng.normal(0, 20, (pixels, pixels))
+    self.fileName = Path(tempfile.mkdtemp(prefix='benchmarkTif'))/'image.tif'
+    Image.fromarray(np.clip(image, 0, 255).astype(np.uint8)).save(self.fileName)
+    self.tif = Tif(str(self.fileName), fileType='NoQuestion')
+    self.tif.image = self.tif.image.convert('P')
+    return
+
+  def teardown(self, pixels, name):  #pylint: disable=unused-argument
+    """
+    Remove image file
+    """
+    self.fileName.unlink()
+    self.fileName.parent.rmdir()
+    return
+
+  def time_filter(self, pixels, name):  #pylint: disable=unused-argument
+    """
+    Time one filter
+    """
+    with quiet():
+      getattr(self.tif, name)()
+    return
@@ -0,0 +1,156 @@
+"""Run all benchmarks without airspeed velocity and save the results of the current commit |br|
+run: python benchmarks/runBenchmarks.py [--filter analyse] [--compare benchmarks/results/<commit>.json]
+
+- time_*: minimum wall time of some runs [s]
+- peakmem_*: peak of memory allocated during one run [bytes], measured with tracemalloc
+- results are saved in benchmarks/results/<commit>.json
+- the benchmarks of each class run in a temporary working directory, as with asv
+"""
+import argparse, importlib, inspect, itertools, json, os, platform, re, subprocess, sys, tempfile, time, tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+import numpy as np
+
+DIRECTORY = Path(__file__).resolve().parent
+
+
+def commitName():
+  """
+  Name of current commit: short hash, '-dirty' if the working tree is changed
+
+  Returns:
+    str: name; 'unknown' if git is not available
+  """
+  try:
+    commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=DIRECTORY, capture_output=True, text=True,
+                            check=True).stdout.strip()
+    changed = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=DIRECTORY,
+                             capture_output=True, text=True, check=True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return 'unknown'
+  return commit+('-dirty' if changed else '')
+
+
+def benchmarkClasses():
+  """
+  All classes of benchmark modules in this directory; the package of this working tree is benchmarked
+
+  Returns:
+    list: module name and class
+  """
+  sys.path[:0] = [str(DIRECTORY.parent), str(DIRECTORY)]
+  classes = []
+  for fileName in sorted(DIRECTORY.glob('benchmark*.py')):
+    module = importlib.import_module(fileName.stem)
+    for _, benchmark in inspect.getmembers(module, inspect.isclass):
+      if benchmark.__module__==module.__name__:
+        classes.append((fileName.stem, benchmark))
+  return classes
+
+
+@contextmanager
+def workingDirectory():
+  """
+  Temporary working directory of the benchmarks of one class: files written by setup_cache are removed afterwards
+
+  Yields:
+    str: temporary directory
+  """
+  cwd = os.getcwd()
+  with tempfile.TemporaryDirectory(prefix='benchmark') as directory:
+    os.chdir(directory)
+    try:
+      yield directory
+    finally:
+      os.chdir(cwd)
+
+
+def runBenchmark(benchmark, method, cache, params, repeat):
+  """
+  Run one benchmark method with one combination of parameters
+
+  Args:
+    benchmark (object): instance of benchmark class
+    method (str): name of method: time_* or peakmem_*
+    cache (object): result of setup_cache; None if class has none
+    params (tuple): parameters
+    repeat (int): number of runs of time_* methods
+
+  Returns:
+    float: time [s] or memory [bytes]; None if benchmark is skipped
+  """
+  arguments = params if cache is None else (cache,)+params
+  runs = []
+  for _ in range(repeat if method.startswith('time_') else 1):
+    if hasattr(benchmark, 'setup'):
+      try:
+        benchmark.setup(*arguments)
+      except NotImplementedError:
+        return None
+    if method.startswith('peakmem_'):
+      tracemalloc.start()
+      getattr(benchmark, method)(*arguments)
+      runs.append(tracemalloc.get_traced_memory()[1])
+      tracemalloc.stop()
+    else:
+      start = time.perf_counter()
+      getattr(benchmark, method)(*arguments)
+      runs.append(time.perf_counter()-start)
+    if hasattr(benchmark, 'teardown'):
+      benchmark.teardown(*arguments)
+  return float(min(runs))
+
+
+def main():
+  """
+  Run benchmarks, save and compare results
+  """
+  parser = argparse.ArgumentParser(description='Benchmarks of micromechanics')
+  parser.add_argument('--filter', default='', help='regular expression of benchmark names, e.g. AnalyseFile')
+  parser.add_argument('--repeat', type=int, default=3, help='number of runs of time benchmarks')
+  parser.add_argument('--output', default=str(DIRECTORY/'results'), help='directory of results')
+  parser.add_argument('--compare', help='results of another commit: print ratio of new to old values')
+  arguments = parser.parse_args()
+  output = Path(arguments.output).resolve()
+  results = {}
+  for moduleName, benchmarkClass in benchmarkClasses():
+    methods = [i for i in dir(benchmarkClass) if i.startswith(('time_', 'peakmem_'))]
+    params = getattr(benchmarkClass, 'params', [])
+    if params and not isinstance(params[0], (list, tuple)):
+      params = [params]         #one parameter, same as asv
+    paramsList = list(itertools.product(*params))
+    names = [f'{moduleName}.{benchmarkClass.__name__}.{i}' for i in methods]
+    if not any(re.search(arguments.filter, i) for i in names):
+      continue
+    benchmark = benchmarkClass()
+    with workingDirectory():
+      cache = benchmark.setup_cache() if hasattr(benchmark, 'setup_cache') else None
+      for method, name in zip(methods, names):
+        if not re.search(arguments.filter, name):
+          continue
+        for paramsI in paramsList:
+          key = f"{name}({', '.join(str(i) for i in paramsI)})"
+          results[key] = runBenchmark(benchmark, method, cache, paramsI, arguments.repeat)
+          value = 'skipped' if results[key] is None else \
+                  (f'{results[key]:.4f}s' if method.startswith('time_') else f'{results[key]/1024**2:.1f}MiB')
+          print(f'{key:<90} {value:>12}', flush=True)
+  commit = commitName()
+  output.mkdir(parents=True, exist_ok=True)
+  with open(output/f'{commit}.json', 'w', encoding='utf-8') as fOut:
+    json.dump({'commit':commit, 'date':datetime.now().isoformat(timespec='seconds'),
+               'machine':platform.node(), 'python':platform.python_version(), 'numpy':np.__version__,
+               'results':results}, fOut, indent=2)
+  print('Results saved in', output/f'{commit}.json')
+  if arguments.compare:
+    with open(arguments.compare, encoding='utf-8') as fIn:
+      old = json.load(fIn)
+    print(f"\nRatio of {commit} to {old['commit']}: >1 is slower / more memory")
+    for key, value in results.items():
+      if value and old['results'].get(key):
+        print(f"{key:<90} {value/old['results'][key]:>8.2f}")
+  return
+
+
+if __name__ == '__main__':
+  main()
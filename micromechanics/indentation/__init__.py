@@ -24,23 +24,36 @@ from pathlib import Path
 import numpy as np
 from .definitions import Method, Vendor, FileType
 from .tip import Tip
+from .testData import TestData
+from .accumulator import Accumulator
+from .calibration import CalibrationSession
+from .export import loadResults
+from .cache import AnalysisCache
+from .instrumentation import Instrumentation, countEvent
+from .synthetic import Synthetic
 
 class Indentation:
   """
   Main class of indentation
   """
   #pylint: disable=import-outside-toplevel
-  from .input import loadAgilent, nextAgilentTest, loadHysitron, loadMicromaterials, nextMicromaterialsTest, \
-    loadFischerScope, nextFischerScopeTest, loadHDF5, nextHDF5Test, restartFile
+  from .input import loadAgilent, nextAgilentTest, readAgilentTest, loadHysitron, loadMicromaterials, \
+    nextMicromaterialsTest, readMicromaterialsTest, stopPrefetch, readAllMicromaterialsTests, loadFischerScope, nextFischerScopeTest, readFischerScopeTest, \
+    loadHDF5, nextHDF5Test, readHDF5Test, restartFile, readTest, loadTest, close
   from .main import calcYoungsModulus, calcHardness, calcStiffness2Force, analyse, \
-    identifyLoadHoldUnload, identifyLoadHoldUnloadCSM, nextTest, saveToUserMeta, correctThermalDrift
-  from .theory import YoungsModulus, ReducedModulus, OliverPharrMethod, inverseOliverPharrMethod,\
-    stiffnessFromUnloading, unloadingPowerFunc
+    identifyLoadHoldUnload, filteredRate, derivedSignal, identifyLoadHoldUnloadCSM, nextTest, findSurface, setTestData, \
+    getTestData, saveToUserMeta, correctThermalDrift
+  from .theory import YoungsModulus, ReducedModulus, OliverPharrMethod, OliverPharrMethodBatch, inverseOliverPharrMethod,\
+    stiffnessFromUnloading, stiffnessFromUnloadingAll, unloadingMasks, unloadingStiffness, unloadingPowerFunc
   from .hertz import popIn, hertzFit
   from .plot import plotTestingMethod, plot, plotAsDepth, plotAll
-  from .calibration import calibration, calibrateStiffness
+  from .calibration import calibration, calibrateStiffness, calibrateArea, collectCalibrationData
   from .verification import verifyOneData, verifyOneData1, verifyReadCalc
   from .seldomUsedFunctions import tareDepthForce, analyseDrift
+  from .batch import analyseAll, recalculateAll
+  from .cache import cacheFileName, loadCache, saveCache, cacheTest, completeCache, analysisHash, useAnalysisCache, loadAnalysis, \
+    saveAnalysis
+  from .export import resultsTable, exportResults, writableDatafile, readAnalysisHDF5, writeAnalysisHDF5
 
   def __init__(self, fileName=None, nuMat= 0.3, tip=None, surfaceFind=None, nonMetal=1., driftRate=0, **kwargs):
     """
@@ -56,6 +69,18 @@ class Indentation:
        kwargs (dict): additional keywords
         verbose (int) the higher, the more information printed: 2=default, 1=minimal, 0=print nothing
         plot (bool) plot intermediate steps; helpful for debugging
+        cache (bool, str) keep decoded vendor files in cache directory: True=default directory, str=directory; a
+          file is cached once all its tests were read
+        cacheReadOnly (bool) only use complete cache files, do not write them, e.g. workers of analyseAll
+        cacheMaxBytes (int) size of all files in cache directory; least recently used ones are removed, default: 2GiB
+        cacheMaxAge (float) cache files that are not used for this number of days are removed, default: 30
+        prefetch (int) number of files of Micromaterials zip-archive that are read ahead in background threads
+        writeBack (bool) write results of each analysed test into HDF5 file; unchanged tests are not analysed again
+        filterBackend (str) backend of running median: 'numpy' (default), 'ndimage', 'signal'
+        analysisCache (bool, str, AnalysisCache) keep results of analyse: True=in memory, str=also in this
+          directory, False=off (default)
+        instrument (bool, Instrumentation) time the stages of the analysis and count events, see instrumentation;
+          default: False
     """
     np.seterr(divide='ignore', invalid='ignore')
     self.nuMat = nuMat                                      #nuMat: material's Posson ratio
@@ -70,6 +95,7 @@ class Indentation:
     self.newFileRead = True                                 #file was just loaded
     self.evaluateStiffnessAtMax = True                      #evaluate stiffness at maximum or at end of power-law fit domain
     self.config = {}                                        #storage for surface index, ignored tests, thresholds for surface
+    self.surfaceIdx = None                                  #index of surface of current test; None=not found
     self.driftRate = driftRate
     self.plotAllFigs = False
     
@@ -84,6 +110,30 @@ class Indentation:
     unloadPMin = kwargs.get('unloadPMin', False)
     zeroGradDelta = kwargs.get('zeroGradDelta', False)
     self.showFindSurface = kwargs.get('showFindSurface', False)
+    self.sheetCacheSize = kwargs.get('sheetCacheSize', 4)                         #number of parsed excel sheets kept in memory
+    self.prefetch = kwargs.get('prefetch', 0)                                     #number of files of zip-archive read ahead in background
+    self.prefetchPool, self.prefetchFutures = None, {}
+    self.writeBack = kwargs.get('writeBack', False)                               #write results back into HDF5 file
+    self.signalCache = AnalysisCache(maxBytes=128*1024**2)                      #filtered signals, see derivedSignal
+    self.filterBackend = kwargs.get('filterBackend', 'numpy')                     #backend of running median, see filters.py
+    instrument = kwargs.get('instrument', False)
+    self.instrumentation = Instrumentation() if instrument is True else instrument or None  #timers and counters
+    analysisCache = kwargs.get('analysisCache', False)
+    if analysisCache is True:
+      self.analysisCache = AnalysisCache()
+    elif isinstance(analysisCache, (str, Path)):
+      self.analysisCache = AnalysisCache(directory=analysisCache)
+    else:
+      self.analysisCache = analysisCache or None
+    cache = kwargs.get('cache', False)
+    if cache is True:
+      cache = Path.home()/'.cache'/'micromechanics'
+    self.cacheDir = cache if cache else None                                      #directory of cache files; None=no cache
+    self.fileCache = None                                                         #cache file of current file
+    self.cacheWriter = None                                                       #cache file that is written
+    self.cacheReadOnly = kwargs.get('cacheReadOnly', False)                       #do not write cache files
+    self.cacheMaxBytes = kwargs.get('cacheMaxBytes', 2*1024**3)                   #size of all cache files
+    self.cacheMaxAge = kwargs.get('cacheMaxAge', 30)                              #days: unused cache files are removed
     self.success_identified_TestList=[]
     self.success_identified_PopIn=[]
     if tip is None:
@@ -99,6 +149,8 @@ class Indentation:
     self.metaUser   = {}                                    #metadata added by analysis
     # define all attributes
     self.testName, self.testList = None, None
+    self.testData = None                                    #data of current test as read from file
+    self.calibrationData = {}                               #data collected by calibration: reuse for other criteria
     self.h, self.t, self.p, self.valid       = [],[],[],[]
     self.hRaw = []
     self.slope, self.k2p, self.hc, self.Ac = [],[],[],[]
@@ -130,7 +182,7 @@ class Indentation:
           self.zeroGradDelta = zeroGradDelta
       else:
           self.zeroGradDelta = 0.02
-      success = self.loadAgilent(fileName)
+      success = self.loadCache(fileName) or self.loadAgilent(fileName)
     if (fileName.endswith(".hld") or fileName.endswith(".txt")) and not success:
       # Hysitron
       self.vendor = Vendor.Hysitron
@@ -138,7 +190,7 @@ class Indentation:
       self.unloadPMax = 0.95
       self.unloadPMin = 0.4
       self.zeroGradDelta = 0.2
-      success = self.loadHysitron(fileName)
+      success = self.loadCache(fileName) or self.loadHysitron(fileName)
     if (fileName.endswith(".txt") or
         fileName.endswith(".zip")) and not success:
       # Micromaterials
@@ -150,7 +202,7 @@ class Indentation:
         self.fileType = FileType.Single
       else:
         self.fileType = FileType.Multi
-      success = self.loadMicromaterials(fileName)
+      success = self.loadCache(fileName) or self.loadMicromaterials(fileName)
     if fileName.endswith(".txt") and not success:
       # Fischer Scope
       self.vendor = Vendor.FischerScope
@@ -158,7 +210,7 @@ class Indentation:
       self.unloadPMax = 0.95
       self.unloadPMin = 0.21
       self.zeroGradDelta = 0.01
-      success = self.loadFischerScope(fileName)
+      success = self.loadCache(fileName) or self.loadFischerScope(fileName)
     if fileName.endswith(".hdf5") and not success:
       # Common hdf5 file
       self.vendor = Vendor.CommonHDF5
@@ -167,6 +219,10 @@ class Indentation:
       self.unloadPMin = 0.5
       self.zeroGradDelta = 0.02
       success = self.loadHDF5(fileName)
+    if success and self.cacheDir is not None and self.fileCache is None and not self.cacheReadOnly:
+      self.saveCache()
+    if not success and fileName!='':
+      countEvent(self, 'loading failed')
     return
 
 
@@ -0,0 +1,100 @@
+"""Collect data of many tests: growable columns without copying everything for each test"""
+import json
+import numpy as np
+
+class Accumulator:
+  """
+  Columnar buffer that grows by doubling its capacity
+
+  - append is amortized O(length of appended data) instead of O(total length) for np.hstack
+  - columns are returned as views of the filled part
+  - info: dictionary of additional information, e.g. compliance used during analysis
+  """
+  def __init__(self, columns, capacity=1024, **info):
+    """
+    Initialize empty buffer
+
+    Args:
+      columns (list): names of columns
+      capacity (int): initial number of rows
+      info (dict): additional information
+    """
+    self.columns = list(columns)
+    self.length  = 0
+    self.buffers = {key:np.empty(max(capacity,1), dtype=np.float64) for key in self.columns}
+    self.info    = info
+    return
+
+
+  def __len__(self):
+    return self.length
+
+
+  def __getitem__(self, key):
+    return self.buffers[key][:self.length]
+
+
+  def __repr__(self):
+    """ Print accumulator information
+    Returns:
+      str: text representation
+    """
+    return f'Accumulator: {self.length} rows of '+', '.join(self.columns)
+
+
+  def append(self, **values):
+    """
+    Append rows: arrays of equal length or scalars
+
+    Args:
+      values (dict): values of each column
+    """
+    values = {key:np.atleast_1d(np.asarray(value, dtype=np.float64)) for key, value in values.items()}
+    if sorted(values)!=sorted(self.columns):
+      print("**ERROR Accumulator: append needs all columns",self.columns)
+      return
+    number = len(values[self.columns[0]])
+    if any(len(i)!=number for i in values.values()):
+      print("**ERROR Accumulator: columns of different length")
+      return
+    if self.length+number > len(self.buffers[self.columns[0]]):
+      capacity = len(self.buffers[self.columns[0]])
+      while capacity < self.length+number:
+        capacity *= 2
+      for key in self.columns:
+        buffer = np.empty(capacity, dtype=np.float64)
+        buffer[:self.length] = self.buffers[key][:self.length]
+        self.buffers[key] = buffer
+    for key in self.columns:
+      self.buffers[key][self.length:self.length+number] = values[key]
+    self.length += number
+    return
+
+
+  def save(self, fileName):
+    """
+    Save to numpy file
+
+    Args:
+      fileName (str): file name ending with .npz
+    """
+    np.savez(fileName, **{key:self[key] for key in self.columns}, info=json.dumps(self.info))
+    return
+
+
+  @classmethod
+  def load(cls, fileName):
+    """
+    Load from numpy file
+
+    Args:
+      fileName (str): file name ending with .npz
+
+    Returns:
+      Accumulator: data in the file
+    """
+    with np.load(fileName) as data:
+      columns = [i for i in data.files if i!='info']
+      result = cls(columns, capacity=len(data[columns[0]]), **json.loads(str(data['info'])))
+      result.append(**{key:data[key] for key in columns})
+    return result
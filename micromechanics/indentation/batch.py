@@ -0,0 +1,153 @@
+"""Analyse all tests of a file in parallel"""
+import os, traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+
+#attributes that define the analysis: they are copied into each worker
+SETTINGS = ['nuMat', 'nuTip', 'modulusTip', 'beta', 'nonMetal', 'verbose', 'method', 'onlyLoadingSegment',
+            'evaluateStiffnessAtMax', 'config', 'driftRate', 'min_size_fluctuation', 'zeroLoadDepth',
+            'min_loading_Force', 'tip', 'surfaceFind', 'unloadPMax', 'unloadPMin', 'zeroGradDelta',
+            'zeroGradFilter', 'cacheDir', 'filterBackend']
+#columns of result table: same keys as saveToUserMeta
+RESULTS = ['S_mN/um', 'hMax_um', 'pMax_mN', 'modulusRed_GPa', 'A_um2', 'hc_um', 'E_GPa', 'H_GPa', 'segment']
+
+
+def analyseAll(self, workers=None, backend='process'):
+  """
+  Analyse all tests of the file and collect the results in one table
+
+  Each worker opens its own copy of the file and analyses a consecutive share of the tests,
+  hence this object, its current test and its test list are not changed. If the file is cached, this object
+  writes the cache file before the workers start and the workers only read it.
+
+  Args:
+    workers (int): number of workers; None=number of CPUs; 1=run serially in this process
+    backend (str): 'process' or 'thread'
+
+  Returns:
+    pandas.DataFrame: one row per segment with the test name and the columns of saveToUserMeta
+  """
+  if backend not in ['process', 'thread']:
+    print("**ERROR analyseAll: backend has to be 'process' or 'thread'", backend)
+    return None
+  settings = {key:getattr(self, key) for key in SETTINGS if hasattr(self, key)}
+  if not self.testList and not hasattr(self, 'allTestList'):
+    #single test in file: nothing to distribute
+    testNames = [self.testName]
+    chunks = [testNames]
+    workers = 1
+  else:
+    testNames = [i for i in self.allTestList if i not in self.config or 'ignore' not in self.config[i]]
+    if workers is None:
+      workers = os.cpu_count()
+    workers = max(1, min(workers, len(testNames)))
+    chunks = [list(i) for i in np.array_split(np.array(testNames, dtype=object), workers)]
+  self.completeCache()
+  if workers==1:
+    results = [analyseTests(settings, self.fileName, chunk) for chunk in chunks]
+  else:
+    executor = ProcessPoolExecutor if backend=='process' else ThreadPoolExecutor
+    with executor(max_workers=workers) as pool:
+      results = list(pool.map(analyseTests, [settings]*len(chunks), [self.fileName]*len(chunks), chunks))
+  table = {'test':[], **{key:[] for key in RESULTS}}
+  for rows, failed in results:
+    for key, value in rows.items():
+      table[key] += value
+    for testName, message in failed:
+      print("**ERROR analyseAll: test",testName,"failed:",message)
+  return pd.DataFrame(table)
+
+
+def analyseTests(settings, fileName, testNames):
+  """
+  internal function: analyse some tests of a file with an independent indentation object |br|
+  has to be on module level such that it can be used by a process pool
+
+  Args:
+    settings (dict): attributes of indentation object that define the analysis
+    fileName (str): file name
+    testNames (list): names of tests to analyse
+
+  Returns:
+    tuple: columns of results, list of (test name, error message) of failed tests
+  """
+  from . import Indentation  #pylint: disable=import-outside-toplevel
+  indentation = Indentation(fileName, nuMat=settings['nuMat'], tip=settings['tip'],
+                            surfaceFind=settings['surfaceFind'], nonMetal=settings['nonMetal'],
+                            driftRate=settings['driftRate'], verbose=settings['verbose'],
+                            cache=settings.get('cacheDir'), cacheReadOnly=True, analysisCache=True)
+  try:
+    for key, value in settings.items():
+      setattr(indentation, key, value)
+    return collectResults(indentation, testNames)
+  finally:
+    indentation.close()
+
+
+def collectResults(indentation, testNames):
+  """
+  internal function: analyse some tests of an opened file; failures of single tests are caught and tests without
+  unloading segment are failed
+
+  Args:
+    indentation (Indentation): indentation object of the file
+    testNames (list): names of tests to analyse; single-test files: name of the current test
+
+  Returns:
+    tuple: columns of results, list of (test name, error message) of failed tests
+  """
+  rows = {'test':[], **{key:[] for key in RESULTS}}
+  failed = []
+  if indentation.testList is not None:
+    indentation.testList = list(testNames)
+  for testName in testNames:
+    try:
+      if indentation.testList is not None and not indentation.nextTest():
+        failed.append((testName, 'could not read test'))
+        continue
+      for key in RESULTS:
+        indentation.metaUser.pop(key, None)
+      indentation.analyse()
+      if 'S_mN/um' not in indentation.metaUser:
+        failed.append((testName, 'analysis was skipped'))
+        continue
+      if len(indentation.metaUser['segment'])==0:
+        failed.append((testName, 'no unloading segment'))
+        continue
+      rows['test'] += [testName]*len(indentation.metaUser['segment'])
+      for key in RESULTS:
+        rows[key] += list(indentation.metaUser[key])
+    except Exception:  #pylint: disable=broad-except
+      failed.append((testName, traceback.format_exc().splitlines()[-1]))
+  return rows, failed
+
+
+def recalculateAll(self, results=None):
+  """
+  Recalculate the results of many tests with the current area function, Poisson's ratios and beta,
+  e.g. after changing the tip: stiffness, maximal force and depth are taken from the table and all
+  segments are evaluated in one vectorized call
+
+  Args:
+    results (pandas.DataFrame): table of analyseAll; None=results of current test in metaUser
+
+  Returns:
+    pandas.DataFrame: table with recalculated modulusRed_GPa, A_um2, hc_um, E_GPa, H_GPa
+  """
+  if results is None:
+    if 'S_mN/um' not in self.metaUser:
+      print("**ERROR recalculateAll: current test is not analysed")
+      return None
+    results = pd.DataFrame({'test':[self.testName]*len(self.metaUser['segment']),
+                            **{key:self.metaUser[key] for key in RESULTS}})
+  else:
+    results = results.copy()
+  modulusRed, Ac, hc, modulus, hardness = self.OliverPharrMethodBatch(results['S_mN/um'].to_numpy(),
+    results['pMax_mN'].to_numpy(), results['hMax_um'].to_numpy(), self.nonMetal)
+  results['modulusRed_GPa'] = modulusRed
+  results['A_um2'] = Ac
+  results['hc_um'] = hc
+  results['E_GPa'] = modulus
+  results['H_GPa'] = hardness
+  return results
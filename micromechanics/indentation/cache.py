@@ -0,0 +1,477 @@
+"""Caches: decoded vendor files are not parsed again; unchanged tests are not analysed again"""
+import os, json, hashlib, re, time
+from collections import OrderedDict
+from pathlib import Path
+import h5py
+import numpy as np
+from .definitions import Method, Vendor
+from .testData import TestData
+
+VERSION = 1  #version of the readers: increase if the decoded data changes
+#attributes set by the loaders of each vendor, which are not part of the tests
+ATTRIBUTES = {Vendor.Agilent:        ['indicies', 'fullData'],
+              Vendor.Hysitron:       ['compliance', 'timeStamp'],
+              Vendor.Micromaterials: [],
+              Vendor.FischerScope:   []}
+#attributes that define the analysis: changing them invalidates the cached results
+PARAMETERS = ['nuMat', 'nuTip', 'modulusTip', 'beta', 'nonMetal', 'method', 'onlyLoadingSegment',
+              'evaluateStiffnessAtMax', 'driftRate', 'surfaceFind', 'unloadPMax', 'unloadPMin', 'zeroGradDelta']
+#results of analyse
+ARRAYS = ['slope', 'valid', 'k2p', 'modulusRed', 'Ac', 'hc', 'modulus', 'hardness']
+
+
+def cacheFileName(self, fileName):
+  """
+  Name of cache file: key is the absolute path, the modification time, the size of the file and
+  the version of the readers
+
+  Args:
+    fileName (str): name of vendor file
+
+  Returns:
+    Path: name of cache file
+  """
+  stat = os.stat(fileName)
+  key = f'{os.path.abspath(fileName)}|{stat.st_mtime_ns}|{stat.st_size}|{VERSION}'
+  return Path(self.cacheDir)/(hashlib.sha1(key.encode('utf-8')).hexdigest()+'.hdf5')
+
+
+def loadCache(self, fileName):
+  """
+  Initialize from cache file, if one exists for this file and vendor
+
+  Args:
+    fileName (str): name of vendor file
+
+  Returns:
+    bool: success
+  """
+  if self.cacheDir is None:
+    return False
+  path = self.cacheFileName(fileName)
+  if not path.exists():
+    return False
+  try:
+    fileCache = FileCache(path)
+  except (OSError, KeyError, ValueError):
+    print("**ERROR loadCache: could not read cache file",path)
+    return False
+  meta = fileCache.meta
+  if meta['vendor']!=self.vendor.name:
+    fileCache.close()
+    return False
+  if self.verbose>1:
+    print("Open cached file: "+fileName)
+  os.utime(path)  #time of last use, see evictCache
+  self.fileCache = fileCache
+  self.fileName = fileName
+  self.method = Method[meta['method']]
+  self.metaVendor.update(meta['metaVendor'])
+  self.metaUser.update(meta['metaUser'])
+  for key, value in meta['attributes'].items():
+    setattr(self, key, value)
+  if meta['prefactors'] is not None:
+    self.tip.prefactors = meta['prefactors']
+  if 'dataDrift' in fileCache.file:
+    self.dataDrift = np.array(fileCache.file['dataDrift'])
+  if meta['testList'] is None:
+    self.setTestData(fileCache.read(meta['names'][0]))
+  else:
+    self.testList = list(meta['testList'])
+    self.allTestList = list(self.testList)
+    self.nextTest()
+  return True
+
+
+def saveCache(self):
+  """
+  Start the cache file of the current file: each test is added when it is read, see cacheTest. The cache file is
+  used once all tests were read; a cache file that is not complete is removed by close
+  """
+  if self.vendor not in ATTRIBUTES:
+    return
+  path = self.cacheFileName(self.fileName)
+  testList = list(self.allTestList) if hasattr(self, 'allTestList') else None
+  names = testList if testList is not None else [self.testData.name]
+  try:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    self.cacheWriter = CacheWriter(path, names, getattr(self, 'dataDrift', None))
+  except OSError:
+    print("**ERROR saveCache: could not write cache file",path)
+    return
+  self.cacheTest(self.testName if testList is not None else names[0], self.testData)
+  return
+
+
+def cacheTest(self, testName, data):
+  """
+  internal function: add a test that was read from the vendor file to the cache file; save the cache file if it is
+  complete
+
+  Args:
+    testName (str): name of test
+    data (TestData): data of this test
+  """
+  if self.cacheWriter is None or data is None:
+    return
+  if not self.cacheWriter.add(testName, data):
+    return
+  prefactors = self.tip.prefactors if self.vendor==Vendor.Hysitron else None
+  meta = {'vendor':self.vendor.name, 'method':self.method.name, 'metaVendor':self.metaVendor,
+          'metaUser':self.metaUser, 'prefactors':prefactors,
+          'testList':list(self.allTestList) if hasattr(self, 'allTestList') else None,
+          'names':self.cacheWriter.names,
+          'attributes':{i:getattr(self,i) for i in ATTRIBUTES[self.vendor] if hasattr(self,i)}}
+  self.cacheWriter.save(meta)
+  self.cacheWriter = None
+  evictCache(self.cacheDir, self.cacheMaxBytes, self.cacheMaxAge)
+  return
+
+
+def completeCache(self):
+  """
+  Read the tests that are not in the cache file yet, such that the cache file is saved, e.g. before the workers of
+  analyseAll use it
+  """
+  if self.cacheWriter is None:
+    return
+  for testName in [i for i in self.cacheWriter.names if i in self.cacheWriter.missing]:
+    self.readTest(testName)
+    if self.cacheWriter is None:  #saved or failed
+      break
+  return
+
+
+def evictCache(directory, maxBytes, maxAge):
+  """
+  Remove cache files: those not used for more than maxAge days, then the least recently used ones until the cache
+  files take at most maxBytes; unfinished cache files of other sessions are removed after one day. Only files with
+  the names of cache files are removed
+
+  Args:
+    directory (str): directory of cache files
+    maxBytes (int): maximum size of all cache files
+    maxAge (float): maximum time since last use [days]
+  """
+  now = time.time()
+  files = []
+  for path in Path(directory).iterdir():
+    try:
+      stat = path.stat()
+    except OSError:  #removed by other process
+      continue
+    if re.fullmatch(r'[0-9a-f]{40}\.\d+\.tmp', path.name):
+      if now-stat.st_mtime>24*3600:
+        path.unlink(missing_ok=True)
+    elif re.fullmatch(r'[0-9a-f]{40}\.hdf5', path.name):
+      if now-stat.st_mtime>maxAge*24*3600:
+        path.unlink(missing_ok=True)
+      else:
+        files.append((stat.st_mtime, stat.st_size, path))
+  size = sum(i[1] for i in files)
+  for _, fileSize, path in sorted(files):
+    if size<=maxBytes:
+      break
+    path.unlink(missing_ok=True)
+    size -= fileSize
+  return
+
+
+def analysisHash(self):
+  """
+  internal function: hash of the current test before analysis and of the parameters of the analysis
+
+  Returns:
+    str: hexadecimal hash; None if the tip shape is a function that cannot be hashed
+  """
+  digest = hashlib.sha1()
+  for key in ['t','h','p','valid']+(['slope'] if self.method==Method.CSM else []):  #else: slope is a result
+    digest.update(key.encode('utf-8')+np.ascontiguousarray(getattr(self, key)).tobytes())
+  interpFunction = getattr(self.tip, 'interpFunction', None)
+  if interpFunction is not None:
+    if not hasattr(interpFunction, 'x') or not hasattr(interpFunction, 'y'):
+      return None
+    digest.update(np.ascontiguousarray(interpFunction.x).tobytes()+np.ascontiguousarray(interpFunction.y).tobytes())
+  parameters = {key:getattr(self, key, None) for key in PARAMETERS}
+  parameters.update({'prefactors':self.tip.prefactors, 'compliance':self.tip.compliance, 'iLHU':self.iLHU,
+                     'config':self.config.get(self.testName)})
+  digest.update(json.dumps(parameters, default=jsonDefault, sort_keys=True).encode('utf-8'))
+  return digest.hexdigest()
+
+
+def useAnalysisCache(self):
+  """
+  internal function: analysis cache is used for current test; not for CSM since that analysis is faster than the hash
+
+  Returns:
+    bool: use analysis cache
+  """
+  return self.analysisCache is not None and self.method!=Method.CSM
+
+
+def loadAnalysis(self, key):
+  """
+  internal function: use cached results of analyse: from HDF5 file (writeBack) or analysis cache
+
+  Args:
+    key (str): hash of test and parameters, see analysisHash
+
+  Returns:
+    bool: success; False if analysis is required
+  """
+  writeBack = self.writeBack and self.vendor==Vendor.CommonHDF5
+  results = self.readAnalysisHDF5(key) if writeBack else None
+  if results is None and self.useAnalysisCache():
+    results = self.analysisCache.get(key)
+    if results is not None and writeBack:
+      self.writeAnalysisHDF5(key, results)
+  if results is None:
+    return False
+  self.h = self.h - self.tip.compliance*self.p
+  for name in ARRAYS:
+    setattr(self, name, np.array(results[name]))
+  self.iLHU = results['iLHU'].tolist()
+  return True
+
+
+def saveAnalysis(self, key):
+  """
+  internal function: save results of analyse of current test to analysis cache and HDF5 file (writeBack)
+
+  Args:
+    key (str): hash of test and parameters, see analysisHash
+  """
+  results = {name:np.atleast_1d(np.array(getattr(self, name))) for name in ARRAYS}
+  results['iLHU'] = np.array([i for i in self.iLHU if len(i)==4], dtype=np.int64).reshape((-1,4))
+  if self.useAnalysisCache():
+    self.analysisCache.put(key, results)
+  if self.writeBack and self.vendor==Vendor.CommonHDF5:
+    self.writeAnalysisHDF5(key, results)
+  return
+
+
+class AnalysisCache:
+  """
+  Results of analyse, key is the hash of the test and the parameters
+
+  - least recently used results are removed from memory if the size is exceeded
+  - optional directory: results are also saved as numpy files, which other sessions can use
+  - can be shared by many indentation objects
+  """
+  def __init__(self, maxBytes=64*1024**2, directory=None):
+    """
+    Initialize empty cache
+
+    Args:
+      maxBytes (int): maximum size of results in memory
+      directory (str): directory to save results to; None=only memory
+    """
+    self.maxBytes  = maxBytes
+    self.directory = None if directory is None else Path(directory)
+    self.entries   = OrderedDict()
+    self.size      = 0
+    return
+
+
+  def __len__(self):
+    return len(self.entries)
+
+
+  def get(self, key):
+    """
+    Get results
+
+    Args:
+      key (str): hash of test and parameters
+
+    Returns:
+      dict: results; None if not cached
+    """
+    if key in self.entries:
+      self.entries.move_to_end(key)
+      return self.entries[key]
+    if self.directory is not None and (self.directory/(key+'.npz')).exists():
+      with np.load(self.directory/(key+'.npz')) as data:
+        results = {name:data[name] for name in data.files}
+      self.remember(key, results)
+      return results
+    return None
+
+
+  def put(self, key, results):
+    """
+    Add results
+
+    Args:
+      key (str): hash of test and parameters
+      results (dict): results of analyse: numpy arrays
+    """
+    self.remember(key, results)
+    if self.directory is not None:
+      self.directory.mkdir(parents=True, exist_ok=True)
+      fileTemp = self.directory/f'{key}.{os.getpid()}.tmp.npz'
+      np.savez(fileTemp, **results)
+      os.replace(fileTemp, self.directory/(key+'.npz'))  #other processes never see a partial file
+    return
+
+
+  def remember(self, key, results):
+    """
+    internal function: add results to memory and remove least recently used ones
+
+    Args:
+      key (str): hash of test and parameters
+      results (dict): results of analyse: numpy arrays
+    """
+    if key in self.entries:
+      self.size -= sum(i.nbytes for i in self.entries.pop(key).values())
+    self.entries[key] = results
+    self.size += sum(i.nbytes for i in results.values())
+    while self.size>self.maxBytes and len(self.entries)>1:
+      _, oldResults = self.entries.popitem(last=False)
+      self.size -= sum(i.nbytes for i in oldResults.values())
+    return
+
+
+class FileCache:
+  """
+  Read-only access to a cache file: tests are only read when they are used
+  """
+  def __init__(self, path):
+    """
+    Open cache file
+
+    Args:
+      path (Path): name of cache file
+    """
+    self.file = h5py.File(path, mode='r')
+    self.meta = json.loads(self.file.attrs['meta'])
+    self.index = {name:str(idx) for idx, name in enumerate(self.meta['names'])}
+    return
+
+
+  def __contains__(self, testName):
+    return testName in self.index
+
+
+  def close(self):
+    """
+    Close cache file
+    """
+    self.file.close()
+    return
+
+
+  def read(self, testName):
+    """
+    Read one test
+
+    Args:
+      testName (str): name of test
+
+    Returns:
+      TestData: data of this test
+    """
+    branch = self.file['tests'][self.index[testName]]
+    entries = {key:branch[key][()] for key in ['t','h','p','valid','slope','iLHU','iDrift'] if key in branch}
+    if 'channels' in branch:
+      entries.update({key:value[()] for key, value in branch['channels'].items()})
+    return TestData(testName, **entries)
+
+
+  @staticmethod
+  def write(branch, record):
+    """
+    Write one test
+
+    Args:
+      branch (h5py.Group): group of this test
+      record (TestData): data of this test
+    """
+    for key in ['t','h','p','valid','slope','iLHU','iDrift']:
+      value = getattr(record, key)
+      if value is not None:
+        branch.create_dataset(key, data=np.array(value))
+    for key, value in record.channels.items():
+      branch.create_dataset('channels/'+key, data=value)
+    return
+
+
+class CacheWriter:
+  """
+  Cache file that is written while the tests are read: saved under its name only when all tests are written, such
+  that other sessions never see a partial file
+  """
+  def __init__(self, path, names, dataDrift=None):
+    """
+    Open temporary file
+
+    Args:
+      path (Path): name of cache file
+      names (list): names of all tests of the file
+      dataDrift (np.array): drift data of the file
+    """
+    self.path = path
+    self.pathTemp = path.with_suffix(f'.{os.getpid()}.tmp')
+    self.names = list(names)
+    self.missing = set(self.names)
+    self.file = h5py.File(self.pathTemp, 'w')
+    if dataDrift is not None:
+      self.file.create_dataset('dataDrift', data=dataDrift)
+    return
+
+
+  def add(self, testName, record):
+    """
+    Write one test, if it is not written yet
+
+    Args:
+      testName (str): name of test
+      record (TestData): data of this test
+
+    Returns:
+      bool: all tests are written
+    """
+    if testName in self.missing:
+      FileCache.write(self.file.create_group(f'tests/{self.names.index(testName)}'), record)
+      self.missing.discard(testName)
+    return not self.missing
+
+
+  def save(self, meta):
+    """
+    Write meta data and save the complete cache file under its name
+
+    Args:
+      meta (dict): meta data of file
+    """
+    self.file.attrs['meta'] = json.dumps(meta, default=jsonDefault)
+    self.file.close()
+    os.replace(self.pathTemp, self.path)
+    return
+
+
+  def discard(self):
+    """
+    Remove the temporary file, e.g. if not all tests were read
+    """
+    self.file.close()
+    self.pathTemp.unlink(missing_ok=True)
+    return
+
+
+def jsonDefault(value):
+  """
+  Convert values that json cannot handle, e.g. numpy numbers
+
+  Args:
+    value (any): value
+
+  Returns:
+    any: python value or string
+  """
+  if isinstance(value, np.generic):
+    return value.item()
+  if isinstance(value, np.ndarray):
+    return value.tolist()
+  return str(value)
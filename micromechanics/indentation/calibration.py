@@ -3,8 +3,11 @@ import numpy as np
 import matplotlib.pyplot as plt
 from scipy.signal import savgol_filter#, medfilt
 from scipy import interpolate
+from scipy.optimize import lsq_linear
 import lmfit
 from .definitions import Method
+from .tip import AreaFunction
+from .accumulator import Accumulator
 
 def calibration(self,eTarget=72.0,numPolynomial=3,critDepthStiffness=1.0, critForce=1.0, critDepthTip=0.0, plotStiffness=False, plotTip=False, **kwargs):
   """
@@ -22,46 +25,82 @@ def calibration(self,eTarget=72.0,numPolynomial=3,critDepthStiffness=1.0, critFo
 
         - constantTerm (bool): add constant term into area function
         - returnArea (bool): return contact depth and area
+        - solver (str): 'linear' bounded linear least-squares (default) or 'lmfit'; constantTerm always uses lmfit
+        - robust (bool): linear solver: reduce weight of outliers by Huber reweighting
+        - data (bool): reuse data of previous calibration in self.calibrationData instead of analysing all tests,
+          e.g. if only critForce, critDepthStiffness, critDepthTip or eTarget change
 
   Returns:
     bool: success
   """
-  constantTerm = kwargs.get('constantTerm', False)
+  reuseData = kwargs.get('data', False)
   frameCompliance = self.calibrateStiffness(critDepth=critDepthStiffness,critForce=critForce,
-    plotStiffness=plotStiffness)
+    plotStiffness=plotStiffness, data=True if reuseData else None)
   print('frameCompliance',frameCompliance)
-  ## re-create data-frame of all files
-  temp = {'method': self.method, 'onlyLoadingSegment': self.onlyLoadingSegment}
-  self.restartFile()
-  self.tip.compliance = frameCompliance
-  for key, value in temp.items():
-    setattr(self, key, value)
-  slope, h, p = np.array([], dtype=np.float64), np.array([],dtype=np.float64), np.array([],dtype=np.float64)
-  if self.method==Method.CSM:
-    self.nextTest(newTest=False)  #rerun to ensure that onlyLoadingSegment used
+  data = self.calibrationData.get('area') if reuseData else None
+  if data is None or data.info['compliance']!=frameCompliance:
+    ## re-create data-frame of all files
+    temp = {'method': self.method, 'onlyLoadingSegment': self.onlyLoadingSegment}
+    self.restartFile()
+    self.tip.compliance = frameCompliance
+    for key, value in temp.items():
+      setattr(self, key, value)
+    data = Accumulator(['S','h','p'], compliance=frameCompliance)
+    if self.method==Method.CSM:
+      self.nextTest(newTest=False)  #rerun to ensure that onlyLoadingSegment used
     while True:
       if self.progressBar_calibration:
         progressBar_calibration_Value=int((3*len(self.allTestList)-len(self.testList))/(3*len(self.allTestList))*100)
         self.progressBar_calibration.setValue(progressBar_calibration_Value)
       self.analyse()
-      slope = np.hstack((slope, self.slope))
-      h     = np.hstack((h,     self.h[self.valid]))
-      p     = np.hstack((p,     self.p[self.valid]))
+      if self.method==Method.CSM:
+        data.append(S=self.slope, h=self.h[self.valid], p=self.p[self.valid])
+      else:
+        data.append(S=self.metaUser['S_mN/um'], h=self.metaUser['hMax_um'], p=self.metaUser['pMax_mN'])
       if not self.testList:
         break
       self.nextTest()
+    self.calibrationData['area'] = data
   else:
-    while True:
-      if self.progressBar_calibration:
-        progressBar_calibration_Value=int((3*len(self.allTestList)-len(self.testList))/(3*len(self.allTestList))*100)
-        self.progressBar_calibration.setValue(progressBar_calibration_Value)
-      self.analyse()
-      slope = np.hstack((slope, self.metaUser['S_mN/um']))
-      h     = np.hstack((h,     self.metaUser['hMax_um']))
-      p     = np.hstack((p,     self.metaUser['pMax_mN']))
-      if len(self.testList)==0:
-        break
-      self.nextTest()
+    self.tip.compliance = frameCompliance
+  hc, Ac = self.calibrateArea(data, eTarget, numPolynomial, critDepthTip,
+                              **{key:kwargs[key] for key in ['constantTerm','solver','robust'] if key in kwargs})
+
+  if plotTip:
+    rNonPerfect = np.sqrt(Ac/np.pi)
+    plt.plot(rNonPerfect, hc,'C0o', label='data')
+    self.tip.plotIndenterShape(maxDepth=1.5)
+    #Error plot
+    plt.plot(hc,(Ac-self.tip.areaFunction(hc))/Ac,'o',markersize=2)
+    plt.axhline(0,color='k',linewidth=2)
+    plt.xlabel(r"Depth [$\mathrm{\mu m}$]")
+    plt.ylabel("Relative area error")
+    plt.ylim([-0.1,0.1])
+    plt.xlim(left=0)
+    plt.yticks([-0.1,-0.05,0,0.05,0.1])
+    plt.show()
+
+  if kwargs.get('returnArea', False):
+    return hc, Ac
+  return True
+
+
+def calibrateArea(self, data, eTarget=72.0, numPolynomial=3, critDepthTip=0.0, **kwargs):
+  """
+  Calibrate area function from data that is analysed with the frame compliance
+
+  Args:
+      data (Accumulator): stiffness S, depth h, force p of all tests
+      eTarget (float): target Young's modulus (not reduced), nu is known
+      numPolynomial (int): number of area function polynomial; if None: return interpolation function
+      critDepthTip (float): area function what is the minimum depth of data used
+      kwargs (dict): constantTerm, solver, robust: see calibration
+
+  Returns:
+      list: contact depth and area of data
+  """
+  constantTerm = kwargs.get('constantTerm', False)
+  slope, h, p = data['S'], data['h'], data['p']
 
   #depth has to be positive
   mask = h>critDepthTip
@@ -88,17 +127,26 @@ def calibration(self,eTarget=72.0,numPolynomial=3,critDepthStiffness=1.0, critFo
     interpolationFunct = interpolate.interp1d(hc_, Ac_)
     self.tip.setInterpolationFunction(interpolationFunct)
     del output, data
-  else:
+  elif not constantTerm and kwargs.get('solver', 'linear')=='linear':
     #It is possible to crop only interesting contact depth: hc>1nm
     # Ac = Ac[hc>0.001]
     # hc = hc[hc>0.001]
+    #area function is linear in the prefactors
+    self.tip.prefactors, stderr = fitAreaFunctionLinear(hc, Ac, numPolynomial, kwargs.get('robust', False))
+    print("\nTip shape:")
+    print("  iterated prefactors",[round(i,1) for i in self.tip.prefactors[:-1]])
+    print("    standard error",['NaN' if np.isnan(x) else round(x,2) for x in stderr])
+  else:
     if constantTerm:
       appendix = 'isoPlusConstant'
     else:
       appendix = 'iso'
+    evaluator = AreaFunction([24.3, appendix])        #evaluator and its arrays are reused in all iterations
+    tempArea = np.empty_like(hc)
     def fitFunct(params):     #error function
       self.tip.prefactors = [params[x].value for x in params]+[appendix]
-      tempArea = self.tip.areaFunction(hc)          #use all datapoints as critDepth is for compliance plot
+      evaluator.update(self.tip.prefactors)
+      evaluator(hc, out=tempArea)                     #use all datapoints as critDepth is for compliance plot
       residual     = np.abs(Ac-tempArea)/len(Ac)    #normalize by number of points
       return residual
     # Parameters, 'value' = initial condition, 'min' and 'max' = boundaries
@@ -116,30 +164,90 @@ def calibration(self,eTarget=72.0,numPolynomial=3,critDepthStiffness=1.0, critFo
     print("  iterated prefactors",[round(i,1) for i in self.tip.prefactors[:-1]])
     stderr = [result.params[x].stderr for x in result.params]
     print("    standard error",['NaN' if x is None else round(x,2) for x in stderr])
+  return hc, Ac
 
-  if plotTip:
-    rNonPerfect = np.sqrt(Ac/np.pi)
-    plt.plot(rNonPerfect, hc,'C0o', label='data')
-    self.tip.plotIndenterShape(maxDepth=1.5)
-    #Error plot
-    plt.plot(hc,(Ac-self.tip.areaFunction(hc))/Ac,'o',markersize=2)
-    plt.axhline(0,color='k',linewidth=2)
-    plt.xlabel(r"Depth [$\mathrm{\mu m}$]")
-    plt.ylabel("Relative area error")
-    plt.ylim([-0.1,0.1])
-    plt.xlim(left=0)
-    plt.yticks([-0.1,-0.05,0,0.05,0.1])
-    plt.show()
 
-  if kwargs.get('returnArea', False):
-    return hc, Ac
-  return True
+def collectCalibrationData(self):
+  """
+  internal function: analyse all remaining tests and collect force, depth, stiffness |br|
+  CSM: all valid points, pRel is force relative to minimum of each test (+1uN); else: one row per unloading
+  segment, pRel=p
+
+  Returns:
+      Accumulator: columns p, pRel, h, S; info contains the compliance
+  """
+  data = Accumulator(['p','pRel','h','S'], compliance=self.tip.compliance)
+  while True:
+    if self.progressBar_calibration:
+      progressBar_Value=int((2*len(self.allTestList)-len(self.testList))/(3*len(self.allTestList))*100)
+      self.progressBar_calibration.setValue(progressBar_Value)
+    elif self.progressBar_FrameStiffness:
+      progressBar_Value=int((2*len(self.allTestList)-len(self.testList))/(2*len(self.allTestList))*100)
+      self.progressBar_FrameStiffness.setValue(progressBar_Value)
+    self.analyse()
+    if self.method==Method.CSM:
+      if np.count_nonzero(self.valid)>0:
+        data.append(p=self.p[self.valid], pRel=self.p[self.valid]-np.min(self.p[self.valid])+0.001, #add 1nm:prevent runtime error
+                    h=self.h[self.valid], S=self.slope)
+    else:
+      data.append(p=self.metaUser['pMax_mN'], pRel=self.metaUser['pMax_mN'], h=self.metaUser['hMax_um'],
+                  S=self.metaUser['S_mN/um'])
+    if not self.testList:
+      break
+    self.nextTest()
+  return data
+
+
+def fitAreaFunctionLinear(hc, Ac, numPolynomial, robust=False):
+  """
+  internal function: fit iso-prefactors by bounded linear least-squares of design matrix of hc-powers |br|
+  same bounds as lmfit-fit; deterministic and no iterations (except for robust reweighting)
+
+  Args:
+      hc (np.array): contact depth [um]
+      Ac (np.array): contact area [um^2]
+      numPolynomial (int): number of area function polynomial
+      robust (bool): Huber reweighting of residuals
+
+  Returns:
+      list: prefactors in [nm] ending with 'iso', standard error of prefactors
+  """
+  hcNM = np.maximum(hc, 1.e-6)*1000.  #all prefactors are in nm
+  exponents = 2./np.power(2., np.arange(numPolynomial))
+  design = np.power(hcNM[:,None], exponents[None,:])
+  target = Ac*1.e6
+  bounds = np.array([[10., 60.]]+[[-np.power(100.,idx)*100, np.power(100.,idx)*100] for idx in range(1,numPolynomial)])
+  scale = np.linalg.norm(design, axis=0)                #scale columns for good condition
+  scale[scale==0] = 1.
+  weights = np.ones_like(target)
+  for _ in range(50 if robust else 1):
+    sqrtWeights = np.sqrt(weights)
+    result = lsq_linear(design/scale*sqrtWeights[:,None], target*sqrtWeights,
+                        bounds=(bounds[:,0]*scale, bounds[:,1]*scale), method='bvls')
+    prefactors = result.x/scale
+    residual = target-design@prefactors
+    if not robust:
+      break
+    #Huber weights with robust scale estimate
+    sigma = 1.4826*np.median(np.abs(residual-np.median(residual)))
+    weightsNew = np.minimum(1., 1.345*sigma/np.maximum(np.abs(residual), 1.e-300))
+    if np.allclose(weightsNew, weights, atol=1.e-6):
+      break
+    weights = weightsNew
+  degreesFreedom = max(len(target)-numPolynomial, 1)
+  variance = np.sum(weights*residual**2)/degreesFreedom
+  try:
+    stderr = np.sqrt(np.diag(np.linalg.inv((design*weights[:,None]).T@design)*variance))
+  except np.linalg.LinAlgError:
+    stderr = np.full(numPolynomial, np.nan)
+  return [float(i) for i in prefactors]+['iso'], [float(i) for i in stderr]
 
 
 def calibrateStiffness(self,critDepth=0.5,critForce=0.0001,plotStiffness=True, returnAxis=False,\
-  returnData=False):
+  returnData=False, data=None):
   """
-  Calibrate by first frame-stiffness from K^2/P of individual measurement
+  Calibrate by first frame-stiffness from K^2/P of individual measurement |br|
+  collected data (force, depth, stiffness) is saved in self.calibrationData['stiffness']
 
   Args:
       critDepth (float): frame stiffness: what is the minimum depth of data used
@@ -147,62 +255,30 @@ def calibrateStiffness(self,critDepth=0.5,critForce=0.0001,plotStiffness=True, r
       plotStiffness (bool): plot stiffness graph with compliance
       returnAxis (bool): return axis of plot
       returnData (bool): return data for external plotting
+      data (Accumulator): use this data of a previous run instead of analysing all tests, e.g. if only
+        critDepth or critForce change; True=self.calibrationData['stiffness']. The fit is the same as in that run,
+        independent of the current compliance of the tip
 
   Returns:
       pyplot.axis or numpy.arary: data as chosen by arguments
   """
   print("Start compliance fitting")
   print('self.zeroLoadDepth',self.zeroLoadDepth)
-  ## output representative values
+  if data is True:
+    data = self.calibrationData.get('stiffness')
+  if data is None:
+    data = self.collectCalibrationData()
+  self.calibrationData['stiffness'] = data
+  ## output representative values: for CSM, force is relative to minimum of each test
+  x = 1./np.sqrt(data['pRel'])
+  y = 1./data['S']
+  h = data['h']
+  mask = np.logical_and(h>critDepth, data['pRel']>critForce)
   if self.method==Method.CSM:
-    x, y, h = None, None, None
-    while True:
-      self.analyse()
-      if x is None:
-        x = 1./np.sqrt(self.p[self.valid]-np.min(self.p[self.valid])+0.001) #add 1nm:prevent runtime error
-        y = 1./self.slope
-        h = self.h[self.valid]
-      elif np.count_nonzero(self.valid)>0:
-        x = np.hstack((x,    1./np.sqrt(self.p[self.valid]-np.min(self.p[self.valid])+0.001) ))
-        y = np.hstack((y,    1./self.slope))
-        h = np.hstack((h, self.h[self.valid]))
-      if not self.testList:
-        break
-      self.nextTest()
-    mask = np.logical_and(h>critDepth, x<1./np.sqrt(critForce))
     if len(mask[mask])==0:
       print("WARNING too restrictive filtering, no data left. Use high penetration: 50% of force and depth")
       mask = np.logical_and(h>np.max(h)*0.5, x<np.max(x)*0.5)
   else:
-    ## create data-frame of all files
-    pAll, hAll, sAll = [], [], []
-    while True:
-      if self.progressBar_calibration:
-        progressBar_Value=int((2*len(self.allTestList)-len(self.testList))/(3*len(self.allTestList))*100)
-        self.progressBar_calibration.setValue(progressBar_Value)
-      elif self.progressBar_FrameStiffness:
-        progressBar_Value=int((2*len(self.allTestList)-len(self.testList))/(2*len(self.allTestList))*100)
-        self.progressBar_FrameStiffness.setValue(progressBar_Value)
-      self.analyse()
-      if isinstance(self.metaUser['pMax_mN'], list):
-        pAll = pAll+list(self.metaUser['pMax_mN'])
-        hAll = hAll+list(self.metaUser['hMax_um'])
-        sAll = sAll+list(self.metaUser['S_mN/um'])
-      else:
-        pAll = pAll+[self.metaUser['pMax_mN']]
-        hAll = hAll+[self.metaUser['hMax_um']]
-        sAll = sAll+[self.metaUser['S_mN/um']]
-      if not self.testList:
-        break
-      self.nextTest()
-    pAll = np.array(pAll)
-    hAll = np.array(hAll)
-    sAll = np.array(sAll)
-    ## determine compliance by intersection of 1/sqrt(p) -- compliance curve
-    x = 1./np.sqrt(pAll)
-    y = 1./sAll
-    mask = hAll > critDepth
-    mask = np.logical_and(mask, pAll>critForce)
     print("number of data-points:", len(x[mask]))
   if len(mask[mask])==0:
     print("ERROR too much filtering, no data left. Decrease critForce and critDepth")
@@ -244,3 +320,91 @@ def calibrateStiffness(self,critDepth=0.5,critForce=0.0001,plotStiffness=True, r
     if isinstance(plotStiffness,bool):
       plt.show()
   return frameCompliance
+
+
+class CalibrationSession:
+  """
+  Calibrate frame compliance and area function for many different parameters, e.g. in a GUI: all tests are
+  analysed only once without frame compliance; the frame compliance C is then applied analytically
+
+  - h = h0 - C p
+  - S = 1/(1/S0 - C): springs in series; exact for CSM, for unloading segments it approximates a new power-law fit
+  """
+  def __init__(self, indentation):
+    """
+    Analyse all tests of the file
+
+    Args:
+      indentation (Indentation): indentation object of calibration file
+    """
+    self.indentation = indentation
+    compliance = indentation.tip.compliance
+    temp = {'method': indentation.method, 'onlyLoadingSegment': indentation.onlyLoadingSegment}
+    indentation.tip.compliance = 0.
+    indentation.restartFile()
+    for key, value in temp.items():
+      setattr(indentation, key, value)
+    if indentation.method==Method.CSM:
+      indentation.nextTest(newTest=False)  #rerun to ensure that onlyLoadingSegment used
+    self.data = indentation.collectCalibrationData()
+    indentation.tip.compliance = compliance
+    return
+
+
+  def dataAt(self, compliance):
+    """
+    Data as if it was analysed with this frame compliance
+
+    Args:
+      compliance (float): frame compliance [um/mN]
+
+    Returns:
+      Accumulator: columns p, pRel, h, S
+    """
+    result = Accumulator(self.data.columns, capacity=len(self.data), compliance=compliance)
+    result.append(p=self.data['p'], pRel=self.data['pRel'], h=self.data['h']-compliance*self.data['p'],
+                  S=1./(1./self.data['S']-compliance))
+    return result
+
+
+  def calibrateStiffness(self, critDepth=0.5, critForce=0.0001, plotStiffness=False, **kwargs):
+    """
+    Calibrate frame compliance: same as Indentation.calibrateStiffness
+
+    Args:
+      critDepth (float): frame stiffness: what is the minimum depth of data used
+      critForce (float): frame stiffness: what is the minimum force used for fitting
+      plotStiffness (bool): plot stiffness graph with compliance
+      kwargs (dict): returnAxis, returnData of Indentation.calibrateStiffness
+
+    Returns:
+      float: frame compliance; or data as chosen by kwargs
+    """
+    self.indentation.tip.compliance = 0.
+    return self.indentation.calibrateStiffness(critDepth=critDepth, critForce=critForce,
+                                               plotStiffness=plotStiffness, data=self.data, **kwargs)
+
+
+  def calibration(self, eTarget=72.0, numPolynomial=3, critDepthStiffness=1.0, critForce=1.0, critDepthTip=0.0,
+                  plotStiffness=False, **kwargs):
+    """
+    Calibrate by first frame-stiffness and then area-function calibration: same as Indentation.calibration
+
+    Args:
+      eTarget (float): target Young's modulus (not reduced), nu is known
+      numPolynomial (int): number of area function polynomial; if None: return interpolation function
+      critDepthStiffness (float): what is the minimum depth of data used
+      critForce (float): frame stiffness: what is the minimum force used for fitting
+      critDepthTip (float): area function what is the minimum depth of data used
+      plotStiffness (bool): plot stiffness graph with compliance
+      kwargs (dict): constantTerm, solver, robust of Indentation.calibration
+
+    Returns:
+      list: contact depth and area; None if frame compliance could not be calibrated
+    """
+    frameCompliance = self.calibrateStiffness(critDepth=critDepthStiffness, critForce=critForce,
+                                              plotStiffness=plotStiffness)
+    if frameCompliance is None:
+      return None
+    return self.indentation.calibrateArea(self.dataAt(frameCompliance), eTarget, numPolynomial, critDepthTip,
+                                          **kwargs)
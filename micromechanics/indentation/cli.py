@@ -0,0 +1,242 @@
+"""Command line: analyse many files in parallel and write one table of results |br|
+run: micromechanics-indent examples/Agilent "data/**/*.zip" --workers 4 --output results.csv
+
+- inputs are files, directories (all files of known type in them and their sub-directories) and glob patterns
+- each file is analysed by a worker process: a file that fails does not stop the others
+- the results of each file are appended to the table as soon as the file is finished
+- timing summary: time of each file and the stages of the analysis of all files, see instrumentation
+"""
+import argparse, contextlib, copy, glob, io, json, os, sys, time, traceback
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from concurrent.futures.process import BrokenProcessPool
+from pathlib import Path
+import pandas as pd
+from .batch import RESULTS, collectResults
+from .instrumentation import Instrumentation
+from .tip import Tip
+
+#extensions of files that Indentation can read
+EXTENSIONS = ['.xls', '.xlsx', '.hld', '.txt', '.zip', '.hdf5']
+#parameters of load-hold-unload identification and unloading fit: None=default of vendor
+PARAMETERS = ['unloadPMax', 'unloadPMin', 'zeroGradDelta']
+#parameters of the identification of load-hold-unload: single tests are identified again if they are given
+SEGMENTATION = ['zeroGradDelta']
+
+
+def findFiles(inputs):
+  """
+  Files of all inputs, each file only once
+
+  Args:
+    inputs (list): file names, directories and glob patterns
+
+  Returns:
+    list: file names, sorted within each input
+  """
+  fileNames = []
+  for item in inputs:
+    if os.path.isdir(item):
+      found = sorted(str(i) for i in Path(item).rglob('*') if i.suffix.lower() in EXTENSIONS and i.is_file())
+    elif os.path.isfile(item):
+      found = [item]
+    else:
+      found = sorted(i for i in glob.glob(item, recursive=True) if os.path.isfile(i))
+      if not found:
+        print('**ERROR micromechanics-indent: no file found for', item, file=sys.stderr)
+    fileNames += [i for i in found if i not in fileNames]
+  return fileNames
+
+
+def analyseFile(fileName, settings):
+  """
+  internal function: open and analyse all tests of one file |br|
+  has to be on module level such that it can be used by a process pool
+
+  Args:
+    fileName (str): file name
+    settings (dict): nuMat, nonMetal, tip and PARAMETERS
+
+  Returns:
+    dict: file name, number of tests, columns of results, failed tests, error of file, wall time, timers and
+    counters
+  """
+  from . import Indentation  #pylint: disable=import-outside-toplevel
+  start = time.perf_counter()
+  rows, failed, error, testNames = None, [], None, []
+  instrumentation = Instrumentation()
+  with contextlib.redirect_stdout(io.StringIO()):
+    try:
+      tip = copy.deepcopy(settings['tip'])  #readers can change the tip, e.g. of Hysitron
+      indentation = Indentation(fileName, nuMat=settings['nuMat'], tip=tip, nonMetal=settings['nonMetal'], verbose=0,
+                                analysisCache=True, instrument=instrumentation)
+      if len(indentation.p)==0:
+        error = 'could not read file'
+      else:
+        for key in PARAMETERS:
+          if settings[key] is not None:
+            setattr(indentation, key, settings[key])
+        if indentation.testList is None:  #single test in file: identify again with parameters
+          testNames = [Path(fileName).name]
+          indentation.testName = testNames[0]
+          segmentsInFile = fileName.lower().endswith('.hld')  #Hysitron: segments from segment times of file
+          if any(settings[key] is not None for key in SEGMENTATION) and not segmentsInFile:
+            indentation.identifyLoadHoldUnload(rate=indentation.filteredRate())  #data is not cleaned again
+        else:
+          testNames = list(indentation.allTestList)
+        rows, failed = collectResults(indentation, testNames)
+    except Exception:  #pylint: disable=broad-except
+      error = traceback.format_exc().splitlines()[-1]
+  return {'file':fileName, 'tests':len(testNames), 'rows':rows, 'failed':failed, 'error':error,
+          'wall':time.perf_counter()-start, 'instrumentation':instrumentation.asDict()}
+
+
+def runFiles(fileNames, settings, workers):
+  """
+  Analyse files by a pool of worker processes: at most two files per worker are queued. If a worker process dies,
+  the files of the pool that were not finished are analysed again, each by its own process, such that only the file
+  that kills its process is reported as failed; then a new pool continues with the remaining files
+
+  Args:
+    fileNames (list): file names
+    settings (dict): see analyseFile
+    workers (int): number of worker processes; 1=run in this process
+
+  Yields:
+    dict: result of analyseFile of each file, in the order the files are finished
+  """
+  if workers==1:
+    for fileName in fileNames:
+      yield analyseFile(fileName, settings)
+    return
+  remaining, suspects = list(reversed(fileNames)), []
+  while remaining or suspects:
+    if suspects:
+      fileName = suspects.pop()
+      with ProcessPoolExecutor(max_workers=1) as pool:
+        try:
+          result = pool.submit(analyseFile, fileName, settings).result()
+        except BrokenProcessPool:
+          result = failedFile(fileName, 'worker process died')
+      yield result
+      continue
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+      running = {}
+      try:
+        while remaining or running:
+          while remaining and len(running)<2*workers:
+            fileName = remaining.pop()
+            running[pool.submit(analyseFile, fileName, settings)] = fileName
+          done, _ = wait(running, return_when=FIRST_COMPLETED)
+          for future in done:
+            fileName = running.pop(future)
+            try:
+              result = future.result()
+            except BrokenProcessPool:
+              running[future] = fileName
+              raise
+            except Exception as error:  #pylint: disable=broad-except
+              result = failedFile(fileName, repr(error))
+            yield result
+      except BrokenProcessPool:
+        suspects = list(running.values())
+  return
+
+
+def failedFile(fileName, error):
+  """
+  internal function: result of a file whose worker failed
+
+  Args:
+    fileName (str): file name
+    error (str): error message
+
+  Returns:
+    dict: same keys as analyseFile
+  """
+  return {'file':fileName, 'tests':0, 'rows':None, 'failed':[], 'error':error, 'wall':0., 'instrumentation':{}}
+
+
+def writeResults(result, fOut, header):
+  """
+  Append results of one file to the table
+
+  Args:
+    result (dict): result of analyseFile
+    fOut (file): opened csv-file
+    header (bool): write header line
+
+  Returns:
+    int: number of rows
+  """
+  if not result['rows'] or not result['rows']['test']:
+    return 0
+  table = pd.DataFrame({'file':result['file'], **result['rows']}, columns=['file', 'test']+RESULTS)
+  table.to_csv(fOut, header=header, index=False)
+  fOut.flush()
+  return len(table)
+
+
+def main(arguments=None):
+  """
+  Command line: analyse files and write results table and timing summary
+
+  Args:
+    arguments (list): command line arguments; None=sys.argv
+
+  Returns:
+    int: exit code: 0=all files analysed, 1=some file or test failed, 2=no file found
+  """
+  parser = argparse.ArgumentParser(prog='micromechanics-indent',
+                                   description='Analyse indentation files by the Oliver-Pharr method')
+  parser.add_argument('inputs', nargs='+', help='files, directories and glob patterns, e.g. "data/**/*.xls"')
+  parser.add_argument('-o', '--output', default='results.csv', help='table of results, one row per segment')
+  parser.add_argument('--timing', help='timing summary as JSON; default: <output>_timing.json')
+  parser.add_argument('-w', '--workers', type=int, default=os.cpu_count(), help='number of worker processes')
+  parser.add_argument('--nuMat', type=float, default=0.3, help="material's Poisson ratio")
+  parser.add_argument('--nonMetal', type=float, default=1., help='1=non-metal, 0=metal')
+  parser.add_argument('--tip', type=float, nargs='+', metavar='PREFACTOR',
+                      help='prefactors of area function of tip; default: perfect Berkovich')
+  parser.add_argument('--compliance', type=float, default=0., help='frame compliance [um/mN]')
+  parser.add_argument('--unloadPMax', type=float, help='fit unloading from this fraction of maximum force')
+  parser.add_argument('--unloadPMin', type=float, help='fit unloading down to this fraction of maximum force')
+  parser.add_argument('--zeroGradDelta', type=float, help='force rate that separates hold from load and unload')
+  options = parser.parse_args(arguments)
+
+  fileNames = findFiles(options.inputs)
+  if not fileNames:
+    print('**ERROR micromechanics-indent: no files', file=sys.stderr)
+    return 2
+  tip = Tip(shape=list(options.tip) if options.tip else 'perfect', compliance=options.compliance)
+  settings = {'nuMat':options.nuMat, 'nonMetal':options.nonMetal, 'tip':tip,
+              **{key:getattr(options, key) for key in PARAMETERS}}
+  workers = max(1, min(options.workers or 1, len(fileNames)))
+  timingFile = options.timing or str(Path(options.output).with_suffix(''))+'_timing.json'
+  instrumentation = Instrumentation()
+  summary, numberRows, start = [], 0, time.perf_counter()
+  with open(options.output, 'w', encoding='utf-8', newline='') as fOut:
+    for result in runFiles(fileNames, settings, workers):
+      numberRows += writeResults(result, fOut, header=numberRows==0)
+      instrumentation.merge(result['instrumentation'])
+      analysed = len(set(result['rows']['test'])) if result['rows'] else 0
+      summary.append({'file':result['file'], 'tests':result['tests'], 'analysed':analysed,
+                      'failed':[list(i) for i in result['failed']], 'error':result['error'], 'wall':result['wall']})
+      status = f"FAILED: {result['error']}" if result['error'] else \
+               f"{analysed} of {result['tests']} tests with results"+\
+               (f", {len(result['failed'])} failed" if result['failed'] else '')
+      print(f"{result['file']:<60} {result['wall']:8.2f}s  {status}", flush=True)
+  wall = time.perf_counter()-start
+  failedFiles = [i['file'] for i in summary if i['error']]
+  failedTests = sum(len(i['failed']) for i in summary)
+  with open(timingFile, 'w', encoding='utf-8') as fJson:
+    json.dump({'wall':wall, 'workers':workers, 'files':len(summary), 'failedFiles':failedFiles,
+               'failedTests':failedTests, 'rows':numberRows, 'perFile':summary, **instrumentation.asDict()},
+              fJson, indent=2)
+  print(f'\n{len(summary)} files, {len(failedFiles)} failed, {failedTests} tests failed, {numberRows} rows in '
+        f'{options.output}; {wall:.2f}s with {workers} workers')
+  print(instrumentation)
+  print('Timing summary:', timingFile)
+  return 1 if failedFiles or failedTests else 0
+
+
+if __name__ == '__main__':
+  sys.exit(main())
@@ -0,0 +1,232 @@
+"""Export results of the analysis as typed columns: Parquet (requires pyarrow) or HDF5; write-back into HDF5 files"""
+import os, json
+from pathlib import Path
+import h5py
+import numpy as np
+import pandas as pd
+from .definitions import Vendor
+from .cache import jsonDefault, ARRAYS
+
+GROUP = 'post_test_analysis/com_github_micromechanics/results'   #HDF5 group of results
+ANALYSIS = 'post_test_analysis/com_github_micromechanics/analysis'  #HDF5 group of write-back: one group per test
+#columns of exported table and their types: same keys as saveToUserMeta
+COLUMNS = {'file':str, 'test':str, 'segment':np.int64, 'S_mN/um':np.float64, 'hMax_um':np.float64,
+           'pMax_mN':np.float64, 'modulusRed_GPa':np.float64, 'A_um2':np.float64, 'hc_um':np.float64,
+           'E_GPa':np.float64, 'H_GPa':np.float64, 'k2p':np.float64}
+
+
+def resultsTable(self):
+  """
+  Results of the current test: one row per unloading segment, or per point of CSM measurements
+
+  Returns:
+    pandas.DataFrame: typed columns, see COLUMNS
+  """
+  if not hasattr(self, 'modulus'):
+    print("**ERROR resultsTable: analyse test first")
+    return None
+  number = len(self.slope)
+  return pd.DataFrame({'file':[str(self.fileName)]*number, 'test':[str(self.testName)]*number,
+                       'segment':np.arange(1, number+1, dtype=np.int64),
+                       'S_mN/um':self.slope, 'hMax_um':self.h[self.valid], 'pMax_mN':self.p[self.valid],
+                       'modulusRed_GPa':self.modulusRed, 'A_um2':self.Ac, 'hc_um':self.hc,
+                       'E_GPa':self.modulus, 'H_GPa':self.hardness, 'k2p':self.k2p},
+                      columns=list(COLUMNS)).astype(COLUMNS)
+
+
+def exportResults(self, fileName, results=None, append=True):
+  """
+  Export results to Parquet file (.parquet) or HDF5 file (.hdf5, .h5) |br|
+  HDF5: group post_test_analysis/com_github_micromechanics/results, one dataset per column; this can be
+  the HDF5 file that is analysed
+
+  Args:
+    fileName (str): file name
+    results (pandas.DataFrame): results, e.g. of analyseAll; default: results of current test
+    append (bool): append to results in file; else replace them
+
+  Returns:
+    bool: success
+  """
+  if results is None:
+    results = self.resultsTable()
+    if results is None:
+      return False
+  table = pd.DataFrame(results).copy()
+  if 'file' not in table:
+    table['file'] = str(self.fileName)
+  if 'k2p' not in table:
+    table['k2p'] = table['S_mN/um']**2/table['pMax_mN']
+  missing = [i for i in COLUMNS if i not in table]
+  if missing:
+    print("**ERROR exportResults: columns missing", missing)
+    return False
+  table = table[list(COLUMNS)].astype(COLUMNS)
+  meta = {str(self.fileName): {'vendor':self.vendor.name, 'metaVendor':self.metaVendor,
+                               'measurementType':self.metaUser.get('measurementType'),
+                               'prefactors':self.tip.prefactors, 'compliance':self.tip.compliance,
+                               'nuMat':self.nuMat, 'nuTip':self.nuTip, 'modulusTip':self.modulusTip}}
+  suffix = Path(fileName).suffix
+  if suffix=='.parquet':
+    return exportParquet(fileName, table, meta, append)
+  if suffix in ['.hdf5', '.h5']:
+    if self.vendor==Vendor.CommonHDF5 and os.path.abspath(fileName)==os.path.abspath(self.fileName):
+      return exportHDF5(self.writableDatafile(), table, meta, append)
+    with h5py.File(fileName, mode='a') as fOut:
+      return exportHDF5(fOut, table, meta, append)
+  print("**ERROR exportResults: unknown file type", suffix)
+  return False
+
+
+def exportParquet(fileName, table, meta, append):
+  """
+  internal function: write table to Parquet file; meta data is saved in the schema
+
+  Args:
+    fileName (str): file name
+    table (pandas.DataFrame): typed results
+    meta (dict): meta data of analysed files
+    append (bool): append to existing file
+
+  Returns:
+    bool: success
+  """
+  try:
+    import pyarrow as pa            #pylint: disable=import-outside-toplevel
+    import pyarrow.parquet as pq    #pylint: disable=import-outside-toplevel
+  except ImportError:
+    print("**ERROR exportResults: pyarrow is required for parquet files")
+    return False
+  newTable = pa.Table.from_pandas(table, preserve_index=False).replace_schema_metadata(None)
+  if append and os.path.exists(fileName):
+    oldTable = pq.read_table(fileName)
+    oldMeta = oldTable.schema.metadata or {}
+    meta = {**json.loads(oldMeta.get(b'com_github_micromechanics', b'{}')), **meta}
+    oldTable = oldTable.replace_schema_metadata(None)
+    if oldTable.schema!=newTable.schema:
+      print("**ERROR exportResults: columns of file differ", fileName)
+      return False
+    newTable = pa.concat_tables([oldTable, newTable])
+  newTable = newTable.replace_schema_metadata({'com_github_micromechanics':json.dumps(meta, default=jsonDefault)})
+  fileTemp = f'{fileName}.{os.getpid()}.tmp'
+  pq.write_table(newTable, fileTemp)
+  os.replace(fileTemp, fileName)
+  return True
+
+
+def exportHDF5(fOut, table, meta, append):
+  """
+  internal function: write table to group of HDF5 file, columns are resizable datasets
+
+  Args:
+    fOut (h5py.File): file opened for writing
+    table (pandas.DataFrame): typed results
+    meta (dict): meta data of analysed files
+    append (bool): append to existing results
+
+  Returns:
+    bool: success
+  """
+  if GROUP in fOut and not append:
+    del fOut[GROUP]
+  if GROUP in fOut:
+    group = fOut[GROUP]
+    if json.loads(group.attrs['columns'])!=list(table.columns):
+      print("**ERROR exportResults: columns of file differ", fOut.filename)
+      return False
+    meta = {**json.loads(group.attrs['meta']), **meta}
+  else:
+    group = fOut.create_group(GROUP)
+    group.attrs['columns'] = json.dumps(list(table.columns))
+    for idx, (key, dtype) in enumerate(COLUMNS.items()):
+      dtype = h5py.string_dtype() if dtype is str else dtype
+      group.create_dataset(f'column_{idx}', shape=(0,), maxshape=(None,), chunks=True, dtype=dtype)
+  group.attrs['meta'] = json.dumps(meta, default=jsonDefault)
+  for idx, key in enumerate(table.columns):
+    dataset = group[f'column_{idx}']
+    start = dataset.shape[0]
+    dataset.resize((start+len(table),))
+    values = table[key].to_numpy()
+    dataset[start:] = values.astype(object) if COLUMNS[key] is str else values
+  return True
+
+
+def loadResults(fileName):
+  """
+  Load results that were exported by exportResults
+
+  Args:
+    fileName (str): Parquet or HDF5 file
+
+  Returns:
+    pandas.DataFrame: results; None if file does not contain results
+  """
+  if Path(fileName).suffix=='.parquet':
+    try:
+      import pyarrow.parquet as pq  #pylint: disable=import-outside-toplevel
+    except ImportError:
+      print("**ERROR loadResults: pyarrow is required for parquet files")
+      return None
+    return pq.read_table(fileName).to_pandas()
+  with h5py.File(fileName, mode='r') as fIn:
+    if GROUP not in fIn:
+      print("**ERROR loadResults: no results in file", fileName)
+      return None
+    group = fIn[GROUP]
+    columns = json.loads(group.attrs['columns'])
+    table = {key:group[f'column_{idx}'].asstr()[()] if group[f'column_{idx}'].dtype.kind=='O' else
+             group[f'column_{idx}'][()] for idx, key in enumerate(columns)}
+  return pd.DataFrame(table, columns=columns)
+
+
+def writableDatafile(self):
+  """
+  internal function: analysed HDF5 file, which is opened read-only, is reopened for writing
+
+  Returns:
+    h5py.File: file opened for writing
+  """
+  if self.datafile.mode!='r+':
+    self.datafile.close()
+    self.datafile = h5py.File(self.fileName, mode='r+')
+  return self.datafile
+
+
+def readAnalysisHDF5(self, key):
+  """
+  internal function: results written back into HDF5 file, if the test and the parameters did not change
+
+  Args:
+    key (str): hash of test and parameters, see analysisHash
+
+  Returns:
+    dict: results of analyse; None if not in file
+  """
+  path = f'{ANALYSIS}/{self.testName}'
+  if path not in self.datafile or self.datafile[path].attrs.get('hash')!=key:
+    return None
+  branch = self.datafile[path]
+  return {name:branch[name][()] for name in list(ARRAYS)+['iLHU']}
+
+
+def writeAnalysisHDF5(self, key, results):
+  """
+  internal function: write results of current test back into HDF5 file
+
+  Args:
+    key (str): hash of test and parameters, see analysisHash
+    results (dict): results of analyse
+  """
+  datafile = self.writableDatafile()
+  path = f'{ANALYSIS}/{self.testName}'
+  if path in datafile:
+    del datafile[path]
+  branch = datafile.create_group(path)
+  for name in ARRAYS:
+    branch.create_dataset(name, data=results[name], chunks=True, compression='gzip')
+  branch.create_dataset('iLHU', data=results['iLHU'])
+  if self.surfaceIdx is not None:
+    branch.attrs['surfaceIdx'] = self.surfaceIdx
+  branch.attrs['hash'] = key
+  datafile.flush()
+  return
@@ -0,0 +1,95 @@
+"""Filters of 1-D signals, e.g. force and force-rate: the running median can use different backends"""
+import numpy as np
+from scipy import ndimage, signal
+from scipy.ndimage import gaussian_filter1d
+
+#backends of the running median: all give identical results, zero padded at both ends
+BACKENDS = ['numpy', 'ndimage', 'signal']
+
+
+def medianFilter(value, size, backend='numpy'):
+  """
+  Running median of 1-D signal, identical to scipy.signal.medfilt
+
+  - numpy: selection network of minima and maxima for size 3 and 5, which are used most; else ndimage
+  - ndimage: scipy.ndimage.median_filter, time grows slowly with size
+  - signal: scipy.signal.medfilt, slow for large sizes in older versions of scipy
+
+  Args:
+    value (numpy.array): signal
+    size (int): odd length of window
+    backend (str): one of BACKENDS
+
+  Returns:
+    numpy.array: filtered signal
+  """
+  value = np.asarray(value, dtype=np.float64)
+  if backend=='numpy' and size in (3,5) and len(value)>=size and not np.isnan(value).any():
+    return medianNetwork(value, size)
+  if backend in ('numpy', 'ndimage'):
+    return ndimage.median_filter(value, size=size, mode='constant', cval=0.)
+  if backend!='signal':
+    print("**ERROR medianFilter: unknown backend", backend)
+  return signal.medfilt(value, size)
+
+
+def medianNetwork(value, size):
+  """
+  internal function: running median of 3 or 5 values by minima and maxima of shifted signals |br|
+  median5 = median3(e, max(min(a,b),min(c,d)), min(max(a,b),max(c,d))); only for signals without nan
+
+  Args:
+    value (numpy.array): signal
+    size (int): 3 or 5
+
+  Returns:
+    numpy.array: filtered signal
+  """
+  padded = np.zeros(len(value)+size-1)
+  padded[size//2:len(value)+size//2] = value
+  if size==3:
+    first, center, last = padded[:-2], padded[1:-1], padded[2:]
+  else:
+    first, second, center, third, last = padded[:-4], padded[1:-3], padded[2:-2], padded[3:-1], padded[4:]
+    lower = np.minimum(first, second)
+    np.maximum(lower, np.minimum(center, third), out=lower)    #largest of the two smaller ones
+    upper = np.maximum(first, second)
+    np.minimum(upper, np.maximum(center, third), out=upper)    #smallest of the two larger ones
+    first, center = lower, upper
+  #median of three
+  result = np.minimum(first, center)
+  np.maximum(result, np.minimum(np.maximum(first, center), last), out=result)
+  return result
+
+
+def signalStep(value, step, coordinate=None, backend='numpy'):
+  """
+  internal function: one operation of derivedSignal
+
+  Args:
+    value (numpy.array): signal
+    step (tuple): operation and its argument
+    coordinate (numpy.array): data of gradient
+    backend (str): backend of median filter, see BACKENDS
+
+  Returns:
+    numpy.array: new signal
+  """
+  if step[0]=='gradient':
+    return np.gradient(value, coordinate)
+  if step[0]=='abs':
+    return np.abs(value)
+  if step[0]=='interpolate nan':  #interpolate nan with neighboring values
+    nans = np.isnan(value)
+    value = np.array(value)
+    value[nans]= np.interp(nans.nonzero()[0], (~nans).nonzero()[0], value[~nans])
+    return value
+  if step[0]=='median filter':
+    return medianFilter(value, step[1], backend)
+  if step[0]=='gauss filter':
+    return gaussian_filter1d(value, step[1])
+  if step[0]=='butterfilter':
+    valueB, valueA = signal.butter(*step[1])
+    return signal.filtfilt(valueB, valueA, value)
+  print("**ERROR derivedSignal: unknown operation", step)
+  return value
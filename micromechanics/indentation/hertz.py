@@ -51,7 +51,7 @@ def hertzFit(self, forceRange=(1, 25), correctH=True, plot=True):
     plt.xlim([depthRange[0]-0.01,depthRange[1]+0.01])
     plt.show()
   if correctH:
-    self.h -= fitElast[0]
+    self.h = self.h - fitElast[0]
   return fitElast
 
 
@@ -128,5 +128,5 @@ def popIn(self, correctH=True, plot=True, removeInitialNM=2.):
     ax1.set_ylim(top=4.*self.p[iJump], bottom=0)
     plt.show()
   if correctH:
-    self.h -= certainty["h0"]
+    self.h = self.h - certainty["h0"]
   return fPopIn, certainty
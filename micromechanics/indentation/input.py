@@ -1,13 +1,22 @@
 """All instrument specific input functions"""
 import io, re, json
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from itertools import islice
 from pathlib import Path
 from zipfile import ZipFile
 import h5py
+import xlrd
 import numpy as np
 import matplotlib.pyplot as plt
 import pandas as pd
 from .definitions import Method, Vendor
+from .testData import TestData
+from .accumulator import Accumulator
+from .instrumentation import instrumented
 
+@instrumented(probe=True)
 def loadAgilent(self, fileName):
   """
   Initialize G200 excel file for processing
@@ -21,20 +30,17 @@ def loadAgilent(self, fileName):
   self.testList = []
   self.fileName = fileName    #one file can have multiple tests
   self.indicies = {}
-  found_required_input=False
+  self.datafile = LazyWorkbook(fileName, self.sheetCacheSize)  #only sheet names are read
   required_input_sheet_name_list=['Required Inputs', 'Pre-Test Inputs']
   for required_input_sheet_name in required_input_sheet_name_list:
-    try:
-      workbook = pd.read_excel(fileName,sheet_name=required_input_sheet_name)
-    except:
-      print('%s was not found'%required_input_sheet_name)
-    else:
+    if required_input_sheet_name in self.datafile.keys():
+      workbook = self.datafile.get(required_input_sheet_name)
       print('%s was found'%required_input_sheet_name)
       break
+    print('%s was not found'%required_input_sheet_name)
   self.metaVendor.update( dict(workbook.iloc[-1]) )
   if 'Poissons Ratio' in self.metaVendor and self.metaVendor['Poissons Ratio']!=self.nuMat and self.verbose>0:
     print("*WARNING*: Poisson Ratio different than in file.",self.nuMat,self.metaVendor['Poissons Ratio'])
-  self.datafile = pd.read_excel(fileName, sheet_name=None)
   tagged = []
   code = {"Load On Sample":"p", "Force On Surface":"p", "LOAD":"p"\
         ,"_Load":"pRaw", "Raw Load":"pRaw","Force":"pRaw","Load":"pRaw"\
@@ -73,12 +79,11 @@ def loadAgilent(self, fileName):
       Number_dfName+=1
       progressBar_Value=int((Number_dfName)/(2*len(self.datafile.keys()))*100)
       self.progressBar_HE.setValue(progressBar_Value)
-    df    = self.datafile.get(dfName)
     if "Test " in dfName and not "Tagged" in dfName and not "Test Inputs" in dfName:
       self.testList.append(dfName)
       #print "  I should process sheet |",sheet.name,"|"
       if len(self.indicies)==0:               #find index of colums for load, etc
-        for cell in df.columns:
+        for cell in self.datafile.get(dfName).columns:
           if cell in code:
             self.indicies[code[cell]] = cell
             if self.verbose>2:
@@ -127,56 +132,133 @@ def nextAgilentTest(self, newTest=True, **kwargs):
   if len(self.testList)==0: return False   #no sheet left
   if newTest:
     self.testName = self.testList.pop(0)
+  self.setTestData(self.readTest(self.testName), identify=False)
+  #  now all fields (incl. p) are full and defined
+
+  # self.identifyLoadHoldUnload(plot=True)
+  self.identifyLoadHoldUnload(plot=plot_identifyLoadHoldUnload)
+  if self.onlyLoadingSegment and self.method==Method.CSM:
+    # print("Length test",len(self.valid), len(self.h[self.valid]), len(self.p[self.valid])  )
+    iMin, iMax = 2, self.iLHU[0][1]
+    self.valid = np.array(self.valid)
+    self.valid[iMax:] = False
+    self.valid[:iMin] = False
+    self.slope = self.slope[iMin:np.sum(self.valid)+iMin]
 
+  #evaluate missing
+  if not "k2p" in self.indicies and 'slope' in self.indicies:
+    self.k2p = self.slope * self.slope / self.p[self.valid]
+  return True
+
+
+@instrumented
+def readAgilentTest(self, testName):
+  """
+  Read one sheet of the worksheet: identify valid data points and convert units
+
+  Args:
+    testName (str): name of sheet
+
+  Returns:
+    TestData: data of this test
+  """
   #read data and identify valid data points
-  df     = self.datafile.get(self.testName)
+  df     = self.datafile.get(testName)
   h       = np.array(df[self.indicies['h'    ]][1:-1], dtype=np.float64)
   validFull = np.isfinite(h)
   if 'slope' in self.indicies:
     slope   = np.array(df[self.indicies['slope']][1:-1], dtype=np.float64)
-    self.valid =  np.isfinite(slope)
-    self.valid[self.valid] = slope[self.valid] > 0.0  #only valid points if stiffness is positiv
+    valid =  np.isfinite(slope)
+    valid[valid] = slope[valid] > 0.0  #only valid points if stiffness is positiv
   else:
-    self.valid = validFull
+    valid = validFull
   for index in self.indicies:
     data = np.array(df[self.indicies[index]][1:-1], dtype=np.float64)
     mask = np.isfinite(data)
     mask[mask] = data[mask]<1e99
-    self.valid = np.logical_and(self.valid, mask)                       #adopt/reduce mask continously
+    valid = np.logical_and(valid, mask)                       #adopt/reduce mask continously
 
   #Run through all items again and crop to only valid data
+  channels = {}
   for index in self.indicies:
     data = np.array(df[self.indicies[index]][1:-1], dtype=np.float64)
     if not index in self.fullData:
-      data = data[self.valid]
+      data = data[valid]
     else:
       data = data[validFull]
-    setattr(self, index, data)
+    channels[index] = data
+  valid = valid[validFull]
 
-  self.valid = self.valid[validFull]
-  #  now all fields (incl. p) are full and defined
+  #correct units
+  channels['h'] /= 1.e3 #from nm in um
+  if "Ac" in channels          : channels['Ac'] /= 1.e6  #from nm in um
+  if "slope" in channels       : channels['slope'] /= 1.e3 #from N/m in mN/um
+  if "slopeSupport" in channels: channels['slopeSupport'] /= 1.e3 #from N/m in mN/um
+  if 'hc' in channels          : channels['hc'] /= 1.e3  #from nm in um
+  if 'hRaw' in channels        : channels['hRaw'] /= 1.e3  #from nm in um
+  return TestData(testName, channels.pop('t'), channels.pop('h'), channels.pop('p'), valid,
+                  slope=channels.pop('slope', None), **channels)
 
-  # self.identifyLoadHoldUnload(plot=True)
-  self.identifyLoadHoldUnload(plot=plot_identifyLoadHoldUnload)
-  if self.onlyLoadingSegment and self.method==Method.CSM:
-    # print("Length test",len(self.valid), len(self.h[self.valid]), len(self.p[self.valid])  )
-    iMin, iMax = 2, self.iLHU[0][1]
-    self.valid[iMax:] = False
-    self.valid[:iMin] = False
-    self.slope = self.slope[iMin:np.sum(self.valid)+iMin]
 
-  #correct data and evaluate missing
-  self.h /= 1.e3 #from nm in um
-  if "Ac" in self.indicies         : self.Ac /= 1.e6  #from nm in um
-  if "slope" in self.indicies       : self.slope /= 1.e3 #from N/m in mN/um
-  if "slopeSupport" in self.indicies: self.slopeSupport /= 1.e3 #from N/m in mN/um
-  if 'hc' in self.indicies         : self.hc /= 1.e3  #from nm in um
-  if 'hRaw' in self.indicies        : self.hRaw /= 1.e3  #from nm in um
-  if not "k2p" in self.indicies and 'slope' in self.indicies:
-    self.k2p = self.slope * self.slope / self.p[self.valid]
-  return True
+class LazyWorkbook:
+  """
+  Excel workbook whose sheets are only parsed when they are used
 
+  - on opening only the sheet names are read
+  - the most recently used sheets are kept as pandas.DataFrame
+  """
+  def __init__(self, fileName, cacheSize=4):
+    """
+    Open workbook
+
+    Args:
+      fileName (str): file name (.xls or .xlsx)
+      cacheSize (int): number of parsed sheets that are kept in memory
+    """
+    if fileName.endswith('.xls'):
+      #xlrd only parses sheets that are used
+      self.workbook = pd.ExcelFile(xlrd.open_workbook(fileName, on_demand=True), engine='xlrd')
+    else:
+      self.workbook = pd.ExcelFile(fileName)
+    self.cacheSize = cacheSize
+    self.sheets = OrderedDict()
+    return
+
+
+  def keys(self):
+    """
+    Names of all sheets
+
+    Returns:
+      list: sheet names
+    """
+    return self.workbook.sheet_names
 
+
+  def get(self, sheetName):
+    """
+    Get one sheet: parse it, if it is not in memory
+
+    Args:
+      sheetName (str): name of sheet
+
+    Returns:
+      pandas.DataFrame: content of sheet
+    """
+    if sheetName in self.sheets:
+      self.sheets.move_to_end(sheetName)
+      return self.sheets[sheetName]
+    df = self.workbook.parse(sheetName)
+    if isinstance(self.workbook.book, xlrd.Book):
+      self.workbook.book.unload_sheet(sheetName)
+    if self.cacheSize>0:
+      self.sheets[sheetName] = df
+      if len(self.sheets)>self.cacheSize:
+        self.sheets.popitem(last=False)
+    return df
+
+
+@instrumented(probe=True)
 def loadHysitron(self, fileName, plotContact=False):
   """
   Load Hysitron hld or txt file for processing, only contains one test
@@ -189,7 +271,6 @@ def loadHysitron(self, fileName, plotContact=False):
     bool: success
 
   """
-  from io import StringIO
   self.fileName = fileName
   with open(self.fileName, 'r',encoding='iso-8859-1') as inFile:
     #### HLD FILE ###
@@ -240,30 +321,22 @@ def loadHysitron(self, fileName, plotContact=False):
       segmentPoints = np.array(segmentPoints)
       segmentTime   = np.array(segmentTime)
 
-      #read approach data
+      #skip approach data: not used
       line = inFile.readline() #Time_s  MotorDisp_mm    Piezo Extension_nm"
-      data = ""
-      for idx in range(int(value)):
-        data +=inFile.readline()
+      deque(islice(inFile, int(value)), maxlen=0)
 
       #read drift data
       value = inFile.readline().split(":")[1]
       line = inFile.readline()  #Time_s	Disp_nm",value
-      data = ""
-      for idx in range(int(value)):
-        data +=inFile.readline()
-      if len(data)>1:
-        self.dataDrift = np.loadtxt( StringIO(str(data))  )
+      if int(value)>0:
+        self.dataDrift = readBlock(inFile, int(value))
         self.dataDrift[:,1] /= 1.e3  #into um
 
       #read test data
       #Time_s	Disp_nm	Force_uN	LoadCell_nm	PiezoDisp_nm	Disp_V	Force_V	Piezo_LowV
       value = inFile.readline().split(":")[1]
       line = inFile.readline()
-      data = ""
-      for idx in range(int(value)):
-        data +=inFile.readline()
-      dataTest = np.loadtxt( StringIO(str(data))  )
+      dataTest = readBlock(inFile, int(value))
       #store data
       self.t = dataTest[:,0]
       self.h = dataTest[:,1]/1.e3
@@ -358,10 +431,33 @@ def loadHysitron(self, fileName, plotContact=False):
     ## self.t -= self.t[idx] #do not offset time since segment times are given
     self.h -= hZero
     self.p -= pZero
+  self.setTestData(TestData(self.testName, self.t, self.h, self.p, self.valid, iLHU=self.iLHU, iDrift=self.iDrift))
   return True
 
 
+def readBlock(inFile, numLines):
+  """
+  internal function: read block of known number of lines of numbers into array, all numbers at once
 
+  Args:
+    inFile (file): open text file, positioned at start of block
+    numLines (int): number of lines of block
+
+  Returns:
+    numpy.array: one row per line
+  """
+  lines = list(islice(inFile, numLines))
+  numColumns = len(lines[0].split()) if lines else 0
+  try:
+    data = np.array(''.join(lines).split(), dtype=np.float64)
+    if numColumns>0 and len(data)==numColumns*len(lines):
+      return data.reshape((len(lines), numColumns))
+  except ValueError:
+    pass
+  return np.loadtxt(io.StringIO(''.join(lines)), ndmin=2)  #slow path: e.g. empty lines
+
+
+@instrumented(probe=True)
 def loadMicromaterials(self, fileName):
   """
   Load Micromaterials txt/zip file for processing, contains only one test
@@ -384,11 +480,7 @@ def loadMicromaterials(self, fileName):
       if self.verbose>1:
         print("Is not a Micromaterials file")
       return False
-    self.t = dataTest[:,0]
-    self.h = dataTest[:,1]/1.e3
-    self.p = dataTest[:,2]
-    self.valid = np.ones_like(self.t, dtype=bool)
-    self.identifyLoadHoldUnload()
+    self.setTestData(TestData(self.testName, dataTest[:,0], dataTest[:,1]/1.e3, dataTest[:,2]))
   elif fileName.endswith('.zip'):
     #if zip-archive of multilpe files: datafile has to remain open
     #    next pylint statement for github actions
@@ -418,12 +510,94 @@ def nextMicromaterialsTest(self):
   if len(self.testList)==0: #no sheet left
     return False
   self.testName = self.testList.pop(0)
-  myFile = self.datafile.open(self.testName)
-  txt = io.TextIOWrapper(myFile, encoding="utf-8")
-  success = self.loadMicromaterials(txt)
-  return success
+  return self.setTestData(self.readTest(self.testName))
+
+
+@instrumented
+def readMicromaterialsTest(self, testName):
+  """
+  Read one file of zip-archive: if prefetch is used, the following files are read in the background
 
+  Args:
+    testName (str): name of file in zip-archive
+
+  Returns:
+    TestData: data of this test
+  """
+  if self.prefetch==0:
+    return decodeMicromaterialsTest(self.datafile, testName)
+  if self.prefetchPool is None:
+    self.prefetchPool = ThreadPoolExecutor(max_workers=self.prefetch)
+  future = self.prefetchFutures.pop(testName, None)
+  #bounded read-ahead: files that follow in test list; drop others, e.g. after loadTest
+  upcoming = [i for i in self.testList if i!=testName][:self.prefetch]
+  for name in list(self.prefetchFutures):
+    if name not in upcoming:
+      self.prefetchFutures.pop(name).cancel()
+  for name in upcoming:
+    if name not in self.prefetchFutures:
+      self.prefetchFutures[name] = self.prefetchPool.submit(decodeMicromaterialsTest, self.datafile, name)
+  data = decodeMicromaterialsTest(self.datafile, testName) if future is None else future.result()
+  if not upcoming:  #last test: threads are not needed anymore
+    self.stopPrefetch()
+  return data
+
+
+def stopPrefetch(self):
+  """
+  internal function: cancel reading ahead and stop the background threads; they are started again when needed
+  """
+  for future in self.prefetchFutures.values():
+    future.cancel()
+  self.prefetchFutures = {}
+  if self.prefetchPool is not None:
+    self.prefetchPool.shutdown(wait=True)
+    self.prefetchPool = None
+  return
+
+
+def decodeMicromaterialsTest(datafile, testName):
+  """
+  internal function: read one file of zip-archive |br|
+  does not change the indentation object such that it can be used by background threads
 
+  Args:
+    datafile (ZipFile): zip-archive
+    testName (str): name of file in zip-archive
+
+  Returns:
+    TestData: data of this test
+  """
+  with datafile.open(testName) as myFile:
+    dataTest = np.loadtxt(io.TextIOWrapper(myFile, encoding="utf-8"))
+  return TestData(testName, dataTest[:,0], dataTest[:,1]/1.e3, dataTest[:,2])
+
+
+def readAllMicromaterialsTests(self, workers=None):
+  """
+  Read all files of zip-archive in parallel into one columnar store; the current test is not changed |br|
+  data of test k: store['h'][store.info['offsets'][k]:store.info['offsets'][k+1]]
+
+  Args:
+    workers (int): number of threads; None=number of CPUs
+
+  Returns:
+    Accumulator: columns t, h, p of all tests; info contains names and offsets of tests
+  """
+  if self.vendor!=Vendor.Micromaterials or not hasattr(self, 'allTestList'):
+    print("**ERROR readAllMicromaterialsTests: only for Micromaterials zip-archives")
+    return None
+  with ThreadPoolExecutor(max_workers=workers) as pool:
+    records = list(pool.map(decodeMicromaterialsTest, [self.datafile]*len(self.allTestList), self.allTestList))
+  offsets = np.cumsum([0]+[len(i.t) for i in records])
+  store = Accumulator(['t','h','p'], capacity=int(offsets[-1]), names=list(self.allTestList),
+                      offsets=offsets.tolist())
+  for record in records:
+    store.append(t=record.t, h=record.h, p=record.p)
+  return store
+
+
+@instrumented(probe=True)
 def loadFischerScope(self,fileName):
   """
   Initialize txt-file from Fischer-Scope for processing
@@ -438,10 +612,9 @@ def loadFischerScope(self,fileName):
           'work elastic':[], 'work nonelastic':[], 'EIT/(1-vs^2) [GPa]':[], 'HIT [N/mm]':[],
           'HUpl [N/mm]': [], 'hr [um]':[], 'hmax [um]':[], 'Compliance [um/N]':[],
           'epsilon':[], 'fit range': []}
-  self.workbook = []
+  self.workbook = []                       #text of numeric block of each test: decoded when read
   self.testList = []
   self.fileName = fileName
-  block = None
   with open(fileName,'r',encoding='iso-8859-1') as fIn:
     # read initial lines and initialialize
     line = fIn.readline()
@@ -454,24 +627,14 @@ def loadFischerScope(self,fileName):
     self.metaVendor['Indent_F'] = ' '.join( fIn.readline().split()[2:] )
     self.metaVendor['Indent_C'] = ' '.join( fIn.readline().split()[2:] )
     self.metaVendor['Indent_R'] = ' '.join( fIn.readline().split()[2:] )
-    #read all lines after initial lines
-    for line in fIn:
-      pattern = identifier+r"   \d\d\.\d\d\.\d\d\d\d  \d\d:\d\d:\d\d"
-      dataInLine = line.replace(',','.').split()
-      dataInLine = [float(item) if isfloat(item) else None for item in dataInLine]
-      if re.match(pattern, line) is not None:
-        ## finish old individual measurement
-        if block is not None:
-          if np.array(block).shape[1]==5:
-            df = pd.DataFrame(np.array(block), columns=['F','h','t','HMu','HM'] )
-          else:
-            df = pd.DataFrame(np.array(block), columns=['F','h','t'] )
-          self.workbook.append(df)
-        ## start new  individual measurement
-        block = []
-        self.metaVendor['date'] += [' '.join(line.split()[-2:])]
-        self.testList.append('_'.join(line.split()[-2:]))
-      elif line.startswith('Indenter shape correction:'):
+    text = fIn.read()
+  #index tests and read their meta data: numeric blocks are not converted
+  for date, metaLines, block in fischerScopeTests(text, identifier):
+    self.metaVendor['date'] += [date]
+    self.testList.append(date.replace(' ','_'))
+    self.workbook.append(block)
+    for line in metaLines:
+      if line.startswith('Indenter shape correction:'):
         self.metaVendor['shape correction'] += [line.split()[-1]]
       elif 'x=  ' in line and 'y=  ' in line:
         self.metaVendor['coordinate x'] += [float(line.split()[1])]
@@ -480,33 +643,26 @@ def loadFischerScope(self,fileName):
         self.metaVendor['work elastic'] += [line.split()[-1]]
       elif line.startswith('Wr	['):
         self.metaVendor['work nonelastic'] += [line.split()[-1]]
-      elif line.startswith('EIT/(1-vs^2)	[GPa]') and not line.endswith('------\n'):
+      elif line.startswith('EIT/(1-vs^2)	[GPa]') and not line.endswith('------'):
         self.metaVendor['EIT/(1-vs^2) [GPa]'] += [float(line.split()[-1])]
-      elif line.startswith('HIT	[N/mm') and not line.endswith('------\n'):
+      elif line.startswith('HIT	[N/mm') and not line.endswith('------'):
         self.metaVendor['HIT [N/mm]'] += [float(line.split()[-1])]
-      elif line.startswith('HUpl	[N/mm') and not line.endswith('------\n'):
+      elif line.startswith('HUpl	[N/mm') and not line.endswith('------'):
         self.metaVendor['HUpl [N/mm]'] += [float(line.split()[-1])]
-      elif line.startswith('hr	[') and not line.endswith('------\n'):
+      elif line.startswith('hr	[') and not line.endswith('------'):
         self.metaVendor['hr [um]'] += [float(line.split()[-1])]
-      elif line.startswith('hmax	[') and not line.endswith('------\n'):
+      elif line.startswith('hmax	[') and not line.endswith('------'):
         self.metaVendor['hmax [um]'] += [float(line.split()[-1])]
-      elif line.startswith('Compliance	[') and not line.endswith('------\n'):
+      elif line.startswith('Compliance	[') and not line.endswith('------'):
         self.metaVendor['Compliance [um/N]'] += [float(line.split()[-1])]
       elif 'Epsilon =' in line:
         self.metaVendor['epsilon'] += [float(line.split()[-1])]
         self.metaVendor['fit range'] += [' '.join(line.split()[:-3])]
-      elif ( len(dataInLine)==3 or len(dataInLine)==5 ) and not None in dataInLine:
-        block.append( dataInLine )
-    ## add last dataframe
-    if np.array(block).shape[1]==5:
-      df = pd.DataFrame(np.array(block), columns=['F','h','t','HMu','HM'] )
-    else:
-      df = pd.DataFrame(np.array(block), columns=['F','h','t'] )
-    self.workbook.append(df)
   if self.verbose>2:
     print("Meta information:",self.metaVendor)
     print("Number of measurements read:",len(self.workbook))
   self.metaUser['measurementType'] = 'Fischer-Scope Indentation TXT'
+  self.allTestList =  list(self.testList)
   if self.metaVendor['Indent_F'].startswith('ESP'):
     self.method = Method.MULTI
   else:
@@ -522,16 +678,82 @@ def nextFischerScopeTest(self):
   Returns:
       bool: success
   """
-  df = self.workbook.pop(0)
+  if len(self.testList)==0: #no test left
+    return False
   self.testName = self.testList.pop(0)
-  self.t = np.array(df['t'])
-  self.h = np.array(df['h'])
-  self.p = np.array(df['F'])
-  self.valid = np.ones_like(self.t, dtype=bool)
-  self.identifyLoadHoldUnload()
-  return True
+  return self.setTestData(self.readTest(self.testName))
+
+
+@instrumented
+def readFischerScopeTest(self, testName):
+  """
+  Read one test
+
+  Args:
+    testName (str): name of test
+
+  Returns:
+    TestData: data of this test
+  """
+  idx = self.allTestList.index(testName)
+  if isinstance(self.workbook[idx], str):
+    self.workbook[idx] = fischerScopeBlock(self.workbook[idx])
+  data = self.workbook[idx]           #columns: F, h, t (, HMu, HM)
+  return TestData(testName, data[:,2], data[:,1], data[:,0])
+
+
+FISCHER_NUMBER = r'[-+]?(?:\d+(?:[.,]\d*)?|[.,]\d+)(?:[eE][-+]?\d+)?'
+FISCHER_LINE = rf'[ \t]*{FISCHER_NUMBER}(?:[ \t]+{FISCHER_NUMBER}){{2}}(?:(?:[ \t]+{FISCHER_NUMBER}){{2}})?[ \t\r]*'
+FISCHER_DATA = re.compile(rf'^{FISCHER_LINE}$', re.M)
+FISCHER_BLOCK = re.compile(rf'^(?:{FISCHER_LINE}(?:\n|\Z))+', re.M)   #consecutive lines of data
+
+
+def fischerScopeTests(text, identifier):
+  """
+  internal function: iterate tests of Fischer-Scope text: a test starts with a line of identifier, date and time
+
+  Args:
+    text (str): content of file after initial lines
+    identifier (str): name of the application, e.g. FS1.hap
+
+  Yields:
+    tuple: date and time, list of lines before and after numeric block, text of numeric block
+  """
+  header = re.compile(re.escape(identifier)+r"   (\d\d\.\d\d\.\d\d\d\d  \d\d:\d\d:\d\d)", re.M)
+  matches = [i for i in header.finditer(text) if i.start()==0 or text[i.start()-1]=='\n']
+  for idx, match in enumerate(matches):
+    end = matches[idx+1].start() if idx+1<len(matches) else len(text)
+    data = FISCHER_BLOCK.search(text, match.end(), end)
+    dataStart, dataEnd = (end, end) if data is None else (data.start(), min(data.end(), end))
+    metaLines = text[match.end():dataStart].split('\n') + text[dataEnd:end].split('\n')
+    yield ' '.join(match.group(1).split()), metaLines, text[dataStart:dataEnd]
+
+
+def fischerScopeBlock(block):
+  """
+  internal function: convert numeric block of Fischer-Scope test to array, all numbers at once
+
+  Args:
+    block (str): text of numeric block, decimal separator is comma
+
+  Returns:
+    numpy.array: columns F, h, t (, HMu, HM)
+  """
+  block = block.replace(',','.')
+  numColumns = len(block.split('\n', 1)[0].split())
+  try:
+    data = np.array(block.split(), dtype=np.float64)
+    if numColumns in (3,5) and len(data)%numColumns==0 and len(data)//numColumns==len(FISCHER_DATA.findall(block)):
+      return data.reshape((-1, numColumns))
+  except ValueError:
+    pass
+  #slow path: only use lines with 3 or 5 numbers
+  rows = [line.split() for line in block.split('\n')]
+  rows = [[float(item) for item in row] for row in rows if len(row) in (3,5) and all(isfloat(item) for item in row)]
+  return np.array(rows, dtype=np.float64)
 
 
+@instrumented(probe=True)
 def loadHDF5(self,fileName):
   """
   Initialize hdf5-file that all converters are producing
@@ -628,93 +850,102 @@ def nextHDF5Test(self):
       break
   if self.testName in self.config and 'ignore' in self.config[self.testName]:  #handle last test
     return False
-  branch = self.datafile[self.testName]['data']
+  self.setTestData(self.readTest(self.testName), identify=False)
+  self.iLHU   = []
+  self.iDrift = [-1,-1]
+  if hasattr(self, 'slope') and len(self.slope)>60: #if more than 30: CSM
+    self.method = Method.CSM
+  if self.plotAllFigs:
+    self.plotTestingMethod()
+  try:
+    self.identifyLoadHoldUnload()
+  except:
+    print('**ERROR: could not identify load-hold-unload. Suggestion: try next test')
+  return True
+
+
+@instrumented
+def readHDF5Test(self, testName):
+  """
+  Read one branch of HDF5 file: identify valid data points, convert units and clean
+
+  Args:
+    testName (str): name of branch
+
+  Returns:
+    TestData: data of this test
+  """
+  branch = self.datafile[testName]['data']
   inFile = list(branch.keys())
-  with open(Path(__file__).parent/'terms.json', encoding='utf-8') as fIn:
-    nameDict   = json.load(fIn)
-  if self.metaUser['measurementType'].split()[0] in nameDict:
-    nameDict = nameDict[self.metaUser['measurementType'].split()[0]]
-  else:
-    print("**ERROR instrument not in terms.json", self.metaUser['measurementType'].split()[0])
-
-  #determine valid masks: loop through all entries and ensure that they all make sense
-  self.valid = None
-  for key in nameDict:
-    if key in ['__ignore__','__note__']:
-      continue
-    for name, _ in nameDict[key]:
-      if name in branch:
-        data = np.array(branch[name], dtype=np.float64)
-        mask = np.logical_and(np.isfinite(data), data<1e99)
-        if self.valid is None:
-          self.valid = mask
-        else:
-          self.valid = np.logical_and(self.valid, mask) #adopt/reduce mask continuously
-        if key=='slope':
-          self.valid = np.logical_and(self.valid, data>0.0)
-        if key=='h':
-          validFull = np.isfinite(np.array(branch[name], dtype=np.float64))
-        break
+  instrument = self.metaUser['measurementType'].split()[0]
+  nameDict, ignore = termsHDF5(instrument)
+  if nameDict is None:
+    print("**ERROR instrument not in terms.json", instrument)
+    nameDict = ()
 
-  #Run through all items again and crop to only valid data
-  for key in nameDict:
-    if key in ['__ignore__','__note__']:
-      continue
-    for name, multiplyer in nameDict[key]:
+  #read each dataset once: first name of each quantity that exists in branch
+  columns = {}
+  for key, names in nameDict:
+    for name, multiplyer in names:
       if name in branch:
-        data = np.array(branch[name], dtype=np.float64)
-        if key in ['h','p','t']:
-          data = data[validFull]
-        else:
-          data = data[self.valid]
-        setattr(self, key, data*multiplyer)
+        columns[key] = (np.asarray(branch[name][()], dtype=np.float64), multiplyer)
         inFile.remove(name)
         break
 
+  #determine valid masks: ensure that all entries make sense
+  valid = None
+  for key, (data, _) in columns.items():
+    mask = np.logical_and(np.isfinite(data), data<1e99)
+    valid = mask if valid is None else np.logical_and(valid, mask) #adopt/reduce mask continuously
+    if key=='slope':
+      valid = np.logical_and(valid, data>0.0)
+    if key=='h':
+      validFull = np.isfinite(data)
+
+  #crop to only valid data
+  channels = {}
+  for key, (data, multiplyer) in columns.items():
+    if key in ['h','p','t']:
+      data = data[validFull]
+    else:
+      data = data[valid]
+    channels[key] = data*multiplyer
+
   # Test if essential items exist
   for attrib in ['h','t','p']:
-    if not hasattr(self, attrib) or len(getattr(self, attrib))==0:
+    if attrib not in channels or len(channels[attrib])==0:
       print('Missing information for',self.metaUser['measurementType'].split()[0],': ',attrib)
       print('Keys exist',inFile)
-  self.valid = self.valid[validFull]
+  valid = valid[validFull]
+  t, h, p = channels.pop('t'), channels.pop('h'), channels.pop('p')
 
   #cleaning
   converter = self.datafile.attrs['uri'].split('/')[-1]
   if converter == 'hap2hdf.py':
     ## Old and correct approach
     #Fischer-Scope reset the time multiple times
-    resetPoints = np.where((self.t[1:]-self.t[:-1])<0)[0]
+    resetPoints = np.where((t[1:]-t[:-1])<0)[0]
     if len(resetPoints)>0:
-      self.t = self.t[resetPoints[-1]:]
-      self.h = self.h[resetPoints[-1]:]
-      self.p = self.p[resetPoints[-1]:]
-      self.valid = np.ones_like(self.t, dtype=bool)
+      t = t[resetPoints[-1]:]
+      h = h[resetPoints[-1]:]
+      p = p[resetPoints[-1]:]
+      valid = np.ones_like(t, dtype=bool)
     ##Wrong approach: crop off neg. depth
-    # mask = np.array(self.h)>=0
-    # self.h = np.array(self.h)[mask]
-    # self.p = np.array(self.p)[mask]
-    # self.t = np.array(self.t)[mask]
-    # self.valid = self.valid[mask]
+    # mask = np.array(h)>=0
+    # h = np.array(h)[mask]
+    # p = np.array(p)[mask]
+    # t = np.array(t)[mask]
+    # valid = valid[mask]
   else:
-    self.p -= self.p[0]
+    p = p-p[0]
 
   # Do drift correction
-  self.h -= self.t*self.driftRate  #SB
+  h = h-t*self.driftRate  #SB
 
-  inFile = [element for element in inFile if element not in nameDict['__ignore__']]
-  self.iLHU   = []
-  self.iDrift = [-1,-1]
+  inFile = [element for element in inFile if element not in ignore]
   if len(inFile)>0:
     print("**INFO on",self.metaUser['measurementType'].split()[0],"fields not imported:",inFile)
-  if hasattr(self, 'slope') and len(self.slope)>60: #if more than 30: CSM
-    self.method = Method.CSM
-  if self.plotAllFigs:
-    self.plotTestingMethod()
-  try:
-    self.identifyLoadHoldUnload()
-  except:
-    print('**ERROR: could not identify load-hold-unload. Suggestion: try next test')
-  return True
+  return TestData(testName, t, h, p, valid, slope=channels.pop('slope', None), **channels)
 
 
 def isfloat(value):
@@ -734,6 +965,54 @@ def isfloat(value):
     return False
 
 
+@lru_cache(maxsize=None)
+def termsHDF5(instrument):
+  """
+  internal function: names of quantities in the hdf5-files of one instrument; terms.json is only read once
+
+  Args:
+    instrument (str): instrument, first word of measurementType
+
+  Returns:
+    tuple: (key, ((name, multiplyer), ...)) for each quantity; names that are ignored
+  """
+  with open(Path(__file__).parent/'terms.json', encoding='utf-8') as fIn:
+    nameDict = json.load(fIn)
+  if instrument not in nameDict:
+    return None, ()
+  nameDict = nameDict[instrument]
+  terms = tuple((key, tuple((name, multiplyer) for name, multiplyer in value))
+                for key, value in nameDict.items() if key not in ['__ignore__','__note__'])
+  return terms, tuple(nameDict.get('__ignore__', []))
+
+
+def readTest(self, testName):
+  """
+  Read one test: from the cache file, if it is used, else from the vendor file
+
+  Args:
+    testName (str): name of test
+
+  Returns:
+    TestData: data of this test; None if vendor has only one test per file
+  """
+  if self.fileCache is not None and testName in self.fileCache:
+    return self.fileCache.read(testName)
+  if self.vendor==Vendor.Agilent:
+    data = self.readAgilentTest(testName)
+  elif self.vendor==Vendor.Micromaterials:
+    data = self.readMicromaterialsTest(testName)
+  elif self.vendor==Vendor.FischerScope:
+    data = self.readFischerScopeTest(testName)
+  elif self.vendor==Vendor.CommonHDF5:
+    data = self.readHDF5Test(testName)
+  else:
+    print("**ERROR readTest: vendor has only one test per file")
+    return None
+  self.cacheTest(testName, data)
+  return data
+
+
 def restartFile(self):
   """
   Restart processing the current file by resetting all values back to the initial
@@ -741,3 +1020,36 @@ def restartFile(self):
   self.testList = list(self.allTestList)
   self.nextTest()
   return
+
+
+def close(self):
+  """
+  Close the current file and stop its background threads: the cache file is discarded if not all tests were read
+  """
+  self.stopPrefetch()
+  if self.cacheWriter is not None:
+    self.cacheWriter.discard()
+    self.cacheWriter = None
+  if self.fileCache is not None:
+    self.fileCache.close()
+    self.fileCache = None
+  if isinstance(getattr(self, 'datafile', None), (ZipFile, h5py.File)):
+    self.datafile.close()
+  return
+
+
+def loadTest(self, testName):
+  """
+  Go to one test of the file, without reading the tests before it; the tests after it follow
+
+  Args:
+    testName (str): name of test
+
+  Returns:
+    bool: success
+  """
+  if not hasattr(self, 'allTestList') or testName not in self.allTestList:
+    print("**ERROR loadTest: test not in file", testName)
+    return False
+  self.testList = self.allTestList[self.allTestList.index(testName):]
+  return self.nextTest()
@@ -0,0 +1,169 @@
+"""Opt-in instrumentation of the analysis: time of stages, number of calls and processed points, counters"""
+import json, time
+from contextlib import contextmanager
+from functools import wraps
+import numpy as np
+from .testData import TestData
+
+class Instrumentation:
+  """
+  Timers and counters of the stages of the analysis, e.g. loading, identifyLoadHoldUnload, analyse
+
+  - stages: number of calls, wall and CPU time [s], number of points of the processed tests; the time of a stage
+    includes that of the stages it calls, e.g. analyse includes stiffnessFromUnloading
+  - counters: e.g. iterations and linear fallbacks of the power-law fit, hits of the analysis cache,
+    failures of stages that return a success
+  - can be shared by many indentation objects
+  """
+  def __init__(self):
+    """
+    Initialize empty timers and counters
+    """
+    self.stages   = {}
+    self.counters = {}
+    return
+
+
+  def __repr__(self):
+    """ Print stages, sorted by their wall time, and counters
+    Returns:
+      str: text representation
+    """
+    outString = f'{"stage":<28} {"calls":>7} {"wall [s]":>10} {"CPU [s]":>10} {"points":>10}\n'
+    for name, stage in sorted(self.stages.items(), key=lambda i: -i[1]['wall']):
+      outString += f'{name:<28} {stage["calls"]:>7} {stage["wall"]:>10.4f} {stage["cpu"]:>10.4f} {stage["points"]:>10}\n'
+    for name, value in sorted(self.counters.items()):
+      outString += f'{name:<28} {value:>7}\n'
+    return outString
+
+
+  @contextmanager
+  def stage(self, name):
+    """
+    Time a stage: use as context manager
+
+    Args:
+      name (str): name of stage
+
+    Yields:
+      dict: record of this stage, e.g. to add the number of points
+    """
+    record = self.stages.setdefault(name, {'calls':0, 'wall':0., 'cpu':0., 'points':0})
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+      yield record
+    finally:
+      record['calls'] += 1
+      record['wall']  += time.perf_counter()-wall
+      record['cpu']   += time.process_time()-cpu
+    return
+
+
+  def count(self, name, number=1):
+    """
+    Increase counter
+
+    Args:
+      name (str): name of counter
+      number (int): increase by this number
+    """
+    self.counters[name] = self.counters.get(name, 0)+int(number)
+    return
+
+
+  def reset(self):
+    """
+    Remove all timers and counters
+    """
+    self.stages, self.counters = {}, {}
+    return
+
+
+  def merge(self, data):
+    """
+    Add timers and counters, e.g. of another process
+
+    Args:
+      data (dict): stages and counters as of asDict
+    """
+    for name, stage in data.get('stages', {}).items():
+      record = self.stages.setdefault(name, {'calls':0, 'wall':0., 'cpu':0., 'points':0})
+      for key, value in stage.items():
+        record[key] += value
+    for name, value in data.get('counters', {}).items():
+      self.count(name, value)
+    return
+
+
+  def asDict(self):
+    """
+    Timers and counters
+
+    Returns:
+      dict: stages and counters
+    """
+    return {'stages':{name:dict(stage) for name, stage in self.stages.items()}, 'counters':dict(self.counters)}
+
+
+  def toJSON(self, fileName=None):
+    """
+    Timers and counters as JSON
+
+    Args:
+      fileName (str): also save to this file
+
+    Returns:
+      str: JSON
+    """
+    text = json.dumps(self.asDict(), indent=2)
+    if fileName is not None:
+      with open(fileName, 'w', encoding='utf-8') as fOut:
+        fOut.write(text)
+    return text
+
+
+def instrumented(function=None, probe=False):
+  """
+  Decorator of methods of indentation: time them as stage of the same name, if instrumentation is enabled |br|
+  the number of points of the returned test, or else of the current test, is added to the stage; methods that
+  return False are counted as failed
+
+  Usage: @instrumented or @instrumented(probe=True)
+
+  Args:
+    function (function): method
+    probe (bool): method also probes the vendor of a file: returning False is not counted as failed
+
+  Returns:
+    function: method that is timed
+  """
+  if function is None:
+    return lambda function: instrumented(function, probe)
+  @wraps(function)
+  def wrapper(self, *args, **kwargs):
+    instrumentation = getattr(self, 'instrumentation', None)
+    if instrumentation is None:
+      return function(self, *args, **kwargs)
+    with instrumentation.stage(function.__name__) as record:
+      result = function(self, *args, **kwargs)
+      if isinstance(result, TestData):
+        record['points'] += int(np.size(result.p))
+      elif result is not False:
+        record['points'] += int(np.size(getattr(self, 'p', 0)))
+    if result is False and not probe:
+      instrumentation.count(f'{function.__name__} failed')
+    return result
+  return wrapper
+
+
+def countEvent(self, name, number=1):
+  """
+  internal function: increase counter, if instrumentation is enabled
+
+  Args:
+    name (str): name of counter
+    number (int): increase by this number
+  """
+  if self.instrumentation is not None:
+    self.instrumentation.count(name, number)
+  return
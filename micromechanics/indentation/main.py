@@ -1,14 +1,16 @@
 """Most central functions for nanoindentation"""
 
+import hashlib
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy import ndimage
-from scipy import signal
-from scipy.ndimage import gaussian_filter1d
 from scipy.optimize import fmin_l_bfgs_b
 from .definitions import Vendor, Method
+from .testData import TestData
+from .filters import signalStep
+from .instrumentation import instrumented, countEvent
 
 
+@instrumented
 def calcYoungsModulus(self, minDepth=-1, plot=False):
   """
   Calculate and plot Young's modulus as a function of the depth |br|
@@ -51,16 +53,20 @@ def calcYoungsModulus(self, minDepth=-1, plot=False):
   return eAve
 
 
-def calcHardness(self, minDepth=-1, plot=False):
+@instrumented
+def calcHardness(self, minDepth=-1, plot=False, Ac=None):
   """
   Calculate and plot Hardness as a function of the depth
 
   Args:
       minDepth (float): minimum depth for fitting horizontal; if negative: no line is fitted
       plot (bool): plot comparison this calculation to data read from file
+      Ac (np.array): contact area of valid points, e.g. from calcYoungsModulus; None=use area function
   """
   #use area function
-  hardness=self.p[self.valid]/self.OliverPharrMethod(self.slope, self.p[self.valid], self.h[self.valid], self.nonMetal)[1]
+  if Ac is None:
+    Ac = self.OliverPharrMethod(self.slope, self.p[self.valid], self.h[self.valid], self.nonMetal)[1]
+  hardness=self.p[self.valid]/Ac
   if plot:
     mark = '-' if len(hardness)>1 else 'o'
     plt.plot(self.h[self.valid], hardness, mark+'b', label='calc')
@@ -129,7 +135,8 @@ def calcStiffness2Force(self, minDepth=0.01, plot=True, calibrate=False):
   return prefactors
 
 
-def analyse(self):
+@instrumented
+def analyse(self, data=None):
   """
   update slopes/stiffness, Young's modulus and hardness after displacement correction by:
 
@@ -137,8 +144,23 @@ def analyse(self):
 
   ONLY DO ONCE AFTER LOADING FILE: if this causes issues introduce flag analysed
     which is toggled during loading and analysing
+
+  With analysisCache, the results are kept in memory (not for CSM) and, with writeBack, written into the HDF5 file. They are
+  used instead of the analysis, if neither the test nor the parameters changed
+
+  Args:
+    data (TestData): analyse this test, which becomes the current test; default: current test
   """
-  self.h -= self.tip.compliance*self.p
+  if data is not None:
+    self.setTestData(data)
+  key = None
+  if self.useAnalysisCache() or (self.writeBack and self.vendor==Vendor.CommonHDF5):
+    key = self.analysisHash()
+    if key is not None and self.loadAnalysis(key):
+      countEvent(self, 'analysis cache hits')
+      self.saveToUserMeta()
+      return
+  self.h = self.h - self.tip.compliance*self.p
   if self.method == Method.CSM:
     self.slope = 1./(1./self.slope-self.tip.compliance)
   else:
@@ -151,17 +173,22 @@ def analyse(self):
     return
   #Calculate Young's modulus
   self.calcYoungsModulus()
-  self.calcHardness()
+  self.calcHardness(Ac=self.Ac)
   self.saveToUserMeta()
+  if key is not None:
+    self.saveAnalysis(key)
   return
 
 
-def identifyLoadHoldUnload(self,plot=False):
+@instrumented
+def identifyLoadHoldUnload(self,plot=False, rate=None):
   """
   internal method: identify ALL load - hold - unload segments in data
 
   Args:
       plot (bool): verify by plotting
+      rate (tuple): filtered force and rate of a previous identification, see filteredRate; the data is
+        not cleaned again. Use if only zeroGradDelta or min_loading_Force change
 
   Returns:
       bool: success of identifying the load-hold-unload
@@ -169,23 +196,18 @@ def identifyLoadHoldUnload(self,plot=False):
   if self.method==Method.CSM:
     success = self.identifyLoadHoldUnloadCSM()
     return success
-  #identify point in time, which are too close (~0) to eachother
-  gradTime = np.diff(self.t)
-  maskTooClose = gradTime < np.percentile(gradTime,80)/1.e3
-  self.t     = self.t[1:][~maskTooClose]
-  self.p     = self.p[1:][~maskTooClose]
-  self.h     = self.h[1:][~maskTooClose]
-  self.valid = self.valid[1:][~maskTooClose]
-  #use force-rate to identify load-hold-unload
-  # self.nextTest(newTest=False)
-  if self.zeroGradFilter=='median':
-    p = signal.medfilt(self.p, 5)
-    rate = np.gradient(p, self.t)
-    rate = signal.medfilt(rate, 5)
+  if rate is None:
+    #identify point in time, which are too close (~0) to eachother
+    gradTime = np.diff(self.t)
+    maskTooClose = gradTime < np.percentile(gradTime,80)/1.e3
+    self.t     = self.t[1:][~maskTooClose]
+    self.p     = self.p[1:][~maskTooClose]
+    self.h     = self.h[1:][~maskTooClose]
+    self.valid = self.valid[1:][~maskTooClose]
+    #use force-rate to identify load-hold-unload
+    p, rate = self.filteredRate()
   else:
-    p = gaussian_filter1d(self.p, 5)
-    rate = np.gradient(p, self.t)
-    rate = signal.medfilt(rate, 5)
+    p, rate = rate
 
   loadMask  = np.logical_and((rate >  self.zeroGradDelta), (p > self.min_loading_Force))
   unloadMask= np.logical_and((rate < -self.zeroGradDelta), (p > self.min_loading_Force))
@@ -202,10 +224,8 @@ def identifyLoadHoldUnload(self,plot=False):
   #try to clean small fluctuations
   if len(loadMask)>100 and len(unloadMask)>100:
     size = 10
-    loadMask = ndimage.binary_closing(loadMask, structure=np.ones((size,)) )
-    unloadMask = ndimage.binary_closing(unloadMask, structure=np.ones((size,)))
-    loadMask = ndimage.binary_opening(loadMask, structure=np.ones((size,)))
-    unloadMask = ndimage.binary_opening(unloadMask, structure=np.ones((size,)))
+    loadMask = cleanMask(loadMask, size)
+    unloadMask = cleanMask(unloadMask, size)
   #find index where masks are changing from true-false
   loadMask  = np.r_[False,loadMask,False] #pad with false on both sides
   unloadMask= np.r_[False,unloadMask,False]
@@ -245,23 +265,21 @@ def identifyLoadHoldUnload(self,plot=False):
   else:
     if self.testName not in self.success_identified_TestList:
       self.success_identified_TestList.append(self.testName)
-  try:
-    for i,_ in enumerate(loadIdx[::2]):
-      if loadIdx[::2][i] < loadIdx[1::2][i] <= unloadIdx[::2][i] < unloadIdx[1::2][i]:
-        newEntry = [loadIdx[::2][i],loadIdx[1::2][i],unloadIdx[::2][i],unloadIdx[1::2][i]]
-        if np.min(newEntry)>0 and np.max(newEntry)<len(self.h):
-          self.iLHU.append(newEntry)
-        else:
-          print("**ERROR: iLHU values out of bounds", newEntry)
-          if len(self.iLHU)>0:
-            self.iLHU.append([])
-      else:
-        print("**ERROR: some segment not found", loadIdx[::2][i], loadIdx[1::2][i], unloadIdx[::2][i], unloadIdx[1::2][i])
-        if len(self.iLHU)>0:
-          self.iLHU.append([])
-  except:
+  cycles = segmentCycles(loadIdx, unloadIdx)
+  if cycles is None:
     print("**ERROR: load-unload-segment not found")
-    self.iLHU = []
+  else:
+    ordered = np.logical_and.reduce([cycles[:,0]<cycles[:,1], cycles[:,1]<=cycles[:,2], cycles[:,2]<cycles[:,3]])
+    inside  = np.logical_and(cycles.min(axis=1)>0, cycles.max(axis=1)<len(self.h))
+    success = np.logical_and(ordered, inside)
+    for i in np.flatnonzero(~success):
+      if ordered[i]:
+        print("**ERROR: iLHU values out of bounds", list(cycles[i]))
+      else:
+        print("**ERROR: some segment not found", *cycles[i])
+    if np.any(success):  #failed cycles are kept as empty entries after the first identified one
+      first = np.argmax(success)
+      self.iLHU = [i if j else [] for i,j in zip(cycles[first:].tolist(), success[first:])]
   if len(self.iLHU)>1:
     self.method=Method.MULTI
   #drift segments: only add if it makes sense
@@ -276,6 +294,112 @@ def identifyLoadHoldUnload(self,plot=False):
   return True
 
 
+def filteredRate(self):
+  """
+  internal method: filtered force and force-rate, which identify load-hold-unload
+
+  Returns:
+      tuple: filtered force, filtered rate
+  """
+  smooth = ('median filter', 5) if self.zeroGradFilter=='median' else ('gauss filter', 5)
+  return self.derivedSignal('p', smooth), self.derivedSignal('p', smooth, ('gradient','t'), ('median filter',5))
+
+
+def derivedSignal(self, *steps):
+  """
+  Signal derived from the current test, e.g. filtered force or force-rate |br|
+  all intermediate signals are cached; key is the content of the data and the steps. Hence, they are reused when
+  the same test is read again and are never outdated
+
+  Args:
+      steps (tuple): name of data, e.g. 'p', followed by operations on it:
+        ('gradient', name of data), ('abs',), ('interpolate nan',), ('median filter', size),
+        ('gauss filter', sigma), ('butterfilter', arguments of scipy.signal.butter)
+
+  Returns:
+      numpy.array: signal; read-only since it is shared
+  """
+  names = [steps[0]]+[i[1] for i in steps[1:] if i[0]=='gradient']
+  digest = hashlib.sha1()
+  for name in names:
+    digest.update(name.encode('utf-8')+np.ascontiguousarray(getattr(self, name), dtype=np.float64).tobytes())
+  keys = []
+  for idx in range(1, len(steps)+1):
+    digestStep = digest.copy()
+    digestStep.update(repr(steps[:idx]).encode('utf-8'))
+    keys.append(digestStep.hexdigest())
+  #use longest cached part of steps: keys[idx] belongs to steps[:idx+1]
+  start, value = len(steps)-1, None
+  while start>0:
+    cached = self.signalCache.get(keys[start])
+    if cached is not None:
+      value = cached['value']
+      countEvent(self, 'signal cache hits')
+      break
+    start -= 1
+  if value is None:
+    value = np.array(getattr(self, steps[0]), dtype=np.float64)
+  for idx in range(start+1, len(steps)):
+    coordinate = getattr(self, steps[idx][1]) if steps[idx][0]=='gradient' else None
+    value = signalStep(value, steps[idx], coordinate, self.filterBackend)
+    value.flags.writeable = False
+    self.signalCache.put(keys[idx], {'value':value})
+  return value
+
+
+def cleanMask(mask, size):
+  """
+  internal function: binary closing and then opening of mask, identical to scipy.ndimage with border value 0 |br|
+  number of True values in a sliding window by cumulative sum: time does not depend on size
+
+  Args:
+      mask (numpy.array): boolean mask
+      size (int): length of structuring element
+
+  Returns:
+      numpy.array: cleaned mask
+  """
+  def windowCount(z, start):
+    """
+    Number of True values in z[i+start:i+start+size]; values outside are False
+
+    Args:
+      z (numpy.array): boolean mask
+      start (int): start of window relative to i, -size<=start<=0
+
+    Returns:
+      numpy.array: count for each i
+    """
+    cumulative = np.zeros(len(z)+2*size+1, dtype=np.int32)
+    np.cumsum(z, out=cumulative[size+1:len(z)+size+1])
+    cumulative[len(z)+size+1:] = cumulative[len(z)+size]
+    return cumulative[start+2*size:start+2*size+len(z)] - cumulative[start+size:start+size+len(z)]
+  center = size//2
+  mask = windowCount(mask, center+1-size)>0             #dilation
+  mask = windowCount(mask, -center)==size               #erosion
+  mask = windowCount(mask, -center)==size               #erosion
+  return windowCount(mask, center+1-size)>0             #dilation
+
+
+def segmentCycles(loadIdx, unloadIdx):
+  """
+  internal function: all cycles from the changes of the load and unload masks
+
+  Args:
+      loadIdx (numpy.array): start and end of loading segments, alternating
+      unloadIdx (numpy.array): start and end of unloading segments, alternating
+
+  Returns:
+      numpy.array: (N,4) loadStart, loadEnd, unloadStart, unloadEnd of each cycle; None if too few changes
+  """
+  numCycles = len(loadIdx[::2])
+  if min(len(loadIdx[1::2]), len(unloadIdx[::2]), len(unloadIdx[1::2])) < numCycles:
+    return None
+  return np.column_stack([loadIdx[::2], loadIdx[1::2][:numCycles], unloadIdx[::2][:numCycles],
+                          unloadIdx[1::2][:numCycles]]).astype(np.int64).reshape((-1,4))
+
+
+@instrumented
 def identifyLoadHoldUnloadCSM(self, plot=False):
   """
   internal method: identify load - hold - unload segment in CSM data |br|
@@ -334,6 +458,7 @@ def identifyLoadHoldUnloadCSM(self, plot=False):
   return True
 
 
+@instrumented
 def nextTest(self, newTest=True, plotSurface=False):
   """
   Wrapper for all next test for all vendors
@@ -360,57 +485,56 @@ def nextTest(self, newTest=True, plotSurface=False):
   else:
     success = True
 
-  #SURFACE FIND
+  self.findSurface(plotSurface)
+  return success
+
+
+@instrumented
+def findSurface(self, plotSurface=False):
+  """
+  internal function: surface of the current test: from the configuration or by the criterion of surfaceFind |br|
+  the depth is shifted such that it is zero at the surface; its index is saved in surfaceIdx
+
+  Args:
+     plotSurface (bool): plot surface area
+  """
+  self.surfaceIdx = None
   if self.testName in self.config and 'surfaceIdx' in self.config[self.testName]:
     surface = self.config[self.testName]['surfaceIdx']
-    self.h -= self.h[surface]  #only change surface, not force
+    self.h = self.h - self.h[surface]  #only change surface, not force
+    self.surfaceIdx = int(surface)
   else:
     found = False
     if 'load' in self.surfaceFind:
-      thresValues = self.p
+      steps = ['p']
       thresValue  = self.surfaceFind['load']
       found = True
     elif 'stiffness' in self.surfaceFind:
-      thresValues = self.slope
+      steps = ['slope']
       thresValue  = self.surfaceFind['stiffness']
       found = True
     elif 'phase angle' in self.surfaceFind:
-      thresValues = self.phase
+      steps = ['phase']
       thresValue  = self.surfaceFind['phase angle']
       found = True
     elif 'abs(dp/dh)' in self.surfaceFind:
-      thresValues = np.abs(np.gradient(self.p,self.h))
+      steps = ['p', ('gradient','h'), ('abs',)]
       thresValue  = self.surfaceFind['abs(dp/dh)']
       found = True
     elif 'dp/dt' in self.surfaceFind:
-      thresValues = np.gradient(self.p,self.t)
+      steps = ['p', ('gradient','t')]
       thresValue  = self.surfaceFind['dp/dt']
       found = True
 
     if found:
       #interpolate nan with neighboring values
-      nans = np.isnan(thresValues)
-      def tempX(z):
-        """
-        Temporary function
-
-        Args:
-          z (numpy.array): input
-
-        Returns:
-          numpy.array: output
-        """
-        return z.nonzero()[0]
-      thresValues[nans]= np.interp(tempX(nans), tempX(~nans), thresValues[~nans])
-
+      steps.append(('interpolate nan',))
       #filter this data
-      if 'median filter' in self.surfaceFind:
-        thresValues = signal.medfilt(thresValues, self.surfaceFind['median filter'])
-      elif 'gauss filter' in self.surfaceFind:
-        thresValues = gaussian_filter1d(thresValues, self.surfaceFind['gauss filter'])
-      elif 'butterfilter' in self.surfaceFind:
-        valueB, valueA = signal.butter(*self.surfaceFind['butterfilter'])
-        thresValues = signal.filtfilt(valueB, valueA, thresValues)
+      for name in ['median filter', 'gauss filter', 'butterfilter']:
+        if name in self.surfaceFind:
+          steps.append((name, self.surfaceFind[name]))
+          break
+      thresValues = self.derivedSignal(*steps)  #filtered signals are reused if this test is found again
       if 'phase angle' in self.surfaceFind:
         surface  = np.where(thresValues<thresValue)[0][0]
       else:
@@ -425,10 +549,53 @@ def nextTest(self, newTest=True, plotSurface=False):
         ax1.set_ylabel(r'gradient [mN/ $\mu m$]', color='C0')
         ax1.grid()
         plt.show()
-      self.h -= self.h[surface]  #only change surface, not force
-  return success
+      self.h = self.h - self.h[surface]  #only change surface, not force
+      self.surfaceIdx = int(surface)
+  return
+
+
+def setTestData(self, data, identify=True):
+  """
+  Use the data of one test as the current test
+
+  Args:
+    data (TestData): data of one test, as returned by the readers; the current test gets writable copies of it
+    identify (bool): identify load-hold-unload segments, if they are not part of the data
+
+  Returns:
+    bool: success
+  """
+  self.testData = data
+  self.testName = data.name
+  self.surfaceIdx = None
+  self.t, self.h, self.p, self.valid = np.array(data.t), np.array(data.h), np.array(data.p), np.array(data.valid)
+  if data.slope is not None:
+    self.slope = np.array(data.slope)
+  for key, value in data.channels.items():
+    setattr(self, key, np.array(value))
+  if data.iLHU is not None:
+    self.iLHU = [list(i) for i in data.iLHU]
+    self.iDrift = [-1,-1] if data.iDrift is None else list(data.iDrift)
+  elif identify:
+    self.identifyLoadHoldUnload()
+  return True
+
+
+def getTestData(self):
+  """
+  Get a copy of the current test, including the identified load-hold-unload segments
+
+  Returns:
+    TestData: data of current test
+  """
+  channels = {} if self.testData is None else {key:getattr(self, key) for key in self.testData.channels}
+  slope = None if self.testData is None or self.testData.slope is None else self.slope
+  iLHU = [i for i in self.iLHU if len(i)==4]
+  return TestData(self.testName, self.t, self.h, self.p, self.valid, slope=slope, iLHU=iLHU, iDrift=self.iDrift,
+                  **channels)
 
 
+@instrumented
 def saveToUserMeta(self):
   """
   save results to user-metadata
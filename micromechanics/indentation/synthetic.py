@@ -0,0 +1,199 @@
+"""Synthetic indentation tests: for scaling, benchmarks and verification of the analysis"""
+import io
+from zipfile import ZipFile, ZIP_DEFLATED
+import h5py
+import numpy as np
+from .definitions import Method
+from .testData import TestData
+from .theory import unloadingPowerFunc
+from .hertz import hertzEquation
+
+class Synthetic:
+  """
+  Generator of indentation tests of a material with known Young's modulus and hardness
+
+  - loading: elastic Hertzian contact at the start, then plastic: area from hardness and stiffness from
+    reduced modulus; the depth follows from the inverse Oliver-Pharr method
+  - pop-in: displacement burst from the elastic to the plastic loading curve
+  - unloading: power law with the stiffness of the Oliver-Pharr method at maximum force; reloading follows
+    the unloading curve
+  - ISO: one load-hold-unload cycle; MULTI: cycles with increasing maximum force; CSM: stiffness is recorded
+    during loading
+  - noise of force and depth, thermal drift and scatter of material parameters between tests
+  - reproducible: each test only depends on the seed and its number
+  """
+  def __init__(self, method=Method.ISO, modulus=72., hardness=9., nuMat=0.18, tip=None, pMax=10., **kwargs):
+    """
+    Initialize generator
+
+    Args:
+      method (Method): ISO, MULTI or CSM
+      modulus (float): Young's modulus [GPa]
+      hardness (float): hardness [GPa]
+      nuMat (float): material's Poisson ratio
+      tip (Tip): tip; None=perfect Berkovich
+      pMax (float): maximum force [mN]; MULTI: of last cycle
+      kwargs (dict): additional keywords
+        points (int) number of points of each test, default: 1000
+        cycles (int) number of load-hold-unload cycles of MULTI, default: 5
+        exponent (float) exponent m of unloading power law, default: 1.4
+        radius (float) tip radius of elastic Hertzian contact [um], default: 0.1
+        popIn (float) force of pop-in [mN]; None=no pop-in (default)
+        noiseForce (float) standard deviation of noise of force [mN], default: 1.e-4; the duration of a test
+          does not depend on the number of points: for many points, reduce the noise in proportion, otherwise the
+          noise of the force rate hinders the identification of load-hold-unload
+        noiseDepth (float) standard deviation of noise of depth [um], default: 1.e-4
+        driftRate (float) thermal drift [um/s], default: 0
+        scatter (float) relative standard deviation of modulus and hardness between tests, default: 0
+        seed (int) seed of random numbers, default: 0
+    """
+    from . import Indentation  #pylint: disable=import-outside-toplevel
+    self.indentation = Indentation('', nuMat=nuMat, tip=tip, verbose=0)   #physics of the package
+    self.method     = method
+    self.modulus    = modulus
+    self.hardness   = hardness
+    self.pMax       = pMax
+    self.points     = kwargs.get('points', 1000)
+    self.cycles     = kwargs.get('cycles', 5) if method==Method.MULTI else 1
+    self.exponent   = kwargs.get('exponent', 1.4)
+    self.radius     = kwargs.get('radius', 0.1)
+    self.popIn      = kwargs.get('popIn', None)
+    self.noiseForce = kwargs.get('noiseForce', 1.e-4)
+    self.noiseDepth = kwargs.get('noiseDepth', 1.e-4)
+    self.driftRate  = kwargs.get('driftRate', 0.)
+    self.scatter    = kwargs.get('scatter', 0.)
+    self.seed       = kwargs.get('seed', 0)
+    return
+
+
+  def __repr__(self):
+    """ Print generator information
+    Returns:
+      str: text representation
+    """
+    return f'Synthetic {self.method.name}: E={self.modulus}GPa, H={self.hardness}GPa, pMax={self.pMax}mN, '+\
+           f'{self.points} points per test'
+
+
+  def test(self, number):
+    """
+    Generate one test
+
+    Args:
+      number (int): number of test
+
+    Returns:
+      TestData: test with name test_<number>; CSM: with stiffness during loading
+    """
+    rng = np.random.default_rng([self.seed, number])
+    modulus  = self.modulus *(1.+self.scatter*rng.standard_normal())
+    hardness = self.hardness*(1.+self.scatter*rng.standard_normal())
+    modulusRed = self.indentation.ReducedModulus(modulus)
+    #duration of segments: approach; load, hold, unload to 10% of each cycle; hold for drift, unload
+    duration = np.array([2.]+[10., 5., 5.]*self.cycles+[10., 2.])
+    t = np.linspace(0., duration.sum(), self.points)
+    segment = np.minimum(np.searchsorted(np.cumsum(duration), t, side='right'), len(duration)-1)
+    start = np.concatenate([[0.], np.cumsum(duration)])[segment]
+    fraction = (t-start)/np.where(duration[segment]>0, duration[segment], 1.)
+    h, p = np.zeros_like(t), np.zeros_like(t)
+    slope = np.full_like(t, np.nan)
+    pUnloaded, unloading = 0., None
+    for cycle in range(self.cycles):
+      pMax = self.pMax*(cycle+1)/self.cycles
+      load, hold, unload = segment==3*cycle+1, segment==3*cycle+2, segment==3*cycle+3
+      p[load] = pUnloaded + (pMax-pUnloaded)*fraction[load]
+      h[load], slope[load] = self.loadingCurve(p[load], modulusRed, hardness)
+      if unloading is not None:  #reload elastically along unloading curve of previous cycle
+        reload = load & (p<unloading[0][-1])
+        h[reload] = np.interp(p[reload], *unloading)
+        slope[reload] = np.nan
+      hMax, stiffness = self.loadingCurve(np.array([pMax]), modulusRed, hardness)
+      p[hold], h[hold] = pMax, hMax[0]
+      #unloading: power law with stiffness at maximum force
+      depthFinal = hMax[0]-self.exponent*pMax/stiffness[0]
+      prefactor  = pMax/np.power(hMax[0]-depthFinal, self.exponent)
+      depth = np.linspace(depthFinal, hMax[0], 4096)
+      unloading = (unloadingPowerFunc(depth, prefactor, depthFinal, self.exponent), depth)
+      pUnloaded = 0.1*pMax
+      p[unload] = pMax-(pMax-pUnloaded)*fraction[unload]
+      h[unload] = np.interp(p[unload], *unloading)
+    drift, unload = segment==3*self.cycles+1, segment==3*self.cycles+2
+    p[drift] = pUnloaded
+    p[unload] = pUnloaded*(1.-fraction[unload])
+    h[drift | unload] = np.interp(p[drift | unload], *unloading)
+    h += self.driftRate*t + rng.normal(0., self.noiseDepth, len(t))
+    p += rng.normal(0., self.noiseForce, len(t))
+    p[0], h[0] = 0., 0.
+    if self.method==Method.CSM:
+      return TestData(f'test_{number}', t, h, p, valid=np.isfinite(slope), slope=slope[np.isfinite(slope)])
+    return TestData(f'test_{number}', t, h, p)
+
+
+  def loadingCurve(self, p, modulusRed, hardness):
+    """
+    internal function: depth and stiffness of loading: elastic Hertzian contact until pop-in or until plastic
+    curve is reached, then plastic
+
+    Args:
+      p (np.array): force [mN]
+      modulusRed (float): reduced modulus [GPa]
+      hardness (float): hardness [GPa]
+
+    Returns:
+      list: depth [um], stiffness [mN/um]
+    """
+    area = p/hardness
+    stiffness = 2.*modulusRed*np.sqrt(area/np.pi)
+    plastic = self.indentation.inverseOliverPharrMethod(np.maximum(stiffness, 1.e-12), p, modulusRed)
+    depth = np.linspace(0., np.max(plastic), 4096)
+    elastic = np.interp(p, hertzEquation(depth.copy(), 0., modulusRed, self.radius), depth)
+    isElastic = elastic<plastic
+    if self.popIn is not None:
+      isElastic &= p<self.popIn
+    if np.any(~isElastic):  #elastic only at start
+      isElastic[np.argmax(~isElastic):] = False
+    stiffnessElastic = 2.*modulusRed*np.sqrt(self.radius*elastic)
+    return np.where(isElastic, elastic, plastic), np.where(isElastic, stiffnessElastic, stiffness)
+
+
+  def writeHDF5(self, fileName, tests=10):
+    """
+    Write tests to HDF5 file of version 2.0, which loadHDF5 reads; names of quantities as of MTS / Agilent
+
+    Args:
+      fileName (str): file name
+      tests (int): number of tests
+    """
+    with h5py.File(fileName, 'w') as fOut:
+      fOut.attrs['version'] = '2.0'
+      fOut.attrs['uri'] = 'https://github.com/micromechanics/tools/blob/main/xls2hdf.py'
+      instrument = fOut.create_group('instrument')
+      instrument.attrs['synthetic'] = repr(self)
+      for number in range(1, tests+1):
+        data = self.test(number)
+        branch = fOut.create_group(f'{data.name}/data')
+        branch.create_dataset('time_on_sample', data=data.t)
+        branch.create_dataset('displacement_into_surface', data=data.h*1.e3)  #nm
+        branch.create_dataset('load_on_sample', data=data.p)
+        if data.slope is not None:
+          slope = np.full_like(data.t, np.nan)
+          slope[data.valid] = data.slope*1.e3  #N/m
+          branch.create_dataset('harmonic_contact_stiffness', data=slope)
+    return
+
+
+  def writeMicromaterials(self, fileName, tests=10):
+    """
+    Write tests to Micromaterials zip-archive of txt-files: time [s], depth [nm], force [mN]
+
+    Args:
+      fileName (str): file name
+      tests (int): number of tests
+    """
+    with ZipFile(fileName, 'w', compression=ZIP_DEFLATED) as fOut:
+      for number in range(1, tests+1):
+        data = self.test(number)
+        text = io.StringIO()
+        np.savetxt(text, np.column_stack([data.t, data.h*1.e3, data.p]), fmt='%.6f')
+        fOut.writestr(f'{data.name}.txt', text.getvalue())
+    return
@@ -0,0 +1,91 @@
+"""Data of one test: independent of the indentation object"""
+from types import MappingProxyType
+import numpy as np
+
+class TestData:
+  """
+  Immutable record of one test as returned by the readers
+
+  - arrays are copied and set to read-only: the arrays of the caller stay writable
+  - t, h, p, valid: full-length time [s], depth [um], force [mN] and mask of valid points
+  - slope: stiffness at the valid points [mN/um]; None if not given by the vendor (i.e. no CSM)
+  - iLHU, iDrift: indices of load-hold-unload cycles and drift segment; None if not known yet
+  - channels: additional vendor data, e.g. hardness, modulus, phase, hRaw
+  """
+  __slots__ = ('name', 't', 'h', 'p', 'valid', 'slope', 'iLHU', 'iDrift', 'channels')
+
+  def __init__(self, name, t, h, p, valid=None, slope=None, iLHU=None, iDrift=None, **channels):
+    """
+    Initialize record
+
+    Args:
+      name (str): test name
+      t (numpy.array): time [s]
+      h (numpy.array): depth [um]
+      p (numpy.array): force [mN]
+      valid (numpy.array): mask of valid points; None=all points are valid
+      slope (numpy.array): stiffness at valid points [mN/um]
+      iLHU (list): indices of load-hold-unload cycles
+      iDrift (list): start and end index of drift segment
+      channels (dict): additional vendor data
+    """
+    init = super().__setattr__
+    init('name', name)
+    init('t', freeze(t))
+    init('h', freeze(h))
+    init('p', freeze(p))
+    init('valid', freeze(np.ones_like(self.t, dtype=bool) if valid is None else valid, dtype=bool))
+    init('slope', None if slope is None else freeze(slope))
+    init('iLHU', None if iLHU is None else tuple(tuple(int(i) for i in cycle) for cycle in iLHU))
+    init('iDrift', None if iDrift is None else tuple(int(i) for i in iDrift))
+    init('channels', MappingProxyType({key:freeze(value) for key, value in channels.items()}))
+    return
+
+
+  def __setattr__(self, key, value):
+    raise AttributeError('TestData is immutable: use replace()')
+
+
+  def __repr__(self):
+    """ Print test information
+    Returns:
+      str: text representation
+    """
+    outString = f'TestData {self.name}: {len(self.t)} points, {np.count_nonzero(self.valid)} valid'
+    if self.iLHU is not None:
+      outString += f', {len(self.iLHU)} unloading segments'
+    if self.channels:
+      outString += '; channels: '+', '.join(self.channels)
+    return outString
+
+
+  def replace(self, **kwargs):
+    """
+    Create a new record in which some entries are replaced
+
+    Args:
+      kwargs (dict): entries to replace, e.g. h=newDepth
+
+    Returns:
+      TestData: new record
+    """
+    entries = {key:getattr(self, key) for key in self.__slots__ if key!='channels'}
+    entries.update(self.channels)
+    entries.update(kwargs)
+    return TestData(**entries)
+
+
+def freeze(value, dtype=np.float64):
+  """
+  Copy to numpy array and make it read-only
+
+  Args:
+    value (numpy.array): input
+    dtype (type): data type
+
+  Returns:
+    numpy.array: read-only copy
+  """
+  value = np.array(value, dtype=dtype)
+  value.flags.writeable = False
+  return value
@@ -1,9 +1,9 @@
 """CONVENTIONAL NANOINDENTATION FUNCTIONS: area, E,."""
-import math, traceback
+import math
 import numpy as np
 import matplotlib.pylab as plt
-from scipy.optimize import curve_fit
 from .definitions import Method
+from .instrumentation import instrumented
 #import definitions
 
 def YoungsModulus(self, modulusRed, nuThis=-1):
@@ -42,6 +42,7 @@ def ReducedModulus(self, modulus, nuThis=-1):
   return modulusRed
 
 
+@instrumented
 def OliverPharrMethod(self, stiffness, pMax, h, nonMetal=1.):
   """
   Conventional Oliver-Pharr indentation method to calculate reduced Modulus modulusRed
@@ -70,6 +71,28 @@ def OliverPharrMethod(self, stiffness, pMax, h, nonMetal=1.):
   return [modulus, Ac, hc]
 
 
+def OliverPharrMethodBatch(self, stiffness, pMax, h, nonMetal=1.):
+  """
+  Oliver-Pharr method for the unloading segments of many tests at once: one vectorized pass
+  instead of one call per test; tip, Poisson's ratios and beta are those of this object
+
+  Args:
+      stiffness (np.array): flat array of stiffness of all segments [mN/um]
+      pMax (np.array): flat array of maximal force of all segments [mN]
+      h (np.array): flat array of total penetration depth of all segments [um]
+      nonMetal (float): ability to change between metal=0 and nonMetal=1
+
+  Returns:
+      list: modulusRed, Ac, hc, modulus, hardness
+  """
+  stiffness = np.asarray(stiffness, dtype=np.float64)
+  pMax      = np.asarray(pMax, dtype=np.float64)
+  modulusRed, Ac, hc = self.OliverPharrMethod(stiffness, pMax, np.asarray(h, dtype=np.float64), nonMetal)
+  modulus  = self.YoungsModulus(modulusRed)
+  hardness = pMax / Ac
+  return [modulusRed, Ac, hc, modulus, hardness]
+
+
 def inverseOliverPharrMethod(self, stiffness, pMax, modulusRed, nonMetal=1.):
   """
   Inverse Oliver-Pharr indentation method to calculate contact area Ac
@@ -78,18 +101,18 @@ def inverseOliverPharrMethod(self, stiffness, pMax, modulusRed, nonMetal=1.):
   - only used for verification of the Oliver-Pharr Method
 
   Args:
-      stiffness (float): slope dP/dh at the maximum load pMax
-      pMax (float): maximal force
-      modulusRed (float): modulusRed
+      stiffness (np.array): slope dP/dh at the maximum load pMax
+      pMax (np.array): maximal force
+      modulusRed (np.array): modulusRed
       nonMetal (float): ability to change between metal=0 and nonMetal=1
 
   Returns:
-      float: h penetration depth
+      np.array: h penetration depth
   """
-  Ac = math.pow( stiffness / (2.0*modulusRed/math.sqrt(math.pi))  ,2)
-  hc0 = math.sqrt(Ac / 24.494)           # first guess: perfect Berkovich
+  Ac = np.power( np.asarray(stiffness) / (2.0*np.asarray(modulusRed)/math.sqrt(math.pi))  ,2)
+  hc0 = np.sqrt(Ac / 24.494)             # first guess: perfect Berkovich
   hc = self.tip.areaFunctionInverse(Ac, hc0=hc0)
-  h = hc + nonMetal*self.beta*pMax/stiffness
+  h = hc + nonMetal*self.beta*np.asarray(pMax)/np.asarray(stiffness)
   return h.flatten()
 
 
@@ -107,14 +130,19 @@ def unloadingPowerFunc(h,B,hf,m):
   return value
 
 
-def stiffnessFromUnloading(self, p, h, plot=False):
+@instrumented
+def stiffnessFromUnloading(self, p, h, plot=False, iLHU=None):
   """
   Calculate single unloading stiffness from Unloading; see G200 manual, p7-6
 
+  - all unloading segments of the test are fitted in one batched call, see fitUnloading
+  - if fitting fails, a linear fit is used
+
   Args:
       p (np.array): vector of forces
       h (np.array): vector of depth
       plot (bool): plot results
+      iLHU (list): load-hold-unload cycles, e.g. of a TestData; default: those of current test
 
   Returns:
       list: stiffness, validMask, mask, optimalVariables, powerlawFit-success |br|
@@ -123,95 +151,363 @@ def stiffnessFromUnloading(self, p, h, plot=False):
   if self.method== Method.CSM:
     print("*ERROR* Should not land here: CSM method")
     return None, None, None, None, None
+  if iLHU is None:
+    iLHU = self.iLHU
   if self.verbose>2:
-    print("Number of unloading segments:"+str(len(self.iLHU))+"  Method:"+str(self.method))
-  stiffness, mask, opt, powerlawFit = [], None, None, []
-  validMask = np.zeros_like(p, dtype=bool)
+    print("Number of unloading segments:"+str(len(iLHU))+"  Method:"+str(self.method))
+  masks = self.unloadingMasks(p, h, iLHU)
+  if masks is None:
+    return None, None, None, None, None
+  segments = [(h[mask], p[mask]) for mask in masks]
+  opts, powerlawFit = fitUnloading(segments, verbose=self.verbose, instrumentation=self.instrumentation)
+  stiffness, validMask = self.unloadingStiffness(p, h, iLHU, masks, opts)
+  mask, opt = None, None
+  if len(masks)>0:
+    mask, opt = masks[-1], tuple(opts[-1])
   if plot:
     if isinstance(plot, bool):
       ax = plt.subplots()
     else:
       ax = plot
     ax.plot(h,p, '--k', label='data')
-  plot_with_lable=True
-  for cycleNum, cycle in enumerate(self.iLHU):
+    starts = unloadingInitialGuess(*padSegments(segments))
+    for cycleNum, cycle in enumerate(iLHU):
+      label = cycleNum==0
+      hMask, pMask = segments[cycleNum]
+      B,hf,m = opts[cycleNum]
+      idx = cycle[2] if self.evaluateStiffnessAtMax else np.where(masks[cycleNum])[0][0]
+      stiffnessValue= p[idx]-stiffness[cycleNum]*h[idx]
+      x_ = np.linspace(0.5*hMask.max(), hMask.max(), 100)
+      ax.plot(hMask,pMask,'-b', label='this cycle' if label else None)
+      ax.plot(x_,   self.unloadingPowerFunc(x_,B,hf,m),'m-', label='final fit' if label else None)
+      ax.plot(x_,   self.unloadingPowerFunc(x_,*starts[cycleNum]),'g-', label='initial fit' if label else None)
+      ax.plot(x_,   stiffness[cycleNum]*x_+stiffnessValue, 'r--', lw=3, label='linear at max' if label else None)
+    ax.set_xlim(left=0)
+    ax.set_ylim(bottom=0)
+    ax.legend()
+    ax.set_xlabel(r'depth [$\mathrm{\mu m}$]')
+    ax.set_ylabel(r'force [$\mathrm{mN}$]')
+    if isinstance(plot,bool):
+      plt.show()
+  return stiffness, validMask, mask, opt, powerlawFit
+
+
+@instrumented
+def stiffnessFromUnloadingAll(self, tests):
+  """
+  Calculate the unloading stiffness of many tests, e.g. of all tests of a file: the unloading segments of all
+  tests are fitted in one batched call
+
+  Args:
+      tests (list): TestData of each test including the load-hold-unload cycles, e.g. of getTestData; the depth is
+        corrected by the frame compliance, as in analyse
+
+  Returns:
+      list: stiffness and validMask of each test; None for tests without cycles or usable unloading segments
+  """
+  masks, segments = [], []
+  for data in tests:
+    if not data.iLHU:  #not identified or no unloading segment
+      masks.append(None)
+      continue
+    h = data.h - self.tip.compliance*data.p
+    masks.append(self.unloadingMasks(data.p, h, data.iLHU))
+    if masks[-1] is not None:
+      segments += [(h[mask], data.p[mask]) for mask in masks[-1]]
+  opts, _ = fitUnloading(segments, verbose=self.verbose, instrumentation=self.instrumentation)
+  results, start = [], 0
+  for data, masksTest in zip(tests, masks):
+    if masksTest is None:
+      results.append(None)
+      continue
+    h = data.h - self.tip.compliance*data.p
+    results.append(self.unloadingStiffness(data.p, h, data.iLHU, masksTest, opts[start:start+len(masksTest)]))
+    start += len(masksTest)
+  return results
+
+
+def unloadingMasks(self, p, h, iLHU):
+  """
+  internal function: mask of the fitted part of each unloading segment: between unloadPMin and unloadPMax
+  relative to the maximum force
+
+  Args:
+      p (np.array): vector of forces
+      h (np.array): vector of depth
+      iLHU (list): load-hold-unload cycles
+
+  Returns:
+      list: mask of each cycle; None if one mask is empty
+  """
+  masks = []
+  for cycle in iLHU:
     loadStart, loadEnd, unloadStart, unloadEnd = cycle
     if loadStart>loadEnd or loadEnd>unloadStart or unloadStart>unloadEnd:
       print('*ERROR* stiffnessFromUnloading: indicies not in order:',cycle)
     maskSegment = np.zeros_like(h, dtype=bool)
     maskSegment[unloadStart:unloadEnd+1] = True
-    print('loadEnd',loadEnd)
     maskForce   = np.logical_and(p<p[loadEnd]*self.unloadPMax, p>p[loadEnd]*self.unloadPMin)
     mask        = np.logical_and(maskSegment,maskForce)
     if len(mask[mask])==0:
       print('*ERROR* mask of unloading is empty. Cannot fit\n')
-      return None, None, None, None, None
-    if plot:
-      if plot_with_lable:
-        ax.plot(h[mask],p[mask],'-b', label='this cycle')
-      else:
-        ax.plot(h[mask],p[mask],'-b')
-
-    #initial values of fitting
-    hf0    = h[mask][-1]/2.0
-    m0     = 2
-    B0     = max(abs(p[mask][0] / np.power(h[mask][0]-hf0,m0)), 0.001)  #prevent neg. or zero
-    bounds = [[0,0,0.8],[np.inf, max(np.min(h[mask]),hf0), 10]]
-    if self.verbose>2:
-      print("Initial fitting values B,hf,m", B0,hf0,m0)
-      print("Bounds", bounds)
-    # Old linear assumptions
-    # B0  = (P[mask][-1]-P[mask][0])/(h[mask][-1]-h[mask][0])
-    # hf0 = h[mask][0] - P[mask][0]/B0
-    # m0  = 1.5 #to get of axis
-    try:
-      opt, _ = curve_fit(self.unloadingPowerFunc, h[mask],p[mask],      # pylint: disable=unbalanced-tuple-unpacking
-                         p0=[B0,hf0,m0], bounds=bounds,
-                         ftol=1e-4, maxfev=3000 )#set ftol to 1e-4 if accept more and fail less
-      if self.verbose>2:
-        print("Optimal values B,hf,m", opt)
-      B,hf,m = opt
-      if np.isnan(B):
-        raise ValueError("NAN after fitting")
-      powerlawFit.append(True)
-    except:
-      #if fitting fails: often the initial bounds and initial values do not match
-      print(traceback.format_exc())
-      if self.verbose>0:
-        print("stiffnessFrommasking: #",cycleNum," Fitting failed. use linear")
-      B  = (p[mask][-1]-p[mask][0])/(h[mask][-1]-h[mask][0])
-      hf = h[mask][0] -p[mask][0]/B
-      m  = 1.
-      opt= (B,hf,m)
-      powerlawFit.append(False)
+      return None
+    masks.append(mask)
+  return masks
 
 
+def unloadingStiffness(self, p, h, iLHU, masks, opts):
+  """
+  internal function: stiffness of the fitted unloading segments at the maximum depth or at the start of the fit
+
+  Args:
+      p (np.array): vector of forces
+      h (np.array): vector of depth
+      iLHU (list): load-hold-unload cycles
+      masks (list): mask of each cycle, see unloadingMasks
+      opts (np.array): B, hf, m of each cycle, see fitUnloading
+
+  Returns:
+      list: stiffness, validMask
+  """
+  stiffness = []
+  validMask = np.zeros_like(p, dtype=bool)
+  for cycle, mask, (B,hf,m) in zip(iLHU, masks, opts):
     if self.evaluateStiffnessAtMax:
-      stiffnessPlot = B*m*math.pow( h[unloadStart]-hf, m-1)
-      stiffnessValue= p[unloadStart]-stiffnessPlot*h[unloadStart]
-      validMask[unloadStart]=True
+      stiffness.append(B*m*math.pow( h[cycle[2]]-hf, m-1))
+      validMask[cycle[2]]=True
     else:
-      stiffnessPlot = B*m*math.pow( (h[mask][0]-hf), m-1)
-      stiffnessValue= p[mask][0]-stiffnessPlot*h[mask][0]
-      validMask[ np.where(mask)[0][0] ]=True
-    stiffness.append(stiffnessPlot)
-    if plot:
-      x_ = np.linspace(0.5*h[mask].max(), h[mask].max(), 100)
-      if plot_with_lable:
-        ax.plot(x_,   self.unloadingPowerFunc(x_,B,hf,m),'m-', label='final fit')
-        ax.plot(x_,   self.unloadingPowerFunc(x_,B0,hf0,m0),'g-', label='initial fit')
-        ax.plot(x_,   stiffnessPlot*x_+stiffnessValue, 'r--', lw=3, label='linear at max')
-        plot_with_lable = False
-      else:
-        ax.plot(x_,   self.unloadingPowerFunc(x_,B,hf,m),'m-')
-        ax.plot(x_,   self.unloadingPowerFunc(x_,B0,hf0,m0),'g-')
-        ax.plot(x_,   stiffnessPlot*x_+stiffnessValue, 'r--', lw=3)
-  if plot:
-    ax.set_xlim(left=0)
-    ax.set_ylim(bottom=0)
-    ax.legend()
-    ax.set_xlabel(r'depth [$\mathrm{\mu m}$]')
-    ax.set_ylabel(r'force [$\mathrm{mN}$]')
-    if isinstance(plot,bool):
-      plt.show()
-  return stiffness, validMask, mask, opt, powerlawFit
+      idx = np.where(mask)[0][0]
+      stiffness.append(B*m*math.pow( h[idx]-hf, m-1))
+      validMask[idx]=True
+  return stiffness, validMask
+
+
+def fitUnloading(segments, ftol=1e-10, maxIter=200, verbose=1, instrumentation=None):
+  """
+  Fit unloadingPowerFunc to many unloading segments in one batched call
+
+  - Levenberg-Marquardt iterations of all segments at once with the analytic Jacobian
+  - bounds: B>0, 0<hf<minimal depth of segment, 0.8<m<10
+  - initial values: best of vectorized log-linear fits, see unloadingInitialGuess
+  - a segment that does not converge is fitted again, starting from the result of the previous segment, if that
+    segment converged (warm start); the first segment and segments after a failed one are not fitted again
+  - if this fails, a linear fit is used (m=1)
+
+  Args:
+      segments (list): depth and force of each segment
+      ftol (float): relative change of the sum of squares at convergence
+      maxIter (int): maximum number of iterations
+      verbose (int): verbosity
+      instrumentation (Instrumentation): count segments, iterations, warm starts and linear fallbacks
+
+  Returns:
+      list: B, hf, m of each segment as array, success of power law fit of each segment
+  """
+  if len(segments)==0:
+    return np.zeros((0,3)), []
+  h, p, weight = padSegments(segments)
+  hMin = np.where(weight, h, np.inf).min(axis=1)
+  lower = np.repeat([[0., 0., 0.8]], len(segments), axis=0)
+  hLast = np.array([i[0][-1] for i in segments])
+  upper = np.column_stack([np.full(len(segments), np.inf), np.maximum(hMin, hLast/2.), np.full(len(segments), 10.)])
+  opts, converged, iterations = levenbergMarquardt(h, p, weight, unloadingInitialGuess(h, p, weight), lower, upper,
+                                                   ftol, maxIter)
+  warmStarts = 0
+  for idx in np.where(~converged)[0]:
+    if idx>0 and converged[idx-1]:
+      start = np.clip(opts[idx-1:idx], lower[idx:idx+1], upper[idx:idx+1])
+      opts[idx:idx+1], converged[idx:idx+1], iterationsWarm = levenbergMarquardt(h[idx:idx+1], p[idx:idx+1],
+                                    weight[idx:idx+1], start, lower[idx:idx+1], upper[idx:idx+1], ftol, maxIter)
+      iterations += iterationsWarm
+      warmStarts += 1
+    if not converged[idx]:
+      #if fitting fails: often the initial values do not match
+      if verbose>0:
+        print("stiffnessFromUnloading: #",idx," Fitting failed. use linear")
+      hSegment, pSegment = segments[idx]
+      B  = (pSegment[-1]-pSegment[0])/(hSegment[-1]-hSegment[0])
+      opts[idx] = (B, hSegment[0]-pSegment[0]/B, 1.)
+  if verbose>2:
+    print("Optimal values B,hf,m", opts)
+  if instrumentation is not None:
+    instrumentation.count('fit segments', len(segments))
+    instrumentation.count('fit iterations', iterations)
+    instrumentation.count('fit warm starts', warmStarts)
+    instrumentation.count('fit linear fallbacks', np.count_nonzero(~converged))
+  return opts, [bool(i) for i in converged]
+
+
+def levenbergMarquardt(h, p, weight, start, lower, upper, ftol, maxIter):
+  """
+  internal function: batched Levenberg-Marquardt fit of unloadingPowerFunc within bounds
+
+  Args:
+      h (np.array): depth of all segments, padded to the same length
+      p (np.array): force of all segments, padded to the same length
+      weight (np.array): mask of points of segments
+      start (np.array): initial B, hf, m of each segment
+      lower (np.array): lower bounds of B, hf, m of each segment
+      upper (np.array): upper bounds of B, hf, m of each segment
+      ftol (float): relative change of the sum of squares at convergence
+      maxIter (int): maximum number of iterations
+
+  Returns:
+      list: B, hf, m of each segment, convergence of each segment, number of iterations of all segments
+  """
+  opts = np.array(start, dtype=np.float64)
+  cost = unloadingCost(opts, h, p, weight)
+  damping = np.full(len(opts), 1.e-3)
+  active = np.isfinite(cost)
+  converged = np.zeros(len(opts), dtype=bool)
+  iterations = 0
+  for _ in range(maxIter):
+    idx = np.where(active)[0]
+    if len(idx)==0:
+      break
+    iterations += len(idx)
+    jacobian = unloadingJacobian(opts[idx], h[idx], weight[idx])
+    residual = unloadingResidual(opts[idx], h[idx], p[idx], weight[idx])
+    normal   = np.einsum('kni,knj->kij', jacobian, jacobian)
+    gradient = np.einsum('kni,kn->ki', jacobian, residual)
+    scale    = np.einsum('kii->ki', normal)
+    scale    = np.where(scale>0, scale, 1.)
+    normal  += damping[idx,None,None]*scale[:,None,:]*np.eye(3)
+    with np.errstate(invalid='ignore'):
+      try:
+        step = -np.linalg.solve(normal, gradient[:,:,None])[:,:,0]
+      except np.linalg.LinAlgError:
+        step = -gradient/scale
+    trial     = np.clip(opts[idx]+step, lower[idx], upper[idx])
+    costTrial = unloadingCost(trial, h[idx], p[idx], weight[idx])
+    better    = costTrial<cost[idx]
+    change    = (cost[idx]-costTrial)/np.maximum(cost[idx], np.finfo(float).tiny)
+    opts[idx[better]] = trial[better]
+    cost[idx[better]] = costTrial[better]
+    damping[idx] = np.where(better, damping[idx]/3., damping[idx]*4.)
+    done = np.logical_or(better & (change<ftol), damping[idx]>1.e12)
+    converged[idx[done]] = True
+    active[idx[done]] = False
+  converged &= np.isfinite(opts).all(axis=1) & np.isfinite(cost)
+  return opts, converged, iterations
+
+
+def unloadingInitialGuess(h, p, weight):
+  """
+  internal function: initial values of unloadingPowerFunc for all segments: the best of linear fits of
+  log(p) = log(B) + m log(h-hf) for a few fixed final depths hf, and the previous default (hf=last depth/2, m=2)
+
+  Args:
+      h (np.array): depth of all segments, padded to the same length
+      p (np.array): force of all segments, padded to the same length
+      weight (np.array): mask of points of segments
+
+  Returns:
+      np.array: B, hf, m of each segment
+  """
+  number = weight.sum(axis=1)
+  hMin   = np.where(weight, h, np.inf).min(axis=1)
+  hLast  = h[np.arange(len(h)), number-1]
+  hf     = hLast/2.
+  m      = np.full(len(h), 2.)
+  with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+    B    = np.maximum(np.abs(p[:,0]/np.power(h[:,0]-hf, m)), 0.001)
+    best = np.column_stack([B, hf, m])
+    cost = unloadingCost(best, h, p, weight)
+    for fraction in [0., 0.3, 0.5, 0.7, 0.8, 0.9, 0.95]:
+      hf    = fraction*hMin
+      use   = weight & (p>0) & (h>hf[:,None])
+      count = use.sum(axis=1)
+      x     = np.where(use, np.log(np.where(use, h-hf[:,None], 1.)), 0.)
+      y     = np.where(use, np.log(np.where(use, p, 1.)), 0.)
+      xMean = x.sum(axis=1)/count
+      yMean = y.sum(axis=1)/count
+      x     = np.where(use, x-xMean[:,None], 0.)
+      m     = np.clip((x*(y-yMean[:,None])).sum(axis=1)/(x*x).sum(axis=1), 0.8, 10.)
+      trial = np.column_stack([np.exp(yMean-m*xMean), hf, m])
+      costTrial = unloadingCost(trial, h, p, weight)
+      better = costTrial<cost
+      best[better] = trial[better]
+      cost[better] = costTrial[better]
+  return best
+
+
+def padSegments(segments):
+  """
+  internal function: depth and force of segments of different length as 2D arrays
+
+  Args:
+      segments (list): depth and force of each segment
+
+  Returns:
+      list: depth, force, mask of points of segments
+  """
+  length = max(len(i[0]) for i in segments)
+  h      = np.zeros((len(segments), length))
+  p      = np.zeros((len(segments), length))
+  weight = np.zeros((len(segments), length), dtype=bool)
+  for idx, (hSegment, pSegment) in enumerate(segments):
+    h[idx,:len(hSegment)] = hSegment
+    h[idx,len(hSegment):] = hSegment[-1]
+    p[idx,:len(pSegment)] = pSegment
+    weight[idx,:len(hSegment)] = True
+  return h, p, weight
+
+
+def unloadingResidual(opts, h, p, weight):
+  """
+  internal function: residual of unloadingPowerFunc of all segments; 0 outside of segments
+
+  Args:
+      opts (np.array): B, hf, m of each segment
+      h (np.array): depth of all segments
+      p (np.array): force of all segments
+      weight (np.array): mask of points of segments
+
+  Returns:
+      np.array: residual
+  """
+  depth = np.maximum(h-opts[:,1:2], 0.)
+  return np.where(weight, opts[:,0:1]*np.power(depth, opts[:,2:3])-p, 0.)
+
+
+def unloadingCost(opts, h, p, weight):
+  """
+  internal function: sum of squared residuals of each segment; infinite if not finite
+
+  Args:
+      opts (np.array): B, hf, m of each segment
+      h (np.array): depth of all segments
+      p (np.array): force of all segments
+      weight (np.array): mask of points of segments
+
+  Returns:
+      np.array: cost of each segment
+  """
+  with np.errstate(over='ignore', invalid='ignore'):
+    cost = np.square(unloadingResidual(opts, h, p, weight)).sum(axis=1)
+  return np.where(np.isfinite(cost), cost, np.inf)
+
+
+def unloadingJacobian(opts, h, weight):
+  """
+  internal function: analytic Jacobian of unloadingPowerFunc with respect to B, hf, m
+
+  - dp/dB  = (h-hf)^m
+  - dp/dhf = -B m (h-hf)^(m-1)
+  - dp/dm  = B (h-hf)^m ln(h-hf)
+
+  Args:
+      opts (np.array): B, hf, m of each segment
+      h (np.array): depth of all segments
+      weight (np.array): mask of points of segments
+
+  Returns:
+      np.array: Jacobian of each segment and point
+  """
+  B, hf, m = opts[:,0:1], opts[:,1:2], opts[:,2:3]
+  depth = np.maximum(h-hf, 0.)
+  positive = weight & (depth>0)
+  depth = np.where(positive, depth, 1.)
+  power = np.where(positive, np.power(depth, m), 0.)
+  jacobian = np.stack([power, -B*m*power/depth, B*power*np.log(depth)], axis=2)
+  return np.where(weight[:,:,None], jacobian, 0.)
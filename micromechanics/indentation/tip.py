@@ -1,8 +1,9 @@
 """Nanoindenter tip: shape / area-function and the compliance"""
-import math
+import math, threading
+from functools import lru_cache
 import numpy as np
 import matplotlib.pyplot as plt
-from scipy.optimize import newton
+from scipy.interpolate import interp1d
 
 class Tip:
   """The main class to define indenter shape and other default values."""
@@ -90,6 +91,8 @@ class Tip:
     Returns:
        area: projected contact area [um^2]
     """
+    if self.prefactors is not None and self.prefactors[-1] in ('iso', 'isoPlusConstant'):
+      return areaFunctionEvaluator(tuple(self.prefactors))(h)
     h = h* 1000.   #starting here: all is in nm
     threshH = 1.e-3 #1pm
     h[h< threshH] = threshH
@@ -129,34 +132,71 @@ class Tip:
     return area/1.e6 # conversion of unit from nm^2 to um^2
 
 
-  def areaFunctionInverse(self, area, hc0=70):
+  def areaFunctionInverse(self, area, hc0=None):
     """
     INVERSE AREA FUNCTION: from area calculate contact depth hc |br|
-    using Newton iteration with initial guess contact depth hc0
+    vectorized: all areas are solved at once
 
     prefactors:
 
-    -  "iso" type area function A=ax^2+bx^1+cx^0.5..., [nm]
+    -  "iso" type area function A=ax^2+bx^1+cx^0.5..., [nm]: Halley iteration with analytic derivatives
+    -  "isoPlusConstant" type: same as iso with shifted depth
     -  "perfect" type area function of a perfect Berkovich A=3*sqrt(3)*tan(65.27)^2 hc^2 = 24.494 hc^2
+    -  "sphere" type: closed form for spherical and tapered section
+    -  interpolation function: inverse interpolation of its table, which has to be monotonous
 
     Args:
-       area (numpy.array): projected contact area
-       hc0 (numpy.array): initial Guess contact depth
+       area (numpy.array): projected contact area [um^2]
+       hc0 (numpy.array): initial guess contact depth [um]; None=from leading term
 
     Returns:
-       numpy.array: h = total penetration depth
-    """
-    ## define function in form f(x)-y=0
-    def function(height):
-      return self.areaFunction(np.array([height]))-area
-    ## solve
-    if self.prefactors[-1]=="iso":
-      h = newton(function, hc0)
-    elif self.prefactors[-1]=="perfect":
-      h = math.sqrt(area / 24.494)
+       numpy.array: contact depth hc [um]
+    """
+    area = np.asarray(area, dtype=np.float64)
+    if self.prefactors is None:
+      depth, areaTable = np.asarray(self.interpFunction.x), np.asarray(self.interpFunction.y)
+      if not np.all(np.diff(areaTable)>0):
+        print("*ERROR*: interpolation function is not monotonous: cannot be inverted")
+        return None
+      return interp1d(areaTable, depth, bounds_error=False, fill_value='extrapolate')(area)
+    area = area*1.e6  #starting here: all is in nm
+    threshH = 1.e-3 #1pm
+    if self.prefactors[-1] in ('iso', 'isoPlusConstant'):
+      shift = self.prefactors[-2] if self.prefactors[-1]=='isoPlusConstant' else 0.
+      coefficients = np.array(self.prefactors[:-2] if shift else self.prefactors[:-1], dtype=np.float64)
+      exponents = 2./np.power(2., np.arange(len(coefficients)))
+      if hc0 is None:
+        h = np.sqrt(area / (coefficients[0] if coefficients[0]>0 else 24.494))
+      else:
+        h = np.asarray(hc0, dtype=np.float64)*1000.+shift + np.zeros_like(area)
+      h = np.maximum(h, threshH)
+      for _ in range(50):
+        value, slope, curvature = -area, np.zeros_like(h), np.zeros_like(h)
+        for coefficient, exponent in zip(coefficients, exponents):
+          term = coefficient*np.power(h, exponent-2.)
+          value     = value + term*h*h
+          slope     = slope + exponent*term*h
+          curvature = curvature + exponent*(exponent-1.)*term
+        step = 2.*value*slope / (2.*slope*slope - value*curvature)
+        h = np.maximum(h-step, threshH)
+        if np.all(np.abs(step) <= 1.e-12*h):
+          break
+      else:
+        print("*WARNING*: inverse area function did not converge")
+      h -= shift
+    elif self.prefactors[-1]=='perfect':
+      h = np.sqrt(area / 24.494)
+    elif self.prefactors[-1]=='sphere':
+      radius = self.prefactors[0]*1000.
+      openingAngle = self.prefactors[1]/180.0*math.pi
+      rArea = np.sqrt(area/math.pi)
+      mask  = rArea <= radius*math.cos(openingAngle)          #spherical section
+      h = np.where(mask, radius-np.sqrt(np.maximum(radius**2-rArea**2, 0.)),
+                   radius-(radius/math.cos(openingAngle)-rArea)/math.tan(openingAngle))  #tapered section
     else:
       print("*ERROR*: prefactors last value does not contain type")
-    return h
+      return None
+    return h/1000. # conversion of unit from nm to um
 
 
   def plotIndenterShape(self, maxDepth=1, steps=50, show=True, tipLabel=None, fileName=None):
@@ -191,3 +231,96 @@ class Tip:
         plt.savefig(fileName, dpi=150, bbox_inches='tight')
       plt.show()
     return
+
+
+
+class AreaFunction:
+  """
+  Evaluator of "iso" type area functions A = c0 h^2 + c1 h + c2 h^1/2 + c3 h^1/4 + ...  |br|
+  built once from the prefactors:
+
+  - conversion [nm] to [um] is included in the coefficients
+  - powers are evaluated by a chain of square roots, first two terms by Horner scheme
+  - working arrays are reused between calls of the same length (separately for each thread)
+  """
+  def __init__(self, prefactors):
+    """
+    Initialize evaluator
+
+    Args:
+      prefactors (list): prefactors of tip in [nm] ending with 'iso' or 'isoPlusConstant'
+    """
+    self.prefactors = None
+    self.buffers = threading.local()
+    self.update(prefactors)
+    return
+
+
+  def update(self, prefactors):
+    """
+    Use new prefactors, keep working arrays, e.g. during fitting
+
+    Args:
+      prefactors (list): prefactors of tip in [nm] ending with 'iso' or 'isoPlusConstant'
+    """
+    if tuple(prefactors)==self.prefactors:
+      return
+    self.prefactors = tuple(prefactors)
+    if prefactors[-1]=='isoPlusConstant':
+      self.shift = prefactors[-2]/1000.
+      coefficients = prefactors[:-2]
+    else:
+      if prefactors[-1]!='iso':
+        print("*ERROR*: AreaFunction only for iso and isoPlusConstant prefactors")
+      self.shift = 0.
+      coefficients = prefactors[:-1]
+    exponents = 2./np.power(2., np.arange(len(coefficients)))
+    self.coefficients = [float(c)*np.power(1000., e)/1.e6 for c, e in zip(coefficients, exponents)]
+    return
+
+
+  def __call__(self, h, out=None):
+    """
+    Evaluate area function
+
+    Args:
+      h (numpy.array): contact depth [um]
+      out (numpy.array): array for result; None=new array
+
+    Returns:
+      numpy.array: projected contact area [um^2]
+    """
+    h = np.asarray(h, dtype=np.float64)
+    root, temp = getattr(self.buffers, 'arrays', (None, None))
+    if root is None or root.shape!=h.shape:
+      root, temp = np.empty_like(h), np.empty_like(h)
+      self.buffers.arrays = (root, temp)
+    if out is None:
+      out = np.empty_like(h)
+    np.maximum(h, 1.e-6, out=root)   #threshold 1pm
+    if self.shift:
+      root += self.shift
+    np.multiply(root, self.coefficients[0], out=out)
+    if len(self.coefficients)>1:
+      out += self.coefficients[1]
+    out *= root
+    for coefficient in self.coefficients[2:]:
+      np.sqrt(root, out=root)
+      np.multiply(root, coefficient, out=temp)
+      out += temp
+    np.maximum(out, 0., out=out)
+    return out
+
+
+@lru_cache(maxsize=32)
+def areaFunctionEvaluator(prefactors):
+  """
+  Evaluator for these prefactors: created once and reused
+
+  Args:
+    prefactors (tuple): prefactors of tip in [nm] ending with 'iso' or 'isoPlusConstant'
+
+  Returns:
+    AreaFunction: evaluator
+  """
+  return AreaFunction(prefactors)
@@ -3,7 +3,7 @@ import traceback
 import unittest
 import numpy as np
 import matplotlib.pyplot as plt
-from micromechanics.indentation import Indentation
+from micromechanics.indentation import Indentation, CalibrationSession
 
 class TestStringMethods(unittest.TestCase):
 	def test_calibration(self):
@@ -14,6 +14,13 @@ class TestStringMethods(unittest.TestCase):
 			prerecorded = np.array([25.99088100777346, 305.6978416681741, 2050.70109154738])
 			self.assertTrue(np.max(np.abs(np.array(i.tip.prefactors[:-1])-prerecorded))<0.1,
 								'Tip prefactors changed to '+str(i.tip.prefactors))
+			i.calibration(data=True)  #reuse collected data
+			self.assertTrue(np.max(np.abs(np.array(i.tip.prefactors[:-1])-prerecorded))<0.1,
+								'Tip prefactors of reused data changed to '+str(i.tip.prefactors))
+			session = CalibrationSession(Indentation('examples/Agilent/FS_Calibration.xls', nuMat = 0.18))
+			session.calibration()
+			self.assertTrue(np.max(np.abs(np.array(session.indentation.tip.prefactors[:-1])-prerecorded))<0.1,
+								'Tip prefactors of calibration session changed to '+str(session.indentation.tip.prefactors))
 			### END OF MAIN ###
 			print('\n*** DONE WITH VERIFY ***')
 		except:
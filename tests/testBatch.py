@@ -0,0 +1,104 @@
+#!/usr/bin/python3
+import traceback
+import unittest
+import numpy as np
+from micromechanics.indentation import Indentation
+
+class TestStringMethods(unittest.TestCase):
+	def test_analyseAll(self):
+		try:
+			### MAIN ###
+			i = Indentation('examples/Agilent/NiAl_250nm_TUIL_max_depth_1000nm_GM3_SM_previousGM1.xls')
+			modulus = []
+			for testname in i:
+				i.analyse()
+				modulus += i.metaUser['E_GPa']
+			for backend in ['thread','process']:
+				result = i.analyseAll(workers=3, backend=backend)
+				self.assertEqual(len(result), len(modulus), 'Number of results differ for '+backend)
+				self.assertTrue(np.allclose(result['E_GPa'], modulus), 'Modulus differs for '+backend)
+				self.assertEqual(list(result['test'].unique()), i.allTestList, 'Order of tests changed')
+			recalculated = i.recalculateAll(result)
+			self.assertTrue(np.allclose(recalculated['E_GPa'], modulus), 'Recalculated modulus differs')
+			### END OF MAIN ###
+			print('\n*** DONE WITH VERIFY ***')
+		except:
+			print('ERROR OCCURRED IN VERIFY TESTING\n'+ traceback.format_exc() )
+			self.assertTrue(False,'Exception occurred')
+		return
+
+	def test_loadTest(self):
+		try:
+			### MAIN ###
+			for fileName in ['examples/Agilent/NiAl_250nm_TUIL_max_depth_1000nm_GM3_SM_previousGM1.xls',
+			                 'examples/FischerScope/N1_1.hdf5']:
+				i = Indentation(fileName)
+				j = Indentation(fileName)
+				for _ in range(3):
+					j.nextTest()
+				i.loadTest(i.allTestList[3])
+				self.assertEqual(i.testName, j.testName, 'Different test loaded for '+fileName)
+				self.assertTrue(np.array_equal(i.h, j.h), 'Depth differs for '+fileName)
+				self.assertEqual(i.testList, j.testList, 'Following tests differ for '+fileName)
+			### END OF MAIN ###
+			print('\n*** DONE WITH VERIFY ***')
+		except:
+			print('ERROR OCCURRED IN VERIFY TESTING\n'+ traceback.format_exc() )
+			self.assertTrue(False,'Exception occurred')
+		return
+
+	def test_testData(self):
+		try:
+			### MAIN ###
+			#current test can be changed in place; the record of the reader stays unchanged
+			for fileName in ['examples/Agilent/FS_XP.xls', 'examples/Hysitron/Exp-50mN_0000.hld',
+			                 'examples/Hysitron/RobinSteel0000LC.txt',
+			                 'examples/Agilent/FQ.xls']:
+				i = Indentation(fileName)
+				h, record = np.array(i.h), np.array(i.testData.h)
+				i.h -= i.tip.compliance*i.p+0.1
+				self.assertTrue(np.allclose(i.h, h-i.tip.compliance*i.p-0.1), 'Depth not changed for '+fileName)
+				self.assertTrue(np.array_equal(i.testData.h, record), 'Record changed for '+fileName)
+				self.assertFalse(i.testData.h.flags.writeable, 'Record is writable for '+fileName)
+				data = i.getTestData()
+				i.p *= 2.
+				self.assertFalse(np.array_equal(data.p, i.p), 'Copy of test shares force for '+fileName)
+			### END OF MAIN ###
+			print('\n*** DONE WITH VERIFY ***')
+		except:
+			print('ERROR OCCURRED IN VERIFY TESTING\n'+ traceback.format_exc() )
+			self.assertTrue(False,'Exception occurred')
+		return
+
+	def test_micromaterialsZip(self):
+		try:
+			### MAIN ###
+			fileName = 'examples/Micromaterials/multipleIndentations.zip'
+			i = Indentation(fileName)
+			j = Indentation(fileName, prefetch=3)
+			store = i.readAllMicromaterialsTests(workers=3)
+			offsets = store.info['offsets']
+			for idx, testName in enumerate(i.allTestList):
+				data = j.readTest(testName)
+				self.assertTrue(np.array_equal(data.h, i.readTest(testName).h), 'Prefetched data differs for '+testName)
+				self.assertTrue(np.array_equal(data.h, store['h'][offsets[idx]:offsets[idx+1]]), 'Stored data differs for '+testName)
+				self.assertLessEqual(len(j.prefetchFutures), 3, 'Read-ahead not bounded')
+			for _ in j:
+				pass
+			self.assertIsNone(j.prefetchPool, 'Threads not stopped after last test')
+			k = Indentation(fileName, prefetch=3)
+			self.assertIsNotNone(k.prefetchPool, 'No threads for read-ahead')
+			k.close()
+			self.assertIsNone(k.prefetchPool, 'Threads not stopped when file is closed')
+			### END OF MAIN ###
+			print('\n*** DONE WITH VERIFY ***')
+		except:
+			print('ERROR OCCURRED IN VERIFY TESTING\n'+ traceback.format_exc() )
+			self.assertTrue(False,'Exception occurred')
+		return
+
+	def tearDown(self):
+		return
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,124 @@
+#!/usr/bin/python3
+import contextlib
+import io
+import tempfile
+import traceback
+import unittest
+from pathlib import Path
+import numpy as np
+from micromechanics.indentation import Indentation, AnalysisCache
+from micromechanics.indentation.cache import evictCache
+
+class TestStringMethods(unittest.TestCase):
+	def test_cache(self):
+		try:
+			### MAIN ###
+			with tempfile.TemporaryDirectory() as cacheDir:
+				for fileName in ['examples/Agilent/NiAl_250nm_TUIL_max_depth_1000nm_GM3_SM_previousGM1.xls',
+				                 'examples/Hysitron/Exp-50mN_0000.hld', 'examples/Micromaterials/multipleIndentations.zip']:
+					modulus = []
+					for cache in [False, cacheDir, cacheDir]:  #without cache, write cache, read cache
+						i = Indentation(fileName, cache=cache)
+						modulus.append([])
+						if i.testList is None:  #single test in file
+							i.analyse()
+							modulus[-1] += i.metaUser['E_GPa']
+						else:
+							for testname in i:
+								i.analyse()
+								modulus[-1] += i.metaUser['E_GPa']
+					self.assertIsNotNone(i.fileCache, 'Cache was not used for '+fileName)
+					self.assertTrue(np.allclose(modulus[0], modulus[1], equal_nan=True), 'Modulus differs for '+fileName)
+					self.assertTrue(np.allclose(modulus[0], modulus[2], equal_nan=True), 'Modulus from cache differs for '+fileName)
+			### END OF MAIN ###
+			print('\n*** DONE WITH VERIFY ***')
+		except:
+			print('ERROR OCCURRED IN VERIFY TESTING\n'+ traceback.format_exc() )
+			self.assertTrue(False,'Exception occurred')
+		return
+
+	def test_cacheWhileReading(self):
+		try:
+			### MAIN ###
+			fileName = 'examples/Micromaterials/multipleIndentations.zip'
+			with tempfile.TemporaryDirectory() as cacheDir:
+				i = Indentation(fileName, cache=cacheDir)
+				self.assertEqual(len(list(Path(cacheDir).glob('*.hdf5'))), 0, 'Cache file before all tests are read')
+				i.close()
+				self.assertEqual(len(list(Path(cacheDir).iterdir())), 0, 'Unfinished cache file not removed')
+				i = Indentation(fileName, cache=cacheDir)
+				for _ in i:
+					pass
+				self.assertEqual(len(list(Path(cacheDir).glob('*.hdf5'))), 1, 'Cache file not saved')
+				self.assertIsNotNone(Indentation(fileName, cache=cacheDir).fileCache, 'Cache file not used')
+				evictCache(cacheDir, maxBytes=0, maxAge=30)
+				self.assertEqual(len(list(Path(cacheDir).iterdir())), 0, 'Cache file not removed')
+			### END OF MAIN ###
+			print('\n*** DONE WITH VERIFY ***')
+		except:
+			print('ERROR OCCURRED IN VERIFY TESTING\n'+ traceback.format_exc() )
+			self.assertTrue(False,'Exception occurred')
+		return
+
+	def test_analyseAllCache(self):
+		try:
+			### MAIN ###
+			#workers only read the cache file, which is written before they start
+			fileName = 'examples/Micromaterials/multipleIndentations.zip'
+			modulus = Indentation(fileName).analyseAll(workers=1)['E_GPa']
+			for backend in ['thread', 'process']:
+				with tempfile.TemporaryDirectory() as cacheDir:
+					for _ in range(2):  #write cache, read cache
+						output = io.StringIO()
+						with contextlib.redirect_stdout(output):
+							i = Indentation(fileName, cache=cacheDir)
+							result = i.analyseAll(workers=3, backend=backend)
+							i.close()
+						self.assertNotIn('**ERROR', output.getvalue(), 'Error for '+backend)
+						self.assertTrue(np.allclose(result['E_GPa'], modulus), 'Modulus differs for '+backend)
+						self.assertEqual([i.suffix for i in Path(cacheDir).iterdir()], ['.hdf5'],
+							'Not one complete cache file for '+backend)
+			### END OF MAIN ###
+			print('\n*** DONE WITH VERIFY ***')
+		except:
+			print('ERROR OCCURRED IN VERIFY TESTING\n'+ traceback.format_exc() )
+			self.assertTrue(False,'Exception occurred')
+		return
+
+	def test_analysisCache(self):
+		try:
+			### MAIN ###
+			fileName = 'examples/Micromaterials/multipleIndentations.zip'
+			with tempfile.TemporaryDirectory() as cacheDir:
+				modulus = []
+				for analysisCache in [False, cacheDir, cacheDir]:  #without cache, write cache, read cache from disk
+					i = Indentation(fileName, analysisCache=analysisCache)
+					modulus.append([])
+					for testname in i:
+						i.analyse()
+						modulus[-1] += i.metaUser['E_GPa']
+				self.assertTrue(np.allclose(modulus[0], modulus[2]), 'Cached modulus differs')
+				self.assertIsNone(Indentation(fileName).analysisCache, 'Analysis cache not disabled by default')
+				#change of parameter is analysed again
+				i.restartFile()
+				i.nuMat = 0.2
+				i.analyse()
+				self.assertFalse(np.allclose(i.metaUser['E_GPa'], modulus[0][:len(i.metaUser['E_GPa'])]), 'Parameter change ignored')
+			#least recently used results are removed
+			cache = AnalysisCache(maxBytes=1000)
+			for idx in range(10):
+				cache.put(str(idx), {'slope':np.zeros(50)})
+			self.assertEqual(len(cache), 2, 'Size of cache not limited')
+			self.assertIsNone(cache.get('0'), 'Oldest results not removed')
+			### END OF MAIN ###
+			print('\n*** DONE WITH VERIFY ***')
+		except:
+			print('ERROR OCCURRED IN VERIFY TESTING\n'+ traceback.format_exc() )
+			self.assertTrue(False,'Exception occurred')
+		return
+
+	def tearDown(self):
+		return
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/python3
+import io
+import contextlib
+import json
+import os
+import shutil
+import tempfile
+import traceback
+import unittest
+import numpy as np
+import pandas as pd
+from micromechanics.indentation import Indentation, Tip
+from micromechanics.indentation.cli import main, analyseFile
+
+class TestStringMethods(unittest.TestCase):
+	def test_cli(self):
+		try:
+			### MAIN ###
+			directory = tempfile.mkdtemp()
+			self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+			badFile = os.path.join(directory, 'bad.txt')
+			with open(badFile, 'w', encoding='utf-8') as fOut:
+				fOut.write('no indentation data')
+			tables = []
+			for workers in ['1', '2']:
+				output = os.path.join(directory, f'results{workers}.csv')
+				with contextlib.redirect_stdout(io.StringIO()):
+					exitCode = main(['examples/Micromaterials', 'examples/Hysitron/*.hld', badFile, '--workers', workers,
+					                 '--nuMat', '0.18', '--compliance', '0.001', '--output', output])
+				self.assertEqual(exitCode, 1, 'Failure of file is not reported')
+				tables.append(pd.read_csv(output).sort_values(['file', 'test', 'segment'], ignore_index=True))
+				with open(output.replace('.csv', '_timing.json'), encoding='utf-8') as fIn:
+					timing = json.load(fIn)
+				self.assertEqual(timing['files'], 4, 'Number of files differs')
+				self.assertEqual(timing['failedFiles'], [badFile], 'Failed file differs')
+				self.assertGreater(timing['stages']['analyse']['calls'], 40, 'Stages of workers are not collected')
+			pd.testing.assert_frame_equal(tables[0], tables[1])
+			#tests without unloading segment are failed
+			output = os.path.join(directory, 'resultsFischerScope.csv')
+			with contextlib.redirect_stdout(io.StringIO()):
+				exitCode = main(['examples/FischerScope/FS1.txt', '--workers', '1', '--output', output])
+			self.assertEqual(exitCode, 1, 'Tests without unloading segment are not reported')
+			with open(output.replace('.csv', '_timing.json'), encoding='utf-8') as fIn:
+				timing = json.load(fIn)
+			self.assertEqual(timing['failedTests'], timing['perFile'][0]['tests'], 'Number of failed tests differs')
+			self.assertEqual({i[1] for i in timing['perFile'][0]['failed']}, {'no unloading segment'}, 'Reason differs')
+			#same results as analysis of file
+			i = Indentation('examples/Micromaterials/multipleIndentations.zip', nuMat=0.18)
+			i.tip.compliance = 0.001
+			results = i.analyseAll(workers=1)
+			table = tables[0][tables[0]['file'].str.endswith('.zip')]
+			self.assertEqual(len(table), len(results), 'Number of rows differs')
+			self.assertTrue(np.allclose(table['E_GPa'], results.sort_values('test')['E_GPa']), 'Modulus differs')
+			### END OF MAIN ###
+			print('\n*** DONE WITH VERIFY ***')
+		except:
+			print('ERROR OCCURRED IN VERIFY TESTING\n'+ traceback.format_exc() )
+			self.assertTrue(False,'Exception occurred')
+		return
+
+	def test_singleTestParameters(self):
+		try:
+			### MAIN ###
+			#segments of Hysitron hld-files are from the file; default parameters do not change the results
+			for fileName, key, value in [('examples/Hysitron/Exp-50mN_0000.hld', 'unloadPMax', 0.95),
+			                             ('examples/Hysitron/Exp-50mN_0000.hld', 'zeroGradDelta', 0.5),
+			                             ('examples/Hysitron/RobinSteel0000LC.txt', 'zeroGradDelta', 0.2)]:
+				settings = {'nuMat':0.3, 'nonMetal':1., 'tip':Tip(), 'unloadPMax':None, 'unloadPMin':None,
+				            'zeroGradDelta':None}
+				rows = analyseFile(fileName, settings)['rows']
+				settings[key] = value
+				rowsParameter = analyseFile(fileName, settings)['rows']
+				self.assertEqual(rowsParameter, rows, f'Results differ for {fileName} and {key}')
+			### END OF MAIN ###
+			print('\n*** DONE WITH VERIFY ***')
+		except:
+			print('ERROR OCCURRED IN VERIFY TESTING\n'+ traceback.format_exc() )
+			self.assertTrue(False,'Exception occurred')
+		return
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,112 @@
+#!/usr/bin/python3
+import importlib.util
+import io
+import os
+import shutil
+import tempfile
+import traceback
+import unittest
+from zipfile import ZipFile
+import h5py
+import numpy as np
+from micromechanics.indentation import Indentation, loadResults
+
+class TestStringMethods(unittest.TestCase):
+	def test_exportHDF5(self):
+		try:
+			### MAIN ###
+			directory = tempfile.mkdtemp()
+			self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+			fileName = os.path.join(directory, 'results.hdf5')
+			i = Indentation('examples/Agilent/NiAl_250nm_TUIL_max_depth_1000nm_GM3_SM_previousGM1.xls')
+			results = i.analyseAll(workers=1)
+			self.assertTrue(i.exportResults(fileName, results, append=False), 'Export failed')
+			i.analyse()
+			self.assertTrue(i.exportResults(fileName), 'Append failed')
+			table = loadResults(fileName)
+			self.assertEqual(len(table), len(results)+len(i.modulus), 'Number of rows differs')
+			self.assertEqual(table['segment'].dtype, np.int64, 'Segment is not integer')
+			self.assertTrue(np.allclose(table['E_GPa'][:len(results)], results['E_GPa']), 'Modulus differs')
+			self.assertEqual(list(table['test'][len(results):].unique()), [i.testName], 'Test name differs')
+			### END OF MAIN ###
+			print('\n*** DONE WITH VERIFY ***')
+		except:
+			print('ERROR OCCURRED IN VERIFY TESTING\n'+ traceback.format_exc() )
+			self.assertTrue(False,'Exception occurred')
+		return
+
+	@unittest.skipIf(importlib.util.find_spec('pyarrow') is None, 'pyarrow is not installed')
+	def test_exportParquet(self):
+		try:
+			### MAIN ###
+			with tempfile.TemporaryDirectory() as tempDir:
+				fileName = os.path.join(tempDir, 'results.parquet')
+				i = Indentation('examples/Agilent/NiAl_250nm_TUIL_max_depth_1000nm_GM3_SM_previousGM1.xls')
+				results = i.analyseAll(workers=1)
+				self.assertTrue(i.exportResults(fileName, results, append=False), 'Export failed')
+				i.analyse()
+				self.assertTrue(i.exportResults(fileName), 'Append failed')
+				table = loadResults(fileName)
+				self.assertEqual(len(table), len(results)+len(i.modulus), 'Number of rows differs')
+				self.assertEqual(table['segment'].dtype, np.int64, 'Segment is not integer')
+				self.assertTrue(np.allclose(table['E_GPa'][:len(results)], results['E_GPa']), 'Modulus differs')
+				self.assertEqual(list(table['test'][len(results):].unique()), [i.testName], 'Test name differs')
+			### END OF MAIN ###
+			print('\n*** DONE WITH VERIFY ***')
+		except:
+			print('ERROR OCCURRED IN VERIFY TESTING\n'+ traceback.format_exc() )
+			self.assertTrue(False,'Exception occurred')
+		return
+
+	def test_writeBack(self):
+		try:
+			### MAIN ###
+			#convert tests of zip-archive into HDF5 file
+			directory = tempfile.mkdtemp()
+			self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+			fileName = os.path.join(directory, 'writeBack.hdf5')
+			with ZipFile('examples/Micromaterials/multipleIndentations.zip') as fZip, h5py.File(fileName, 'w') as fOut:
+				fOut.attrs['version'] = '2.0'
+				fOut.attrs['uri'] = 'https://github.com/micromechanics/tools/blob/main/Micromaterials2hdf.py'
+				fOut.create_group('instrument')
+				for idx, name in enumerate(fZip.namelist()[:4]):
+					data = np.loadtxt(io.TextIOWrapper(fZip.open(name), encoding='utf-8'))
+					for column, key in enumerate(['time','displacement','force']):
+						fOut.create_dataset(f'test_{idx+1}/data/{key}', data=data[:,column])
+			modulus = []
+			for nuMat in [0.3, 0.3, 0.2]:  #write, read back, parameter changed
+				i = Indentation(fileName, nuMat=nuMat, writeBack=True)
+				modulus.append([])
+				for testname in i:
+					i.analyse()
+					modulus[-1] += i.metaUser['E_GPa']
+				i.datafile.close()
+			self.assertTrue(np.allclose(modulus[0], modulus[1]), 'Modulus written back differs')
+			self.assertFalse(np.allclose(modulus[0], modulus[2]), 'Changed parameter not analysed')
+			with h5py.File(fileName, 'r') as fIn:
+				self.assertEqual(len(fIn['post_test_analysis/com_github_micromechanics/analysis']), 4, 'Tests not written')
+				self.assertNotIn('surfaceIdx', fIn['post_test_analysis/com_github_micromechanics/analysis/test_1'].attrs,
+					'Surface written but not searched')
+			#surface index that was found is written
+			i = Indentation(fileName, writeBack=True, surfaceFind={'load':0.05})
+			surfaceIdx = {}
+			for testname in i:
+				i.analyse()
+				surfaceIdx[testname] = i.surfaceIdx
+			i.datafile.close()
+			with h5py.File(fileName, 'r') as fIn:
+				branch = fIn['post_test_analysis/com_github_micromechanics/analysis']
+				self.assertEqual({key:branch[key].attrs['surfaceIdx'] for key in branch}, surfaceIdx, 'Surface differs')
+				self.assertGreater(min(surfaceIdx.values()), 0, 'Surface not found')
+			### END OF MAIN ###
+			print('\n*** DONE WITH VERIFY ***')
+		except:
+			print('ERROR OCCURRED IN VERIFY TESTING\n'+ traceback.format_exc() )
+			self.assertTrue(False,'Exception occurred')
+		return
+
+	def tearDown(self):
+		return
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,46 @@
+#!/usr/bin/python3
+import os
+import tempfile
+import traceback
+import unittest
+import numpy as np
+from micromechanics.indentation import Indentation, Synthetic
+from micromechanics.indentation.definitions import Method
+
+class TestStringMethods(unittest.TestCase):
+	def test_synthetic(self):
+		try:
+			### MAIN ###
+			with tempfile.TemporaryDirectory() as directory:
+				for method, cycles in [(Method.ISO, 1), (Method.MULTI, 5), (Method.CSM, 1)]:
+					synthetic = Synthetic(method, modulus=72., hardness=9., popIn=0.5)
+					fileName = os.path.join(directory, f'{method.name}.hdf5')
+					synthetic.writeHDF5(fileName, tests=3)
+					i = Indentation(fileName, nuMat=0.18)
+					self.assertEqual(len(i.allTestList), 3, 'Number of tests differs')
+					self.assertEqual(i.method, method, 'Method differs')
+					i.analyse()
+					if method!=Method.CSM:
+						self.assertEqual(len(i.iLHU), cycles, 'Number of load-hold-unload cycles differs')
+					self.assertTrue(np.allclose(i.modulus[-1], 72., rtol=0.02), 'Modulus differs')
+					self.assertTrue(np.allclose(i.hardness[-1], 9., rtol=0.02), 'Hardness differs')
+					i.close()
+				#reproducible and as Micromaterials zip-archive
+				synthetic = Synthetic(Method.MULTI, points=2000, driftRate=1.e-4, seed=1)
+				self.assertTrue(np.array_equal(synthetic.test(2).h, synthetic.test(2).h), 'Not reproducible')
+				fileName = os.path.join(directory, 'multi.zip')
+				synthetic.writeMicromaterials(fileName, tests=2)
+				i = Indentation(fileName, nuMat=0.18)
+				i.analyse()
+				self.assertEqual(len(i.iLHU), 5, 'Number of load-hold-unload cycles differs')
+				self.assertTrue(np.allclose(i.modulus, 72., rtol=0.05), 'Modulus differs')
+				i.close()
+			### END OF MAIN ###
+			print('\n*** DONE WITH VERIFY ***')
+		except:
+			print('ERROR OCCURRED IN VERIFY TESTING\n'+ traceback.format_exc() )
+			self.assertTrue(False,'Exception occurred')
+		return
+
+if __name__ == '__main__':
+	unittest.main()
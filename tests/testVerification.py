@@ -1,6 +1,12 @@
-import traceback
+import traceback, json, os, re, shutil, tempfile
 import unittest
+import numpy as np
+from scipy import ndimage, signal
 from micromechanics.indentation import Indentation, Tip
+from micromechanics.indentation.main import cleanMask
+from micromechanics.indentation.filters import medianFilter, BACKENDS
+from micromechanics.indentation.theory import fitUnloading
+from micromechanics.indentation.input import fischerScopeTests, fischerScopeBlock
 
 class TestStringMethods(unittest.TestCase):
 	def test_verify1(self):
@@ -49,6 +55,177 @@ class TestStringMethods(unittest.TestCase):
 		return
 
 
+	def test_inverseArea(self):
+		try:
+			# MAIN
+			hc = np.linspace(0.01, 2, 500)
+			for shape in [[2.4695e+001,3.9577e+002,-1.6132e+001,1.3341e+002,1.0646e+002,'iso'], 'perfect', [5., 60., 'sphere']]:
+				tip = Tip(shape=shape)
+				hc2 = tip.areaFunctionInverse(tip.areaFunction(hc))
+				self.assertTrue(np.allclose(hc, hc2, rtol=1.e-8), 'Inverse area function failed for '+str(shape))
+			# END OF MAIN
+			print('\n*** DONE WITH VERIFY ***')
+		except:
+			print('ERROR OCCURRED IN VERIFY TESTING\n'+ traceback.format_exc() )
+			self.assertTrue(False,'Exception occurred')
+		return
+
+
+	def test_cleanMask(self):
+		try:
+			# MAIN
+			rng = np.random.default_rng(0)
+			for _ in range(1000):
+				mask = np.repeat(rng.random(50)<0.5, rng.integers(1, 15, 50))
+				size = int(rng.integers(1, 12))
+				structure = np.ones((size,))
+				reference = ndimage.binary_opening(ndimage.binary_closing(mask, structure=structure), structure=structure)
+				self.assertTrue(np.array_equal(reference, cleanMask(mask, size)), 'Cleaning of mask differs from ndimage')
+			# END OF MAIN
+			print('\n*** DONE WITH VERIFY ***')
+		except:
+			print('ERROR OCCURRED IN VERIFY TESTING\n'+ traceback.format_exc() )
+			self.assertTrue(False,'Exception occurred')
+		return
+
+
+	def test_medianFilter(self):
+		try:
+			# MAIN
+			rng = np.random.default_rng(0)
+			for _ in range(500):
+				value = rng.integers(-3, 4, 60).astype(float)
+				if rng.random()<0.3:
+					value[rng.integers(0, 60)] = np.nan
+				for size in [3, 5, 11]:
+					for backend in BACKENDS:
+						self.assertTrue(np.array_equal(signal.medfilt(value, size), medianFilter(value, size, backend), equal_nan=True),
+						                'Median filter differs for '+backend)
+			# END OF MAIN
+			print('\n*** DONE WITH VERIFY ***')
+		except:
+			print('ERROR OCCURRED IN VERIFY TESTING\n'+ traceback.format_exc() )
+			self.assertTrue(False,'Exception occurred')
+		return
+
+
+	def test_derivedSignal(self):
+		try:
+			# MAIN
+			i = Indentation('examples/Micromaterials/multipleIndentations.zip')
+			steps = ['p', ('gradient','h'), ('abs',), ('interpolate nan',), ('median filter',5)]
+			i.setTestData(i.readTest(i.testName), identify=False)
+			rate = i.derivedSignal(*steps)
+			self.assertIs(rate, i.derivedSignal(*steps), 'Signal not reused')
+			i.setTestData(i.readTest(i.testName), identify=False)  #same test read again
+			self.assertIs(rate, i.derivedSignal(*steps), 'Signal not reused for same data')
+			i.p = i.p*2.
+			self.assertTrue(np.allclose(2*rate, i.derivedSignal(*steps)), 'Signal not updated for changed data')
+			# END OF MAIN
+			print('\n*** DONE WITH VERIFY ***')
+		except:
+			print('ERROR OCCURRED IN VERIFY TESTING\n'+ traceback.format_exc() )
+			self.assertTrue(False,'Exception occurred')
+		return
+
+
+	def test_fitUnloading(self):
+		try:
+			# MAIN
+			rng = np.random.default_rng(0)
+			prerecorded = np.array([[50., 0.2, 1.4], [120., 0.5, 1.2], [20., 0.05, 2.0]])
+			segments = []
+			for B, hf, m in prerecorded:
+				h = np.linspace(1., 0.7, 150)
+				segments.append((h, B*(h-hf)**m+rng.normal(0, 1.e-3, len(h))))
+			opts, success = fitUnloading(segments)
+			self.assertTrue(all(success), 'Fitting failed')
+			self.assertTrue(np.allclose(opts, prerecorded, rtol=1.e-2, atol=1.e-3), 'Fitted values differ '+str(opts))
+			i = Indentation('examples/Micromaterials/multipleIndentations.zip')
+			tests = [i.getTestData()]
+			i.nextTest()
+			tests.append(i.getTestData())
+			tests.append(tests[0].replace(iLHU=None))
+			results = i.stiffnessFromUnloadingAll(tests)
+			i.analyse()
+			self.assertTrue(np.allclose(results[1][0], i.slope), 'Stiffness of batched call differs')
+			self.assertIsNone(results[2], 'Test without cycles has results')
+			#least-squares optimum of the power law: prerecorded values of Hysitron example
+			i = Indentation('examples/Hysitron/RobinSteel0000LC.txt')
+			i.analyse()
+			self.assertTrue(np.allclose(i.slope, [204.195], rtol=1.e-5), 'Stiffness differs '+str(i.slope))
+			self.assertTrue(np.allclose(i.modulus, [286.849], rtol=1.e-5), 'Modulus differs '+str(i.modulus))
+			# END OF MAIN
+			print('\n*** DONE WITH VERIFY ***')
+		except:
+			print('ERROR OCCURRED IN VERIFY TESTING\n'+ traceback.format_exc() )
+			self.assertTrue(False,'Exception occurred')
+		return
+
+
+	def test_instrumentation(self):
+		try:
+			# MAIN
+			i = Indentation('examples/Micromaterials/multipleIndentations.zip', instrument=True)
+			for _ in i:
+				i.analyse()
+			stages = i.instrumentation.asDict()['stages']
+			counters = i.instrumentation.asDict()['counters']
+			self.assertEqual(stages['analyse']['calls'], len(i.allTestList), 'Calls of analyse not counted')
+			self.assertGreater(stages['stiffnessFromUnloading']['points'], 0, 'Points not counted')
+			self.assertEqual(counters['fit segments'], len(i.allTestList), 'Fitted segments not counted')
+			self.assertEqual(json.loads(i.instrumentation.toJSON())['counters'], counters, 'JSON differs')
+			self.assertIsNone(Indentation('examples/Micromaterials/multipleIndentations.zip').instrumentation,
+			                  'Instrumentation not disabled by default')
+			#points of the tests that are read, not of the current test
+			points = stages['readMicromaterialsTest']['points']
+			numberPoints = sum(len(i.readTest(testName).p) for testName in i.allTestList)
+			stages = i.instrumentation.asDict()['stages']
+			self.assertEqual(stages['readMicromaterialsTest']['points']-points, numberPoints, 'Points of read tests differ')
+			#probing vendors of txt-files is not a failure
+			i = Indentation('examples/FischerScope/FS1.txt', instrument=True)
+			self.assertEqual(i.instrumentation.asDict()['counters'], {}, 'Probing of vendors counted as failure')
+			i = Indentation('examples/Agilent/ISO.txt', instrument=True)
+			self.assertEqual(i.instrumentation.asDict()['counters'], {'loading failed':1}, 'Failed loading not counted')
+			# END OF MAIN
+			print('\n*** DONE WITH VERIFY ***')
+		except:
+			print('ERROR OCCURRED IN VERIFY TESTING\n'+ traceback.format_exc() )
+			self.assertTrue(False,'Exception occurred')
+		return
+
+
+	def test_fischerScopeMeta(self):
+		try:
+			# MAIN
+			#meta lines after the numeric block: move those of all tests of the example behind their data
+			with open('examples/FischerScope/FS1.txt', encoding='iso-8859-1') as fIn:
+				lines = fIn.read().split('\n')
+			text = '\n'.join(lines[6:])
+			identifier = lines[0].split()[0]
+			reordered = ''
+			for match, (_, metaLines, block) in zip(re.finditer(re.escape(identifier)+'   .*\n', text),
+			                                       fischerScopeTests(text, identifier)):
+				reordered += match.group(0)+block+'\n'.join(metaLines)
+			directory = tempfile.mkdtemp()
+			fileName = os.path.join(directory, 'metaAfterData.txt')
+			with open(fileName, 'w', encoding='iso-8859-1') as fOut:
+				fOut.write('\n'.join(lines[:6])+'\n'+reordered)
+			original = Indentation('examples/FischerScope/FS1.txt')
+			moved = Indentation(fileName)
+			shutil.rmtree(directory)
+			self.assertEqual(moved.metaVendor, original.metaVendor, 'Meta data after numeric block not read')
+			self.assertTrue(np.array_equal(moved.h, original.h), 'Data differs')
+			#block without new line
+			self.assertEqual(fischerScopeBlock('1,5\t2\t3').tolist(), [[1.5, 2., 3.]], 'Single line not converted')
+			# END OF MAIN
+			print('\n*** DONE WITH VERIFY ***')
+		except:
+			print('ERROR OCCURRED IN VERIFY TESTING\n'+ traceback.format_exc() )
+			self.assertTrue(False,'Exception occurred')
+		return
+
+
 	def tearDown(self):
 		return
 